@@ -2,12 +2,14 @@ from flask import Flask, render_template, redirect, url_for, flash
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager, current_user
 from config import Config
+from modules.database import RoutingSession
 import os
+import threading
 from datetime import datetime
 
 
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message_category = 'info'
@@ -22,34 +24,60 @@ def create_app(config_class=Config):
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
     
-    # Initialize extensions
-    db.init_app(app)
+    # Compiled template cache and cached navigation, before anything renders
+    from modules.templating import init_templating
+    init_templating(app)
+    
+    # Compressed responses and fingerprinted, precompressed static files
+    from modules.assets import init_assets
+    init_assets(app)
+    
+    # Initialize extensions (engine tuned per DATABASE_PROFILE)
+    from modules.database import init_database
+    init_database(app)
     login_manager.init_app(app)
     
     # Import models
     from modules.models import User
+    from modules.principal import load_principal
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        # Cached read-only snapshot, see modules/principal.py
+        return load_principal(int(user_id))
     
-    # Register blueprints
-    from modules.auth import auth_bp
-    from modules.pos import pos_bp
-    from modules.inventory import inventory_bp
-    from modules.repair import repair_bp
-    from modules.employee import employee_bp
+    # Schema is managed at deploy time: flask db upgrade, flask bootstrap-admin
+    from modules.migrations import db_cli, bootstrap_admin_command, init_schema_check
+    app.cli.add_command(db_cli)
+    app.cli.add_command(bootstrap_admin_command)
+    init_schema_check(app)
     
-    app.register_blueprint(auth_bp, url_prefix='/auth')
-    app.register_blueprint(pos_bp, url_prefix='/pos')
-    app.register_blueprint(inventory_bp, url_prefix='/inventory')
-    app.register_blueprint(repair_bp, url_prefix='/repair')
-    app.register_blueprint(employee_bp, url_prefix='/employee')
+    # Turnaround samples are folded into sketches from cron: flask fold-sla-samples
+    from modules.analytics import fold_samples_command
+    app.cli.add_command(fold_samples_command)
+    
+    # Register blueprints; web workers may defer the imports to their first
+    # request, the flask CLI always needs them for the blueprint commands
+    if app.config.get('LAZY_BLUEPRINTS') and not os.environ.get('FLASK_RUN_FROM_CLI'):
+        app.wsgi_app = RegisterOnFirstRequest(app, app.wsgi_app)
+    else:
+        register_blueprints(app)
 
 #########
     @app.context_processor
     def inject_now():
         return {'now': datetime.utcnow()}
+
+    @app.template_filter('time_ago')
+    def time_ago(value):
+        if not value:
+            return ''
+        seconds = int((datetime.utcnow() - value).total_seconds())
+        for unit, size in (('day', 86400), ('hour', 3600), ('minute', 60)):
+            if seconds >= size:
+                count = seconds // size
+                return f"{count} {unit}{'s' if count != 1 else ''} ago"
+        return 'just now'
 #########
 
     @app.route('/')
@@ -73,22 +101,40 @@ def create_app(config_class=Config):
     def internal_server_error(e):
         return render_template('500.html'), 500
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
-        
-        # Create default admin user if not exists
-        from modules.models import User
-        admin = User.query.filter_by(username='admin').first()
-        if not admin:
-            admin = User(
-                username='admin',
-                email='admin@mobileshop.com',
-                role='admin',
-                is_active=True
-            )
-            admin.set_password('admin123')
-            db.session.add(admin)
-            db.session.commit()
-    
-    return app
\ No newline at end of file
+    return app
+
+
+def register_blueprints(app):
+    from modules.auth import auth_bp
+    from modules.pos import pos_bp
+    from modules.inventory import inventory_bp
+    from modules.repair import repair_bp
+    from modules.employee import employee_bp
+    
+    app.register_blueprint(auth_bp, url_prefix='/auth')
+    app.register_blueprint(pos_bp, url_prefix='/pos')
+    app.register_blueprint(inventory_bp, url_prefix='/inventory')
+    app.register_blueprint(repair_bp, url_prefix='/repair')
+    app.register_blueprint(employee_bp, url_prefix='/employee')
+    
+    # Request/SQL/template metrics, only hooked up when METRICS_ENABLED
+    from modules.metrics import init_metrics
+    init_metrics(app)
+
+
+class RegisterOnFirstRequest:
+    """WSGI wrapper that registers the blueprints just before the first request"""
+    
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self.lock = threading.Lock()
+        self.registered = False
+    
+    def __call__(self, environ, start_response):
+        if not self.registered:
+            with self.lock:
+                if not self.registered:
+                    register_blueprints(self.app)
+                    self.registered = True
+        return self.wsgi_app(environ, start_response)
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""Shared helpers for the benchmark scripts"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+
+def make_app(database_url=None, workdir=None, **settings):
+    """App bound to a scratch database (or database_url), with CSRF off.
+
+    Pending migrations are applied and the admin/admin123 account is created
+    if missing. DATABASE_URL is read when config is imported, so this must
+    run before anything imports the app.
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix='bench-')
+    os.environ['DATABASE_URL'] = database_url or 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    if ROOT not in sys.path:
+        sys.path.insert(0, ROOT)
+
+    from app import create_app
+    from config import Config
+
+    overrides = dict(WTF_CSRF_ENABLED=False, UPLOAD_FOLDER=os.path.join(workdir, 'uploads'),
+                     SQLALCHEMY_DATABASE_URI=os.environ['DATABASE_URL'], **settings)
+    app = create_app(type('BenchmarkConfig', (Config,), overrides))
+
+    from modules.migrations import bootstrap_admin, upgrade
+    from modules.models import User
+    with app.app_context():
+        upgrade()
+        if not User.query.filter_by(username='admin').first():
+            bootstrap_admin('admin', 'admin@mobileshop.com', 'admin123')
+    return app
+
+
+def login(app, username='admin', password='admin123'):
+    client = app.test_client()
+    response = client.post('/auth/login', data={'username': username, 'password': password})
+    if response.status_code != 302:
+        raise RuntimeError(f'Login as {username} failed ({response.status_code})')
+    return client
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(q * len(values)), len(values) - 1)]
@@ -0,0 +1,265 @@
+"""Seeded synthetic data for benchmarks.
+
+Fills an empty database with a consistent shop: categories, suppliers,
+products, stock items (IMEIs for phones), customers, invoices with their
+items and payments, repair jobs, staff and attendance. The same --seed
+always produces the same data, so benchmark runs are comparable.
+
+    python -m benchmarks.datagen --scale small --database sqlite:///bench.db
+    python -m benchmarks.datagen --scale large --stock-items 5000000 --database postgresql://...
+
+Rows are written with chunked Core INSERTs and committed per chunk, so even
+the large scale runs in bounded memory (apart from the list of sold units).
+"""
+import argparse
+import random
+import time
+from datetime import date, datetime, time as dt_time, timedelta
+
+SCALES = {
+    'tiny': dict(products=200, stock_items=4000, customers=300, invoices=800, repair_jobs=200,
+                 employees=8, attendance_days=30),
+    'small': dict(products=2000, stock_items=50000, customers=5000, invoices=10000, repair_jobs=2000,
+                  employees=20, attendance_days=90),
+    'medium': dict(products=20000, stock_items=500000, customers=50000, invoices=100000, repair_jobs=20000,
+                   employees=50, attendance_days=180),
+    'large': dict(products=100000, stock_items=5000000, customers=200000, invoices=1000000, repair_jobs=200000,
+                  employees=100, attendance_days=365)
+}
+
+CHUNK_SIZE = 5000
+PASSWORD = 'password'
+BRANDS = ['Apple', 'Samsung', 'Xiaomi', 'Oppo', 'Vivo', 'Huawei', 'Nokia', 'Realme']
+CATEGORIES = [('Phones', False), ('Tablets', False), ('Accessories', False), ('Chargers', False),
+              ('Screens', True), ('Batteries', True), ('Back Covers', True), ('Cameras', True)]
+REPAIR_STATUSES = ['received', 'diagnostic', 'repairing', 'waiting_parts', 'completed', 'delivered',
+                   'delivered', 'delivered']
+PAYMENT_METHODS = ['cash', 'cash', 'card', 'online', 'due']
+
+
+def _insert(model, rows):
+    from app import db
+    if rows:
+        db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+
+
+def _batched(rows):
+    """Yield lists of CHUNK_SIZE rows from a generator"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= CHUNK_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def generate(app, seed=42, **counts):
+    """Populate the app's database; returns the row counts written"""
+    from app import db
+    from modules.models import (Attendance, Customer, Invoice, InvoiceItem, Payment, Product, ProductCategory,
+                                RepairJob, StockItem, Supplier, User)
+    from modules.passwords import hash_password
+    from modules.stock import sync_stock_counters
+
+    rng = random.Random(seed)
+    today = date.today()
+    days = counts['attendance_days']  # invoices, repairs and attendance span this many days
+    now = datetime.combine(today, dt_time(18, 0))
+
+    def moment(max_days):
+        return now - timedelta(days=rng.randrange(max_days), minutes=rng.randrange(9 * 60))
+
+    with app.app_context():
+        if db.session.query(Product.id).first() is not None:
+            raise RuntimeError('Database already has products; generate into an empty database')
+
+        # Staff: managers, technicians and sales staff share one cheap password hash
+        password_hash = hash_password(PASSWORD)
+        base_id = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+        employees = []
+        for n in range(counts['employees']):
+            role = 'manager' if n < 2 else 'technician' if n % 3 == 0 else 'staff'
+            employees.append({'id': base_id + n, 'username': f'{role}{n}', 'email': f'{role}{n}@example.com',
+                              'password_hash': password_hash, 'role': role, 'is_active': True,
+                              'created_at': now})
+        _insert(User, employees)
+        staff_ids = [e['id'] for e in employees if e['role'] != 'technician']
+        technician_ids = [e['id'] for e in employees if e['role'] == 'technician'] or staff_ids
+
+        _insert(ProductCategory, [{'id': n + 1, 'name': name, 'description': None, 'is_repair_part': part}
+                                  for n, (name, part) in enumerate(CATEGORIES)])
+        supplier_count = max(counts['products'] // 200, 5)
+        _insert(Supplier, [{'id': n + 1, 'name': f'Supplier {n + 1}', 'contact_person': None,
+                            'phone': f'011{n:07d}', 'email': None, 'address': None, 'gst_number': None,
+                            'created_at': now} for n in range(supplier_count)])
+
+        # Products: ids 1..N, phones and tablets carry IMEIs
+        products = []
+        for batch in _batched(_product_rows(rng, counts['products'], now)):
+            products.extend((row['id'], row['selling_price'], row['has_imei'], row['warranty_period'])
+                            for row in batch)
+            _insert(Product, batch)
+
+        # Stock: enough units are sold to fill the invoices (1-3 per invoice)
+        sold_ratio = min(0.9, counts['invoices'] * 2.0 / max(counts['stock_items'], 1))
+        sold = []
+        for batch in _batched(_stock_rows(rng, counts['stock_items'], products, supplier_count, sold_ratio,
+                                          sold, now)):
+            _insert(StockItem, batch)
+
+        _insert(Customer, [{'id': n + 1, 'name': f'Customer {n + 1}', 'phone': f'07{n:08d}', 'email': None,
+                            'address': None, 'created_at': now} for n in range(counts['customers'])])
+
+        # Invoices take the sold units in order, dated across the period
+        rng.shuffle(sold)
+        invoices, items, payments = [], [], []
+        position = invoice_count = 0
+        for invoice_id in range(1, counts['invoices'] + 1):
+            lines = sold[position:position + rng.randint(1, 3)]
+            position += len(lines)
+            if not lines:
+                break
+            invoice_count += 1
+            when = moment(days)
+            subtotal = sum(price for _, _, price, _ in lines)
+            tax = round(subtotal * 0.15, 2)
+            method = rng.choice(PAYMENT_METHODS)
+            staff = rng.choice(staff_ids)
+            invoices.append({
+                'id': invoice_id, 'invoice_number': f'INV-{when:%Y%m%d}-{invoice_id:07d}',
+                'customer_id': rng.randint(1, counts['customers']) if rng.random() < 0.6 else None,
+                'customer_name': 'Walk-in Customer', 'customer_phone': '', 'date': when,
+                'subtotal': subtotal, 'discount': 0.0, 'tax': tax, 'total': subtotal + tax,
+                'payment_status': 'pending' if method == 'due' else 'paid', 'payment_method': method,
+                'notes': None, 'repair_job_id': None, 'created_by': staff, 'updated_at': when
+            })
+            items.extend({
+                'invoice_id': invoice_id, 'product_id': product_id, 'stock_item_id': stock_item_id,
+                'quantity': 1, 'unit_price': price, 'discount': 0.0, 'total': price,
+                'warranty_period': warranty or None,
+                'warranty_expires_at': when + timedelta(days=30 * warranty) if warranty else None
+            } for stock_item_id, product_id, price, warranty in lines)
+            if method != 'due':
+                payments.append({'invoice_id': invoice_id, 'amount': subtotal + tax, 'payment_method': method,
+                                 'reference_number': None, 'payment_date': when, 'notes': None,
+                                 'received_by': staff})
+
+            if len(items) >= CHUNK_SIZE:
+                _insert(Invoice, invoices)
+                _insert(InvoiceItem, items)
+                _insert(Payment, payments)
+                invoices, items, payments = [], [], []
+        _insert(Invoice, invoices)
+        _insert(InvoiceItem, items)
+        _insert(Payment, payments)
+
+        for batch in _batched(_repair_rows(rng, counts['repair_jobs'], counts['customers'], technician_ids,
+                                           staff_ids, days, moment)):
+            _insert(RepairJob, batch)
+
+        for batch in _batched(_attendance_rows(rng, [e['id'] for e in employees], today, days)):
+            _insert(Attendance, batch)
+
+        sync_stock_counters()
+        db.session.commit()
+
+    return dict(counts, invoices=invoice_count, sold_units=position)
+
+
+def _product_rows(rng, count, now):
+    for n in range(count):
+        category_id = rng.randrange(len(CATEGORIES)) + 1
+        cost = round(rng.uniform(5, 900), 2)
+        yield {
+            'id': n + 1, 'sku': f'SKU{n + 1:07d}', 'name': f'{rng.choice(BRANDS)} Item {n + 1}',
+            'category_id': category_id, 'description': None, 'purchase_price': cost,
+            'selling_price': round(cost * 1.3, 2), 'wholesale_price': round(cost * 1.15, 2), 'min_stock_level': 5,
+            'has_imei': category_id <= 2, 'warranty_period': 12 if category_id <= 2 else 0, 'is_active': True,
+            'available_stock': 0, 'version': 1, 'created_at': now
+        }
+
+
+def _stock_rows(rng, count, products, supplier_count, sold_ratio, sold, now):
+    for n in range(count):
+        product_id, price, has_imei, warranty = products[rng.randrange(len(products))]
+        status = 'sold' if rng.random() < sold_ratio else 'available'
+        if status == 'sold':
+            sold.append((n + 1, product_id, price, warranty))
+        yield {
+            'id': n + 1, 'product_id': product_id, 'imei': f'35{n + 1:013d}' if has_imei else None,
+            'serial_number': None, 'batch_number': None, 'stock_type': 'in', 'quantity': 1,
+            'supplier_id': rng.randint(1, supplier_count), 'purchase_order_id': None,
+            'purchase_price': round(price / 1.3, 2), 'selling_price': price, 'location': f'Shelf {n % 40 + 1}',
+            'status': status, 'notes': None, 'version': 1, 'created_at': now - timedelta(days=rng.randrange(400))
+        }
+
+
+def _repair_rows(rng, count, customers, technician_ids, staff_ids, days, moment):
+    for n in range(count):
+        created = moment(days)
+        status = rng.choice(REPAIR_STATUSES)
+        finished = status in ('completed', 'delivered')
+        cost = round(rng.uniform(20, 400), 2)
+        completed = created + timedelta(hours=rng.randint(2, 96)) if finished else None
+        yield {
+            'id': n + 1, 'job_number': f'JOB-{created:%Y%m%d}-{n + 1:07d}',
+            'customer_id': rng.randint(1, customers), 'device_type': 'mobile', 'brand': rng.choice(BRANDS),
+            'model': f'Model {rng.randint(1, 40)}', 'imei': f'86{n + 1:013d}', 'serial_number': None,
+            'issue_description': 'Synthetic repair', 'accessories_received': None,
+            'estimated_cost': cost, 'final_cost': cost if finished else 0.0,
+            'status': status, 'technician_id': rng.choice(technician_ids) if status != 'received' else None,
+            'diagnosis_details': None, 'repair_details': None, 'warranty_period': 3 if finished else 0,
+            'warranty_expires_at': completed + timedelta(days=90) if finished else None,
+            'customer_approval': finished, 'approval_date': None, 'completed_date': completed,
+            'delivered_date': completed + timedelta(days=rng.randint(0, 5)) if status == 'delivered' else None,
+            'status_changed_at': completed or created, 'created_at': created,
+            'created_by': rng.choice(staff_ids), 'updated_at': completed or created
+        }
+
+
+def _attendance_rows(rng, employee_ids, today, days):
+    for offset in range(days, 0, -1):
+        day = today - timedelta(days=offset)
+        for employee_id in employee_ids:
+            roll = rng.random()
+            if roll < 0.04:
+                yield {'employee_id': employee_id, 'date': day, 'check_in': None, 'check_out': None,
+                       'total_hours': 0.0, 'status': 'absent', 'notes': None}
+            elif roll < 0.08:
+                yield {'employee_id': employee_id, 'date': day, 'check_in': None, 'check_out': None,
+                       'total_hours': 0.0, 'status': 'leave', 'notes': None}
+            else:
+                check_in = datetime.combine(day, dt_time(8, rng.randrange(60)))
+                hours = rng.uniform(7, 10)
+                yield {'employee_id': employee_id, 'date': day, 'check_in': check_in,
+                       'check_out': check_in + timedelta(hours=hours), 'total_hours': round(hours, 2),
+                       'status': 'present', 'notes': None}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--database', help='database URL (default: a scratch SQLite file)')
+    parser.add_argument('--seed', type=int, default=42)
+    for name in SCALES['small']:
+        parser.add_argument('--' + name.replace('_', '-'), type=int, help=f'override {name}')
+    args = parser.parse_args(argv)
+
+    from benchmarks.common import make_app
+    app = make_app(args.database)
+
+    counts = dict(SCALES[args.scale])
+    counts.update({name: getattr(args, name) for name in counts if getattr(args, name) is not None})
+
+    started = time.perf_counter()
+    written = generate(app, seed=args.seed, **counts)
+    print(f"Generated into {app.config['SQLALCHEMY_DATABASE_URI']} in {time.perf_counter() - started:.1f}s")
+    for name, value in written.items():
+        print(f'  {name:16} {value}')
+
+
+if __name__ == '__main__':
+    main()
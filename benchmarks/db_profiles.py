@@ -0,0 +1,48 @@
+"""Concurrent checkout throughput under each database profile.
+
+Builds an identical scratch SQLite database per DATABASE_PROFILE and runs
+the same till-heavy workload from benchmarks.load against each, so the
+effect of WAL, the pragmas and the busy timeout shows up as checkouts per
+second, checkout tail latency and "database is locked" errors:
+
+    python -m benchmarks.db_profiles --duration 20 --mode process
+"""
+import argparse
+import os
+import tempfile
+
+from benchmarks.common import make_app
+from benchmarks.load import add_workload_arguments, report, run
+
+
+def main(argv=None):
+    from benchmarks.datagen import SCALES, generate
+    from modules.database import SQLITE_PRAGMAS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='tiny')
+    parser.add_argument('--profiles', nargs='+', choices=list(SQLITE_PRAGMAS), default=['baseline', 'production'])
+    add_workload_arguments(parser)
+    parser.set_defaults(technicians=0, managers=2, hot_products=50)
+    args = parser.parse_args(argv)
+
+    summaries = {}
+    for profile in args.profiles:
+        print(f'\n== {profile} ==')
+        workdir = tempfile.mkdtemp(prefix=f'profile-{profile}-')
+        database_url = 'sqlite:///' + os.path.join(workdir, 'profile.db')
+        app = make_app(database_url, workdir, DATABASE_PROFILE=profile)
+        generate(app, seed=args.seed, **SCALES[args.scale])
+        summaries[profile] = run(app, database_url, workdir, args, DATABASE_PROFILE=profile)
+        report(summaries[profile])
+
+    print(f"\n{'profile':12} {'checkouts/s':>12} {'req/s':>8} {'checkout p50':>13} {'checkout p95':>13} {'locked':>7}")
+    for profile, summary in summaries.items():
+        checkout = summary['operations'].get('checkout', {'p50_ms': 0.0, 'p95_ms': 0.0})
+        print(f"{profile:12} {summary['checkouts_per_s']:>12.2f} {summary['throughput_rps']:>8.1f} "
+              f"{checkout['p50_ms']:>11.1f}ms {checkout['p95_ms']:>11.1f}ms "
+              f"{summary['errors'].get('database_locked', 0):>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,361 @@
+"""Multi-terminal load harness.
+
+Replays a mixed shop-floor workload against the WSGI app: tills scanning,
+editing carts and checking out, technicians working the repair board, and
+managers watching dashboards, all at once. Terminals run as threads sharing
+one app (--mode thread) or as separate processes each with its own app and
+connection pool against the same database (--mode process), which is how
+multi-worker deployments behave.
+
+    python -m benchmarks.load --scale small --tills 8 --technicians 3 --managers 1 --duration 30
+    python -m benchmarks.load --database sqlite:////tmp/shop.db --mode process
+
+Tills favour a few low-stock "hot" products so they race for the last
+units. Afterwards the database is checked for oversold stock units, counter
+drift and duplicate invoice numbers; the exit status is 1 when any are found.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+from benchmarks.common import login, make_app, percentile
+
+
+def classify(error):
+    """Bucket an exception raised inside a view"""
+    text = str(error).lower()
+    if 'database is locked' in text or 'database table is locked' in text:
+        return 'database_locked'
+    if 'deadlock' in text or 'lock wait timeout' in text or 'could not serialize' in text:
+        return 'lock_conflict'
+    if 'unique' in text or 'duplicate' in text:
+        return 'duplicate_number' if 'invoice_number' in text else 'integrity'
+    if 'timeout' in text and 'queuepool' in text:
+        return 'pool_exhausted'
+    return type(error).__name__
+
+
+class Terminal:
+    """One till, technician or manager session"""
+
+    def __init__(self, app, spec):
+        self.app = app
+        self.spec = spec
+        self.rng = random.Random(spec['seed'])
+        self.client = login(app, spec['username'], spec['password'])
+        self.samples = []
+        self.errors = Counter()
+        self.rejected = Counter()
+
+    def call(self, op, method, url, **kwargs):
+        _local.error = None
+        began = time.perf_counter()
+        response = self.client.open(url, method=method, **kwargs)
+        elapsed = time.perf_counter() - began
+        self.samples.append((op, elapsed, response.status_code))
+
+        if _local.error is not None:
+            self.errors[classify(_local.error)] += 1
+        elif response.status_code >= 500:
+            self.errors[f'http_{response.status_code}'] += 1
+        elif _json(response).get('success') is False:
+            self.rejected[op] += 1
+        return response
+
+    def run(self, deadline):
+        step = getattr(self, self.spec['role'])
+        while time.monotonic() < deadline:
+            step()
+            if self.spec['think']:
+                time.sleep(self.rng.uniform(0, 2 * self.spec['think']))
+
+    def till(self):
+        self.call('clear_cart', 'POST', '/pos/clear-cart')
+        lines = []
+        for _ in range(self.rng.randint(1, 3)):
+            hot = self.rng.random() < 0.7
+            sku = self.rng.choice(self.spec['hot_skus'] if hot else self.spec['skus'])
+            scanned = _json(self.call('scan_product', 'POST', '/pos/scan-product', json={'barcode': sku}))
+            if not scanned.get('success'):
+                continue
+            product_id = scanned['product']['id']
+            if _json(self.call('add_to_cart', 'POST', '/pos/add-to-cart',
+                               json={'product_id': product_id, 'quantity': 1})).get('success'):
+                lines.append(product_id)
+
+        if lines and self.rng.random() < 0.3:
+            self.call('update_cart', 'POST', '/pos/update-cart',
+                      json={'product_id': self.rng.choice(lines), 'quantity': 2})
+        if lines:
+            self.call('checkout', 'POST', '/pos/checkout', json={'payment_method': 'cash'})
+
+    def technician(self):
+        roll = self.rng.random()
+        if roll < 0.5:
+            self.call('repair_board', 'GET', '/repair/board')
+        elif roll < 0.8:
+            term = self.rng.choice(('screen', 'battery', 'case', 'charger'))
+            self.call('parts_search', 'GET', f'/repair/parts-search?q={term}')
+        elif self.spec['jobs']:
+            job_id = self.rng.choice(self.spec['jobs'])
+            status = self.rng.choice(('diagnostic', 'repairing', 'waiting_parts'))
+            self.call('update_status', 'POST', f'/repair/update-status/{job_id}', data={'status': status})
+
+    def manager(self):
+        op, url = self.rng.choice((
+            ('inventory_dashboard', '/inventory/'),
+            ('pos_dashboard', '/pos/dashboard'),
+            ('daily_sales', '/pos/daily-sales')
+        ))
+        self.call(op, 'GET', url)
+
+    def result(self):
+        return {'samples': self.samples, 'errors': dict(self.errors), 'rejected': dict(self.rejected)}
+
+
+_local = threading.local()
+
+
+def _json(response):
+    return (response.get_json(silent=True) or {}) if response.is_json else {}
+
+
+def _remember_error(sender, exception, **extra):
+    _local.error = exception
+
+
+def _prepare(app):
+    from flask import got_request_exception
+
+    app.logger.disabled = True  # errors are counted instead of printing tracebacks
+    got_request_exception.connect(_remember_error, app)
+
+
+def _run_terminal(app, spec, start_at, duration, results):
+    terminal = Terminal(app, spec)
+    while time.time() < start_at:
+        time.sleep(0.001)
+    terminal.run(time.monotonic() + duration)
+    results.append(terminal.result())
+
+
+def _process_main(database_url, workdir, settings, spec, start_at, duration):
+    app = make_app(database_url, workdir, **settings)
+    _prepare(app)
+    results = []
+    _run_terminal(app, spec, start_at, duration, results)
+    return results[0]
+
+
+def plan(app, args):
+    """Terminal specs plus the invoice watermark for the anomaly checks"""
+    from app import db
+    from benchmarks.datagen import PASSWORD
+    from modules.models import Invoice, Product, RepairJob, User
+
+    rng = random.Random(args.seed)
+    with app.app_context():
+        by_role = defaultdict(list)
+        for username, role in db.session.query(User.username, User.role).filter(User.is_active.is_(True)):
+            by_role[role].append(username)
+
+        hot_skus = [sku for (sku,) in db.session.query(Product.sku).filter(
+            Product.is_active.is_(True), Product.available_stock > 0
+        ).order_by(Product.available_stock, Product.id).limit(args.hot_products)]
+        skus = [sku for (sku,) in db.session.query(Product.sku).filter(
+            Product.is_active.is_(True), Product.available_stock > 0
+        ).limit(1000)]
+        jobs = [job_id for (job_id,) in db.session.query(RepairJob.id).filter(
+            RepairJob.status.in_(('diagnostic', 'repairing', 'waiting_parts'))
+        ).limit(500)]
+        watermark = db.session.query(db.func.max(Invoice.id)).scalar() or 0
+
+    def account(user_role, n):
+        # Generated staff share PASSWORD; fall back to the seeded admin
+        users = by_role.get(user_role)
+        if users:
+            return users[n % len(users)], PASSWORD
+        return 'admin', 'admin123'
+
+    specs = []
+    for role, count, user_role in (('till', args.tills, 'staff'), ('technician', args.technicians, 'technician'),
+                                   ('manager', args.managers, 'manager')):
+        for n in range(count):
+            username, password = account(user_role, n)
+            specs.append({'role': role, 'username': username, 'password': password,
+                          'seed': rng.randrange(2 ** 32), 'think': args.think,
+                          'hot_skus': hot_skus, 'skus': skus, 'jobs': jobs})
+    return specs, watermark
+
+
+def check_anomalies(app, watermark):
+    """Look for damage the run did to the data"""
+    from app import db
+    from modules.models import Invoice, InvoiceItem, Product, StockItem
+
+    with app.app_context():
+        run_items = db.session.query(InvoiceItem.stock_item_id).filter(
+            InvoiceItem.invoice_id > watermark, InvoiceItem.stock_item_id.isnot(None)
+        )
+        oversold = db.session.query(InvoiceItem.stock_item_id).filter(
+            InvoiceItem.stock_item_id.in_(run_items)
+        ).group_by(InvoiceItem.stock_item_id).having(db.func.count() > 1).count()
+        not_marked_sold = db.session.query(StockItem.id).filter(
+            StockItem.id.in_(run_items), StockItem.status != 'sold'
+        ).count()
+
+        actual = db.select(db.func.count(StockItem.id)).where(
+            StockItem.product_id == Product.id, StockItem.status == 'available'
+        ).scalar_subquery()
+        counter_drift = db.session.query(Product.id).filter(Product.available_stock != actual).count()
+        negative_stock = db.session.query(Product.id).filter(Product.available_stock < 0).count()
+
+        duplicate_numbers = db.session.query(Invoice.invoice_number).group_by(
+            Invoice.invoice_number
+        ).having(db.func.count() > 1).count()
+        invoices = db.session.query(Invoice.id).filter(Invoice.id > watermark).count()
+
+    return {
+        'oversold_units': oversold,
+        'sold_units_not_marked_sold': not_marked_sold,
+        'stock_counter_drift': counter_drift,
+        'negative_stock': negative_stock,
+        'duplicate_invoice_numbers': duplicate_numbers
+    }, invoices
+
+
+def summarize(results, elapsed, anomalies, invoices):
+    by_op = defaultdict(list)
+    statuses = Counter()
+    errors = Counter()
+    rejected = Counter()
+    for result in results:
+        for op, seconds, status in result['samples']:
+            by_op[op].append(seconds)
+            statuses[status] += 1
+        errors.update(result['errors'])
+        rejected.update(result['rejected'])
+
+    total = sum(len(timings) for timings in by_op.values())
+    return {
+        'elapsed_s': elapsed,
+        'requests': total,
+        'throughput_rps': total / elapsed if elapsed else 0.0,
+        'checkouts_per_s': invoices / elapsed if elapsed else 0.0,
+        'invoices': invoices,
+        'operations': {op: {
+            'count': len(timings),
+            'p50_ms': statistics.median(timings) * 1000,
+            'p95_ms': percentile(timings, 0.95) * 1000,
+            'p99_ms': percentile(timings, 0.99) * 1000,
+            'max_ms': max(timings) * 1000,
+            'rejected': rejected.get(op, 0)
+        } for op, timings in sorted(by_op.items())},
+        'statuses': {str(code): n for code, n in sorted(statuses.items())},
+        'errors': dict(errors),
+        'anomalies': anomalies
+    }
+
+
+def report(summary):
+    print(f"\n{summary['requests']} requests in {summary['elapsed_s']:.1f}s: "
+          f"{summary['throughput_rps']:.1f} req/s, {summary['checkouts_per_s']:.2f} checkouts/s "
+          f"({summary['invoices']} invoices)\n")
+    print(f"{'operation':22} {'count':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9} {'rejected':>9}")
+    for op, row in summary['operations'].items():
+        print(f"{op:22} {row['count']:>7} {row['p50_ms']:>7.1f}ms {row['p95_ms']:>7.1f}ms "
+              f"{row['p99_ms']:>7.1f}ms {row['max_ms']:>7.1f}ms {row['rejected']:>9}")
+
+    print(f"\nstatuses: {summary['statuses']}")
+    print(f"errors:   {summary['errors'] or 'none'}")
+    found = {name: n for name, n in summary['anomalies'].items() if n}
+    print(f"anomalies: {found or 'none'}")
+    return found
+
+
+def run(app, database_url, workdir, args, **settings):
+    """Drive the terminals described by args against app; returns the summary.
+
+    Process-mode workers rebuild the app from database_url and settings.
+    """
+    _prepare(app)
+    specs, watermark = plan(app, args)
+    print(f"{len(specs)} terminals ({args.tills} tills, {args.technicians} technicians, "
+          f"{args.managers} managers) as {args.mode}s for {args.duration:.0f}s")
+
+    start_at = time.time() + 1.0
+    if args.mode == 'thread':
+        results = []
+        threads = [threading.Thread(target=_run_terminal, args=(app, spec, start_at, args.duration, results))
+                   for spec in specs]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    else:
+        # Spawned workers build their own app and pool, and need time to import
+        start_at += 2.0 + 0.2 * len(specs)
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(len(specs)) as pool:
+            results = pool.starmap(_process_main, [(database_url, workdir, settings, spec, start_at, args.duration)
+                                                   for spec in specs])
+
+    anomalies, invoices = check_anomalies(app, watermark)
+    summary = summarize(results, args.duration, anomalies, invoices)
+    summary['config'] = {name: getattr(args, name) for name in
+                         ('mode', 'tills', 'technicians', 'managers', 'duration', 'think', 'hot_products')}
+    summary['config'].update(database=database_url.split('://')[0], profile=app.config['DATABASE_PROFILE'])
+    return summary
+
+
+def add_workload_arguments(parser):
+    parser.add_argument('--mode', choices=('thread', 'process'), default='thread')
+    parser.add_argument('--tills', type=int, default=8)
+    parser.add_argument('--technicians', type=int, default=3)
+    parser.add_argument('--managers', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run')
+    parser.add_argument('--think', type=float, default=0.0, help='mean pause between actions, seconds')
+    parser.add_argument('--hot-products', type=int, default=5,
+                        help='low-stock products the tills compete for')
+    parser.add_argument('--seed', type=int, default=42)
+
+
+def main(argv=None):
+    from benchmarks.datagen import SCALES, generate
+    from modules.database import SQLITE_PRAGMAS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='tiny')
+    parser.add_argument('--database', help='use an already generated database instead of a scratch one')
+    parser.add_argument('--profile', choices=list(SQLITE_PRAGMAS), help='DATABASE_PROFILE to run under')
+    add_workload_arguments(parser)
+    parser.add_argument('--output', help='write the summary as JSON')
+    args = parser.parse_args(argv)
+
+    settings = {'DATABASE_PROFILE': args.profile} if args.profile else {}
+    workdir = tempfile.mkdtemp(prefix='load-')
+    database_url = args.database or 'sqlite:///' + os.path.join(workdir, 'load.db')
+    app = make_app(database_url, workdir, **settings)
+    if not args.database:
+        generate(app, seed=args.seed, **SCALES[args.scale])
+
+    summary = run(app, database_url, workdir, args, **settings)
+    exit_code = 1 if report(summary) else 0
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f'Summary written to {args.output}')
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
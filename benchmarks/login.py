@@ -0,0 +1,86 @@
+"""Login burst benchmark.
+
+Simulates a shift change: --users staff sign in at the same moment while a
+probe thread keeps requesting a cheap page, standing in for a POS terminal.
+Reports login latency, probe latency during the burst and how many logins
+were asked to retry. Compare hash settings with --method and --workers:
+
+    python -m benchmarks.login --users 12 --method scrypt:32768:8:1 --workers 2
+    python -m benchmarks.login --users 12 --method pbkdf2:sha256:600000 --workers 4
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from benchmarks.common import make_app, percentile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=12)
+    parser.add_argument('--method', default=None, help='PASSWORD_HASH_METHOD to test')
+    parser.add_argument('--workers', type=int, default=None, help='PASSWORD_VERIFY_WORKERS')
+    args = parser.parse_args(argv)
+
+    settings = {}
+    if args.method:
+        settings['PASSWORD_HASH_METHOD'] = args.method
+    if args.workers:
+        settings['PASSWORD_VERIFY_WORKERS'] = args.workers
+    app = make_app(**settings)
+
+    from app import db
+    from modules.models import User
+
+    with app.app_context():
+        for n in range(args.users):
+            user = User(username=f'bench{n}', email=f'bench{n}@example.com', role='staff')
+            user.set_password('password')
+            db.session.add(user)
+        db.session.commit()
+
+    login_times, probe_times, statuses = [], [], []
+    start = threading.Barrier(args.users + 1)
+    done = threading.Event()
+
+    def login(n):
+        client = app.test_client()
+        start.wait()
+        began = time.perf_counter()
+        response = client.post('/auth/login', data={'username': f'bench{n}', 'password': 'password'})
+        login_times.append(time.perf_counter() - began)
+        statuses.append(response.status_code)
+
+    def probe():
+        client = app.test_client()
+        start.wait()
+        while not done.is_set():
+            began = time.perf_counter()
+            client.get('/auth/login')
+            probe_times.append(time.perf_counter() - began)
+
+    threads = [threading.Thread(target=login, args=(n,)) for n in range(args.users)]
+    prober = threading.Thread(target=probe)
+    for thread in threads + [prober]:
+        thread.start()
+
+    began = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    done.set()
+    prober.join()
+
+    print(f"method={app.config['PASSWORD_HASH_METHOD']} workers={app.config['PASSWORD_VERIFY_WORKERS']} "
+          f"users={args.users}")
+    print(f'burst      {elapsed:.2f}s ({args.users / elapsed:.1f} logins/s)')
+    print(f'login      p50 {statistics.median(login_times) * 1000:.0f}ms  '
+          f'p95 {percentile(login_times, 0.95) * 1000:.0f}ms  max {max(login_times) * 1000:.0f}ms')
+    print(f'probe      p50 {statistics.median(probe_times) * 1000:.1f}ms  '
+          f'p95 {percentile(probe_times, 0.95) * 1000:.1f}ms  ({len(probe_times)} requests)')
+    print(f'signed in  {statuses.count(302)}/{args.users}, asked to retry {statuses.count(503)}')
+
+
+if __name__ == '__main__':
+    main()
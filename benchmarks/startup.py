@@ -0,0 +1,92 @@
+"""Worker boot time.
+
+Starts fresh interpreters the way pre-fork workers start and times importing
+the app, create_app() and the first request, for:
+
+- eager: blueprints registered in create_app (the default)
+- lazy: LAZY_BLUEPRINTS=1, blueprints imported on the first request
+- create_all: eager plus the create_all() and admin lookup every worker used
+  to run at boot, for comparison
+- no_bytecode_cache: eager with TEMPLATE_BYTECODE_CACHE off, so the first
+  request compiles its templates (the other variants load them from the
+  cache warmed by `flask compile-templates`)
+
+    python -m benchmarks.startup --runs 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import ROOT, make_app
+
+WORKER = """
+import json, sys, time
+started = time.perf_counter()
+from app import create_app, db
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+if sys.argv[1] == 'create_all':
+    from modules.models import User
+    with app.app_context():
+        db.create_all()
+        User.query.filter_by(username='admin').first()
+booted = time.perf_counter()
+response = app.test_client().get('/auth/login')
+assert response.status_code == 200, response.status_code
+done = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': created - imported,
+                  'boot': booted - started, 'first_request': done - booted}))
+"""
+
+VARIANTS = {
+    'eager': {},
+    'lazy': {'LAZY_BLUEPRINTS': '1'},
+    'create_all': {},
+    'no_bytecode_cache': {'TEMPLATE_BYTECODE_CACHE': '0'}
+}
+
+
+def measure(variant, database_url, template_cache, runs):
+    env = dict(os.environ, DATABASE_URL=database_url, TEMPLATE_CACHE_DIR=template_cache, **VARIANTS[variant])
+    env.pop('FLASK_RUN_FROM_CLI', None)
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', WORKER, variant], cwd=ROOT, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: statistics.median(sample[key] for sample in samples) * 1000 for key in samples[0]}
+
+
+def main(argv=None):
+    from benchmarks.datagen import SCALES, generate
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='tiny')
+    parser.add_argument('--database', help='use an already migrated database instead of a scratch one')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='startup-')
+    database_url = args.database or 'sqlite:///' + os.path.join(workdir, 'startup.db')
+    if not args.database:
+        generate(make_app(database_url, workdir), **SCALES[args.scale])
+
+    template_cache = os.path.join(workdir, 'jinja-cache')
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'run', 'compile-templates'], cwd=ROOT,
+                   env=dict(os.environ, DATABASE_URL=database_url, TEMPLATE_CACHE_DIR=template_cache),
+                   capture_output=True, check=True)
+
+    print(f"{'variant':18} {'import':>9} {'create_app':>11} {'boot':>9} {'1st request':>12}  (median of {args.runs})")
+    for variant in VARIANTS:
+        result = measure(variant, database_url, template_cache, args.runs)
+        print(f"{variant:18} {result['import']:>7.0f}ms {result['create_app']:>9.0f}ms {result['boot']:>7.0f}ms "
+              f"{result['first_request']:>10.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""Benchmark suite for the hot endpoints.
+
+Drives scan_product, add_to_cart, checkout, inventory_dashboard,
+stock_report, daily_sales and attendance_report through the Flask test
+client against synthetic data (see benchmarks.datagen), and records latency
+and SQL statements per request. Results are written as JSON under
+benchmarks/results/ so runs can be compared:
+
+    python -m benchmarks.suite --scale small
+    python -m benchmarks.suite --scale small --compare benchmarks/results/<earlier>.json
+
+With --compare the exit status is 1 when any endpoint's median got slower
+than --threshold (default 25%), so the suite can gate a CI job.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from benchmarks.common import RESULTS_DIR, ROOT, login, make_app, percentile
+
+
+def scan_product(ctx):
+    barcode = ctx.rng.choice(ctx.imeis) if ctx.imeis and ctx.rng.random() < 0.5 else ctx.rng.choice(ctx.skus)
+    return None, lambda: ctx.client.post('/pos/scan-product', json={'barcode': barcode})
+
+
+def add_to_cart(ctx):
+    def prepare():
+        ctx.client.post('/pos/clear-cart')
+    product_id = ctx.rng.choice(ctx.product_ids)
+    return prepare, lambda: ctx.client.post('/pos/add-to-cart', json={'product_id': product_id, 'quantity': 1})
+
+
+def checkout(ctx):
+    product_id = ctx.rng.choice(ctx.product_ids)
+
+    def prepare():
+        ctx.client.post('/pos/clear-cart')
+        ctx.client.post('/pos/add-to-cart', json={'product_id': product_id, 'quantity': 1})
+    return prepare, lambda: ctx.client.post('/pos/checkout', json={'payment_method': 'cash', 'tax_rate': 0.15})
+
+
+def inventory_dashboard(ctx):
+    return None, lambda: ctx.client.get('/inventory/')
+
+
+def stock_report(ctx):
+    return None, lambda: ctx.client.get('/inventory/stock-report')
+
+
+def daily_sales(ctx):
+    return None, lambda: ctx.client.get(f'/pos/daily-sales?date={ctx.sales_day}')
+
+
+def attendance_report(ctx):
+    return None, lambda: ctx.client.get(f'/employee/attendance-report?month={ctx.report_month}')
+
+
+SCENARIOS = [scan_product, add_to_cart, checkout, inventory_dashboard, stock_report, daily_sales,
+             attendance_report]
+
+
+class Context:
+    """Client plus sample keys the scenarios pick from"""
+
+    def __init__(self, app, seed):
+        from app import db
+        from modules.models import Product, StockItem
+
+        self.rng = random.Random(seed)
+        self.client = login(app)
+        with app.app_context():
+            self.skus = [sku for (sku,) in db.session.query(Product.sku).limit(500)]
+            self.product_ids = [product_id for (product_id,) in db.session.query(Product.id).filter(
+                Product.available_stock >= 50, Product.is_active.is_(True)
+            ).limit(200)] or [product_id for (product_id,) in db.session.query(Product.id).filter(
+                Product.available_stock > 0
+            ).limit(200)]
+            self.imeis = [imei for (imei,) in db.session.query(StockItem.imei).filter(
+                StockItem.imei.isnot(None), StockItem.status == 'available'
+            ).limit(500)]
+        self.sales_day = (date.today() - timedelta(days=1)).isoformat()
+        self.report_month = (date.today().replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+
+
+def run_scenario(app, ctx, scenario, iterations, warmup):
+    from sqlalchemy import event
+    from app import db
+
+    queries = [0]
+
+    def count(*args):
+        queries[0] += 1
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        timings, query_counts, statuses = [], [], {}
+        for n in range(warmup + iterations):
+            prepare, request = scenario(ctx)
+            if prepare:
+                prepare()
+            queries[0] = 0
+            began = time.perf_counter()
+            response = request()
+            elapsed = time.perf_counter() - began
+            if n >= warmup:
+                timings.append(elapsed)
+                query_counts.append(queries[0])
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+    return {
+        'p50_ms': statistics.median(timings) * 1000,
+        'p95_ms': percentile(timings, 0.95) * 1000,
+        'mean_ms': statistics.fmean(timings) * 1000,
+        'queries': statistics.median(query_counts),
+        'statuses': {str(code): n for code, n in sorted(statuses.items())}
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print a comparison table; returns the names that regressed"""
+    regressions = []
+    print(f"\n{'endpoint':22} {'base p50':>10} {'now p50':>10} {'change':>8}  queries")
+    for name, now in results.items():
+        before = baseline.get(name)
+        if not before:
+            print(f'{name:22} {"-":>10} {now["p50_ms"]:>9.1f}ms')
+            continue
+        change = now['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] else 0.0
+        flag = '  REGRESSION' if change > threshold else ''
+        print(f"{name:22} {before['p50_ms']:>8.1f}ms {now['p50_ms']:>8.1f}ms {change:>+7.0%}  "
+              f"{before['queries']:.0f} -> {now['queries']:.0f}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    from benchmarks.datagen import SCALES, generate
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--database', help='use an already generated database instead of a scratch one')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', nargs='*', help='scenario names to run')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown of the median')
+    args = parser.parse_args(argv)
+
+    app = make_app(args.database)
+    app.logger.setLevel(logging.CRITICAL)  # failing views show up in the statuses column instead
+    if not args.database:
+        started = time.perf_counter()
+        generate(app, seed=args.seed, **SCALES[args.scale])
+        print(f'Generated {args.scale} data in {time.perf_counter() - started:.1f}s')
+
+    ctx = Context(app, args.seed)
+    results = {}
+    print(f"{'endpoint':22} {'p50':>9} {'p95':>9} {'mean':>9} {'queries':>8}  statuses")
+    for scenario in SCENARIOS:
+        if args.only and scenario.__name__ not in args.only:
+            continue
+        result = results[scenario.__name__] = run_scenario(app, ctx, scenario, args.iterations, args.warmup)
+        print(f"{scenario.__name__:22} {result['p50_ms']:>7.1f}ms {result['p95_ms']:>7.1f}ms "
+              f"{result['mean_ms']:>7.1f}ms {result['queries']:>8.0f}  {result['statuses']}")
+
+    report = {
+        'meta': {
+            'timestamp': datetime.utcnow().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'scale': None if args.database else args.scale,
+            'database': app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0],
+            'iterations': args.iterations,
+            'python': platform.python_version()
+        },
+        'results': results
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'\nResults written to {output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,16 +5,88 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'your-secret-key-here'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///database.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    LAZY_BLUEPRINTS = os.environ.get('LAZY_BLUEPRINTS', '').lower() in ('1', 'true', 'yes')  # import views on a worker's first request
+    DATABASE_PROFILE = os.environ.get('DATABASE_PROFILE') or 'production'  # production, development or baseline, see modules/database.py
     SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
     REMEMBER_COOKIE_DURATION = timedelta(days=7)
     
+    # Read Replica Settings
+    REPLICA_DATABASE_URI = os.environ.get('REPLICA_DATABASE_URL')  # report views read from here; sqlite:///replica.db works locally
+    REPLICA_MAX_STALENESS = 300  # seconds of lag before report views fall back to the primary
+    REPLICA_CHECK_INTERVAL = 5  # seconds a lag measurement is reused
+    REPLICA_SYNC_INTERVAL = 0  # seconds between copies into a SQLite stand-in; 0 leaves it to `flask sync-replica`
+    
+    # Dashboard Cache Settings
+    FRAGMENT_CACHE_ENABLED = True
+    FRAGMENT_CACHE_TTL = 60  # seconds; tiles are also dropped as soon as their tables change
+    FRAGMENT_CACHE_SIZE = 512
+    FRAGMENT_CACHE_URL = os.environ.get('FRAGMENT_CACHE_URL')  # e.g. redis://localhost:6379/1 to share across workers
+    
+    # Template Settings
+    TEMPLATE_BYTECODE_CACHE = os.environ.get('TEMPLATE_BYTECODE_CACHE', '1').lower() in ('1', 'true', 'yes')
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')  # compiled templates shared by workers; unset uses a per-user temp dir
+    
+    # Compression and Static File Settings
+    COMPRESS_ENABLED = True
+    COMPRESS_MIN_SIZE = 500  # bytes; smaller responses are sent as they are
+    COMPRESS_LEVEL = 6  # gzip level for responses compressed per request
+    COMPRESS_BROTLI_QUALITY = 4  # per request; `flask build-assets` uses the maximum
+    COMPRESS_MIMETYPES = ['text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+                          'application/json', 'image/svg+xml']
+    STATIC_FINGERPRINT = True  # url_for('static') adds ?v=<content hash>
+    STATIC_MAX_AGE = 31536000  # seconds fingerprinted files are cached, marked immutable
+    
+    # Monitoring Settings
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # bearer token for Prometheus scrapes of /metrics
+    SLOW_QUERY_THRESHOLD = 0.5  # seconds; slower statements are logged with their view
+    
+    # Login Settings
+    USER_CACHE_TTL = 300  # seconds a snapshot lives in the shared (Redis) cache
+    USER_CACHE_LOCAL_TTL = 5  # seconds a worker trusts its own copy; bounds how long deactivation takes elsewhere
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_URL = os.environ.get('USER_CACHE_URL')  # e.g. redis://localhost:6379/0 to share across workers
+    PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD') or 'scrypt:32768:8:1'  # existing hashes upgrade on login
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_VERIFY_WORKERS = 2  # concurrent password checks per process
+    PASSWORD_VERIFY_QUEUE = 16  # logins allowed to wait for a free worker
+    PASSWORD_VERIFY_TIMEOUT = 10  # seconds before a waiting login is told to retry
+    
     # POS Settings
     DEFAULT_VAT_RATE = 0.15
     DEFAULT_CURRENCY = 'LKR'
+    SHOP_TIMEZONE = os.environ.get('SHOP_TIMEZONE') or 'Asia/Colombo'  # clock punches and attendance days are local to the shop
+    REPAIR_LABOUR_SKU = 'SRV-REPAIR'  # non-stock product used for labour lines on repair invoices
     
     # Inventory Settings
     LOW_STOCK_THRESHOLD = 5
+    STOCK_CLAIM_RETRIES = 3  # extra attempts when another terminal wins the same stock rows
+    STOCK_CLAIM_SPREAD = 4  # candidate window multiplier on databases without SKIP LOCKED
+    
+    # Repair Board Settings
+    REPAIR_STREAM_TIMEOUT = 300  # seconds before a board stream closes and the browser reconnects
+    REPAIR_STREAM_POLL_INTERVAL = 5  # seconds between checks for events from other workers
+    REPAIR_STREAM_KEEPALIVE = 15
+    
+    # Technician Assignment Settings
+    AUTO_ASSIGN_REPAIRS = True
+    TECHNICIAN_MAX_OPEN_JOBS = 8  # auto-assignment leaves jobs queued beyond this
+    TECHNICIAN_AFFINITY_SLACK = 2  # extra open jobs a brand specialist may carry before a generalist wins
+    REPAIR_SCHEDULER_TTL = 60  # seconds before open-job counts are reloaded from the database
+    
+    # Commission Settings
+    # role -> source ('sales' invoices, 'repairs' delivered jobs) -> [(monthly total reached, rate %)]
+    COMMISSION_RULES = {
+        'staff': {'sales': [(0, 1.0), (500000, 1.5), (1000000, 2.0)]},
+        'manager': {'sales': [(0, 0.5)]},
+        'technician': {'repairs': [(0, 5.0), (100000, 7.5)]}
+    }
     
     # File Upload Settings
-    UPLOAD_FOLDER = 'static/uploads'
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
\ No newline at end of file
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or 'uploads'  # outside static/, served only by login-protected views
+    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+    UPLOAD_CHUNK_SIZE = 64 * 1024  # bytes read from the request stream at a time
+    UPLOAD_PART_MAX_AGE = 24 * 3600  # seconds before parts of an abandoned upload are removed
+    ALLOWED_UPLOAD_TYPES = ['image/jpeg', 'image/png', 'image/webp', 'application/pdf']
+    THUMBNAIL_SIZE = (320, 320)
+    THUMBNAIL_WORKERS = 2  # processes generating thumbnails off the request path
\ No newline at end of file
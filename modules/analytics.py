@@ -0,0 +1,266 @@
+"""Repair turnaround (SLA) analytics.
+
+Every status transition appends its duration to repair_sla_samples; nothing
+shared is read or updated in the transition's transaction, so recording can
+never conflict with a concurrent transition or fail it. `flask fold-sla-samples`
+(run it from cron) folds samples into a QuantileSketch kept per month for the
+whole shop, per technician and per brand. Sketches are small, merge by adding
+bucket counts, and answer p50/p90/p99 within ALPHA relative error; reports
+merge the sketches with any samples not folded yet.
+
+Metrics:
+    turnaround      intake -> completed
+    pickup          completed -> delivered
+    status:<name>   time spent in one status
+"""
+import math
+from collections import defaultdict
+from datetime import datetime
+
+import click
+from flask.cli import with_appcontext
+
+from app import db
+from modules.models import RepairEvent, RepairJob, RepairSlaSample, RepairSlaSketch
+from modules.events import on_job_transition
+
+ALPHA = 0.01  # relative accuracy of reported percentiles
+PERCENTILES = (0.5, 0.9, 0.99)
+
+
+class QuantileSketch:
+    """Log-bucketed, mergeable quantile sketch (DDSketch style)"""
+
+    def __init__(self, alpha=ALPHA, bins=None, zeros=0, count=0, total=0.0):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.bins = defaultdict(int, bins or {})
+        self.zeros = zeros
+        self.count = count
+        self.total = total
+
+    def add(self, value):
+        if value <= 0:
+            self.zeros += 1
+        else:
+            self.bins[math.ceil(math.log(value, self.gamma))] += 1
+        self.count += 1
+        self.total += max(value, 0)
+
+    def merge(self, other):
+        for index, n in other.bins.items():
+            self.bins[index] += n
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+        return self
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if rank < seen:
+                # Midpoint of the bucket keeps the error within alpha
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_dict(self):
+        return {
+            'alpha': self.alpha,
+            'bins': {str(index): n for index, n in self.bins.items()},
+            'zeros': self.zeros,
+            'count': self.count,
+            'total': self.total
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            alpha=data.get('alpha', ALPHA),
+            bins={int(index): n for index, n in data.get('bins', {}).items()},
+            zeros=data.get('zeros', 0),
+            count=data.get('count', 0),
+            total=data.get('total', 0.0)
+        )
+
+
+def job_dimensions(technician_id, brand):
+    """(dimension, key) pairs a job's durations are recorded under"""
+    dimensions = [('all', '*')]
+    if technician_id:
+        dimensions.append(('technician', str(technician_id)))
+    if brand:
+        dimensions.append(('brand', brand.strip().lower()))
+    return dimensions
+
+
+def record_duration(metric, seconds, when, technician_id, brand):
+    """Append one duration (in seconds); insert-only, so it cannot conflict"""
+    db.session.add(RepairSlaSample(period=when.strftime('%Y-%m'), metric=metric, technician_id=technician_id,
+                                   brand=brand, seconds=seconds))
+
+
+@on_job_transition
+def _record_transition(job, previous_technician_id, previous_status):
+    if previous_status == job.status:
+        return
+
+    now = datetime.utcnow()
+
+    if previous_status:
+        started = job.status_changed_at or job.created_at
+        if started:
+            record_duration(f'status:{previous_status}', (now - started).total_seconds(), now,
+                            previous_technician_id, job.brand)
+
+    if job.status == 'completed' and job.created_at and not _completed_before(job):
+        record_duration('turnaround', (now - job.created_at).total_seconds(), now, job.technician_id, job.brand)
+    elif job.status == 'delivered' and previous_status == 'completed' and job.completed_date:
+        record_duration('pickup', (now - job.completed_date).total_seconds(), now, job.technician_id, job.brand)
+
+    job.status_changed_at = now
+
+
+def _completed_before(job):
+    """True when the event log already has this job reaching 'completed'
+
+    A reopened job completes again; only its first completion is a
+    turnaround, the same one-per-job rebuild_sketches derives.
+    """
+    with db.session.no_autoflush:  # leave out the event being published now
+        return db.session.query(RepairEvent.id).filter(
+            RepairEvent.repair_job_id == job.id,
+            RepairEvent.payload['job']['status'].as_string() == 'completed'
+        ).first() is not None
+
+
+def turnaround_report(metric='turnaround', dimension='all', periods=None):
+    """Merged percentiles (in hours) per key across the given YYYY-MM periods"""
+    query = RepairSlaSketch.query.filter_by(metric=metric, dimension=dimension)
+    if periods:
+        query = query.filter(RepairSlaSketch.period.in_(periods))
+
+    merged = defaultdict(QuantileSketch)
+    for row in query:
+        merged[row.key].merge(QuantileSketch.from_dict(row.sketch))
+
+    # Samples recorded since the last fold
+    samples = db.session.query(
+        RepairSlaSample.technician_id, RepairSlaSample.brand, RepairSlaSample.seconds
+    ).filter(RepairSlaSample.metric == metric)
+    if periods:
+        samples = samples.filter(RepairSlaSample.period.in_(periods))
+    for technician_id, brand, seconds in samples:
+        for sample_dimension, key in job_dimensions(technician_id, brand):
+            if sample_dimension == dimension:
+                merged[key].add(seconds)
+
+    report = []
+    for key, sketch in sorted(merged.items()):
+        entry = {'key': key, 'count': sketch.count,
+                 'mean_hours': round(sketch.total / sketch.count / 3600, 2) if sketch.count else None}
+        for q in PERCENTILES:
+            value = sketch.quantile(q)
+            entry[f'p{int(q * 100)}_hours'] = round(value / 3600, 2) if value is not None else None
+        report.append(entry)
+    return report
+
+
+def fold_samples():
+    """Merge recorded samples into the monthly sketches; returns how many were folded
+
+    Only samples up to the highest id seen at the start are folded and
+    deleted, so transitions recording meanwhile are left for the next run.
+    Run from one place at a time (cron); sketch rows are locked while merged.
+    """
+    last_id = db.session.query(db.func.max(RepairSlaSample.id)).scalar()
+    if last_id is None:
+        return 0
+
+    sketches = defaultdict(QuantileSketch)
+    folded = 0
+    samples = db.session.query(
+        RepairSlaSample.period, RepairSlaSample.metric, RepairSlaSample.technician_id, RepairSlaSample.brand,
+        RepairSlaSample.seconds
+    ).filter(RepairSlaSample.id <= last_id)
+    for period, metric, technician_id, brand, seconds in samples:
+        for dimension, key in job_dimensions(technician_id, brand):
+            sketches[(period, dimension, key, metric)].add(seconds)
+        folded += 1
+
+    for (period, dimension, key, metric), sketch in sketches.items():
+        row = RepairSlaSketch.query.filter_by(
+            period=period, dimension=dimension, key=key, metric=metric
+        ).with_for_update().first()
+        if row is None:
+            db.session.add(RepairSlaSketch(period=period, dimension=dimension, key=key, metric=metric,
+                                           count=sketch.count, sketch=sketch.to_dict()))
+        else:
+            sketch.merge(QuantileSketch.from_dict(row.sketch))
+            row.sketch = sketch.to_dict()  # reassign so the JSON change is flushed
+            row.count = sketch.count
+
+    RepairSlaSample.query.filter(RepairSlaSample.id <= last_id).delete(synchronize_session=False)
+    db.session.commit()
+    return folded
+
+
+def rebuild_sketches():
+    """Recompute all sketches from job dates and the repair event log"""
+    RepairSlaSketch.query.delete()
+    RepairSlaSample.query.delete()  # recomputed from the same history below
+
+    sketches = defaultdict(QuantileSketch)
+
+    def add(metric, seconds, when, dimensions):
+        for dimension, key in dimensions:
+            sketches[(when.strftime('%Y-%m'), dimension, key, metric)].add(seconds)
+
+    jobs = db.session.query(
+        RepairJob.id, RepairJob.technician_id, RepairJob.brand, RepairJob.created_at,
+        RepairJob.completed_date, RepairJob.delivered_date
+    ).all()
+
+    for job_id, technician_id, brand, created_at, completed, delivered in jobs:
+        dimensions = job_dimensions(technician_id, brand)
+        if created_at and completed:
+            add('turnaround', (completed - created_at).total_seconds(), completed, dimensions)
+        if completed and delivered:
+            add('pickup', (delivered - completed).total_seconds(), delivered, dimensions)
+
+    # Replay status changes to recover time spent in each status
+    started = {job_id: created_at for job_id, _, _, created_at, _, _ in jobs}
+    events = db.session.query(
+        RepairEvent.repair_job_id, RepairEvent.payload, RepairEvent.created_at
+    ).order_by(RepairEvent.id)
+
+    for job_id, payload, occurred_at in events:
+        previous_status = payload.get('previous_status')
+        job = payload['job']
+        if not previous_status or previous_status == job['status'] or not started.get(job_id):
+            continue
+        technician_id = payload.get('previous_technician_id', job['technician_id'])
+        add(f'status:{previous_status}', (occurred_at - started[job_id]).total_seconds(), occurred_at,
+            job_dimensions(technician_id, job['brand']))
+        started[job_id] = occurred_at
+
+    db.session.add_all([
+        RepairSlaSketch(period=period, dimension=dimension, key=key, metric=metric,
+                        count=sketch.count, sketch=sketch.to_dict())
+        for (period, dimension, key, metric), sketch in sketches.items()
+    ])
+    return len(sketches)
+
+
+@click.command('fold-sla-samples')
+@with_appcontext
+def fold_samples_command():
+    """Fold recorded turnaround samples into the monthly SLA sketches"""
+    click.echo(f'Folded {fold_samples()} sample(s)')
@@ -0,0 +1,193 @@
+"""Response compression and fingerprinted static files.
+
+Pages and JSON larger than COMPRESS_MIN_SIZE are compressed on the way out
+when the client accepts it: brotli when the brotli package is installed
+and preferred by the client, gzip otherwise. Streamed responses (the repair
+board stream) and files (attachments) are passed through untouched.
+
+url_for('static', filename=...) adds a content hash (?v=<hash>), so an
+asset's URL changes whenever its content does. Requests carrying the
+current hash are served with a year-long immutable Cache-Control; the
+terminals then never ask for that file again until a deploy changes it.
+
+The static files are compressed ahead of time at deploy, next to the
+originals (app.css -> app.css.gz, app.css.br), and those are sent to
+clients that accept them instead of compressing per request:
+
+    flask build-assets
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import time
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import with_appcontext
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip covers every browser
+    brotli = None
+
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+_fingerprints = {}
+
+
+def init_assets(app):
+    """Compress responses, fingerprint static URLs and serve precompressed files"""
+    if app.config.get('STATIC_FINGERPRINT', True):
+        app.url_defaults(_fingerprint_static)
+    if app.has_static_folder:
+        app.view_functions['static'] = send_static
+    if app.config.get('COMPRESS_ENABLED', True):
+        app.after_request(compress_response)
+    app.cli.add_command(build_assets_command)
+
+
+def asset_hash(filename):
+    """Short content hash of a file in the static folder, or None if missing"""
+    path = safe_join(current_app.static_folder, filename)
+    try:
+        stat = os.stat(path)
+    except (TypeError, OSError):
+        return None
+
+    cached = _fingerprints.get(path)
+    if cached and cached[0] == (stat.st_mtime_ns, stat.st_size):
+        return cached[1]
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    _fingerprints[path] = ((stat.st_mtime_ns, stat.st_size), digest)
+    return digest
+
+
+def _fingerprint_static(endpoint, values):
+    if endpoint == 'static' and 'filename' in values and 'v' not in values:
+        digest = asset_hash(values['filename'])
+        if digest:
+            values['v'] = digest
+
+
+def _accepted_encodings(available):
+    """Encodings from `available` the client accepts, best first"""
+    accepted = [(request.accept_encodings.quality(encoding), -i, encoding)
+                for i, encoding in enumerate(available)]
+    return [encoding for quality, _, encoding in sorted(accepted, reverse=True) if quality > 0]
+
+
+def send_static(filename):
+    """Static view: precompressed variant when there is a fresh one, immutable when fingerprinted"""
+    folder = current_app.static_folder
+    source = safe_join(folder, filename)
+    encoding = None
+    if source and os.path.isfile(source):
+        for candidate in _accepted_encodings(['br', 'gzip']):
+            compressed = source + SUFFIXES[candidate]
+            # Ignore a precompressed copy older than its source (build not rerun)
+            if os.path.isfile(compressed) and os.path.getmtime(compressed) >= os.path.getmtime(source):
+                encoding = candidate
+                break
+
+    if encoding:
+        response = send_from_directory(folder, filename + SUFFIXES[encoding],
+                                       mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                                       max_age=current_app.get_send_file_max_age(filename))
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = send_from_directory(folder, filename, max_age=current_app.get_send_file_max_age(filename))
+    response.vary.add('Accept-Encoding')
+
+    version = request.args.get('v')
+    if version and current_app.config.get('STATIC_FINGERPRINT', True) and version == asset_hash(filename):
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config.get('STATIC_MAX_AGE', 31536000)
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+
+def compress_response(response):
+    """after_request hook compressing eligible responses for clients that accept it"""
+    config = current_app.config
+    if (response.direct_passthrough or response.is_streamed
+            or not 200 <= response.status_code < 300 or response.status_code in (204, 206)
+            or 'Content-Encoding' in response.headers
+            or 'no-transform' in response.headers.get('Cache-Control', '')
+            or response.mimetype not in config.get('COMPRESS_MIMETYPES', ())):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < config.get('COMPRESS_MIN_SIZE', 500):
+        return response
+
+    encodings = _accepted_encodings(['br', 'gzip'] if brotli else ['gzip'])
+    if not encodings:
+        return response
+    encoding = encodings[0]
+    if encoding == 'br':
+        compressed = brotli.compress(data, quality=config.get('COMPRESS_BROTLI_QUALITY', 4))
+    else:
+        compressed = gzip.compress(data, compresslevel=config.get('COMPRESS_LEVEL', 6))
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+
+def precompress(path, mimetypes_allowed, min_size):
+    """Write .gz (and .br) next to a static file; returns the encodings written"""
+    if mimetypes.guess_type(path)[0] not in mimetypes_allowed or os.path.getsize(path) < min_size:
+        return []
+
+    with open(path, 'rb') as f:
+        data = f.read()
+    variants = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli:
+        variants['br'] = brotli.compress(data, quality=11)
+
+    written = []
+    for encoding, compressed in variants.items():
+        if len(compressed) >= len(data):
+            continue
+        target = path + SUFFIXES[encoding]
+        with open(target + '.tmp', 'wb') as f:
+            f.write(compressed)
+        os.replace(target + '.tmp', target)
+        written.append(encoding)
+    return written
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Precompress the static files served to the browsers"""
+    folder = current_app.static_folder
+    uploads = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    allowed = current_app.config.get('COMPRESS_MIMETYPES', ())
+    min_size = current_app.config.get('COMPRESS_MIN_SIZE', 500)
+
+    started = time.perf_counter()
+    count = 0
+    for root, dirs, files in os.walk(folder):
+        # User uploads are served by their own views and are mostly images
+        dirs[:] = [d for d in dirs if os.path.abspath(os.path.join(root, d)) != uploads]
+        for name in files:
+            if name.endswith(tuple(SUFFIXES.values())) or name.endswith('.tmp'):
+                continue
+            path = os.path.join(root, name)
+            written = precompress(path, allowed, min_size)
+            if written:
+                count += 1
+                click.echo(f"  {os.path.relpath(path, folder)} [{', '.join(written)}] {asset_hash(os.path.relpath(path, folder))}")
+
+    if not brotli:
+        click.echo('brotli is not installed; only .gz files were written')
+    click.echo(f'Precompressed {count} file(s) in {time.perf_counter() - started:.2f}s')
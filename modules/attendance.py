@@ -0,0 +1,381 @@
+"""Monthly attendance totals and bulk attendance writes.
+
+The current month is summarized live with one grouped query. Once a month
+is over, close_months() (`flask employee close-months`, run nightly from
+cron) persists its totals to attendance_monthly and reports read them back
+from there. Any change to an Attendance row in a closed month drops that
+month's rollup; reports summarize it live until the next close_months() run
+rebuilds it. Reports never write. Bulk writes that bypass the ORM must call
+invalidate_periods themselves.
+
+upsert_attendance() writes many rows with INSERT ... ON CONFLICT against
+unique_employee_date, so approving leave or closing the shop for a holiday
+is a few statements however many people and days are involved.
+
+Clock devices export punches in bulk; ingest_punches() sorts and pairs them
+per employee and day in memory and upserts the resulting days the same way.
+Punches are read in SHOP_TIMEZONE: naive timestamps are shop-local, offset
+ones are converted to it, days are shop days, and check-in/out times are
+stored as naive UTC like the rest of the app.
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.orm import Session
+from app import db
+from modules.models import Attendance, AttendanceMonthly, LeaveRequest, User
+
+TOTALS = ('present_days', 'absent_days', 'leave_days', 'total_hours')
+UPSERT_CHUNK_SIZE = 500
+PUNCH_ACTIONS = ('check_in', 'check_out')
+# Days with one of these statuses are never overwritten by clock punches
+PROTECTED_STATUSES = ('leave', 'holiday')
+
+
+def month_bounds(period):
+    """First and last day of a YYYY-MM period"""
+    year, month = map(int, period.split('-'))
+    start_date = date(year, month, 1)
+    if month == 12:
+        end_date = date(year + 1, 1, 1) - timedelta(days=1)
+    else:
+        end_date = date(year, month + 1, 1) - timedelta(days=1)
+    return start_date, end_date
+
+
+def is_closed(period):
+    return month_bounds(period)[1] < date.today().replace(day=1)
+
+
+def summarize(start_date, end_date):
+    """Totals per employee for a date range: {employee_id: {...}}"""
+    def days(status):
+        return db.func.sum(db.case((Attendance.status == status, 1), else_=0))
+
+    rows = db.session.query(
+        Attendance.employee_id,
+        days('present'),
+        days('absent'),
+        days('leave'),
+        db.func.coalesce(db.func.sum(Attendance.total_hours), 0.0)
+    ).filter(
+        Attendance.date >= start_date,
+        Attendance.date <= end_date
+    ).group_by(Attendance.employee_id)
+
+    return {employee_id: dict(zip(TOTALS, values)) for employee_id, *values in rows}
+
+
+def monthly_totals(period):
+    """Totals per employee for one month, from the rollup once the month is closed; read-only"""
+    if is_closed(period):
+        rows = AttendanceMonthly.query.filter_by(period=period).all()
+        if rows:
+            return {row.employee_id: {key: getattr(row, key) for key in TOTALS} for row in rows}
+    return summarize(*month_bounds(period))
+
+
+def close_month(period):
+    """Persist the rollup for one closed month, replacing any existing one; the caller commits"""
+    if not is_closed(period):
+        raise ValueError(f'{period} is not over yet')
+
+    totals = summarize(*month_bounds(period))
+    invalidate_periods([period])
+    if totals:
+        db.session.execute(db.insert(AttendanceMonthly), [
+            dict(values, period=period, employee_id=employee_id)
+            for employee_id, values in totals.items()
+        ])
+    return len(totals)
+
+
+def close_months():
+    """Build rollups for closed months that have attendance but no rollup; returns the periods built
+
+    Run from the primary (cron), never from a report: a month edited after
+    it was closed lost its rollup and is rebuilt here.
+    """
+    first = db.session.query(db.func.min(Attendance.date)).scalar()
+    if first is None:
+        return []
+
+    done = {period for (period,) in db.session.query(AttendanceMonthly.period).distinct()}
+    last = date.today().replace(day=1) - timedelta(days=1)
+    built = []
+    month = first.replace(day=1)
+    while month <= last:
+        period = month.strftime('%Y-%m')
+        if period not in done and close_month(period):
+            built.append(period)
+        month = (month + timedelta(days=32)).replace(day=1)
+    return built
+
+
+def invalidate_periods(periods):
+    """Drop rollups for the given YYYY-MM periods; the caller commits"""
+    periods = set(periods)
+    if periods:
+        db.session.execute(db.delete(AttendanceMonthly).where(AttendanceMonthly.period.in_(periods)))
+
+
+@event.listens_for(Session, 'before_flush')
+def _invalidate_changed_months(session, flush_context, instances):
+    periods = set()
+    for obj in session.new | session.dirty | session.deleted:
+        if not isinstance(obj, Attendance):
+            continue
+        history = db.inspect(obj).attrs.date.history
+        for value in (obj.date, *history.deleted):
+            if value:
+                periods.add(value.strftime('%Y-%m'))
+
+    periods = {period for period in periods if is_closed(period)}
+    if periods:
+        session.execute(db.delete(AttendanceMonthly).where(AttendanceMonthly.period.in_(periods)))
+
+
+def upsert_attendance(rows, update=()):
+    """Insert Attendance rows, resolving (employee_id, date) clashes in the database.
+
+    Existing rows are left alone unless columns are named in `update`, in which
+    case those columns take the new values. Rows must all have the same keys.
+    """
+    if not rows:
+        return
+
+    dialect = db.session.get_bind().dialect.name
+    for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+        chunk = rows[start:start + UPSERT_CHUNK_SIZE]
+
+        if dialect in ('sqlite', 'postgresql'):
+            insert = (sqlite if dialect == 'sqlite' else postgresql).insert(Attendance)
+            if update:
+                stmt = insert.on_conflict_do_update(
+                    index_elements=['employee_id', 'date'],
+                    set_={column: insert.excluded[column] for column in update}
+                )
+            else:
+                stmt = insert.on_conflict_do_nothing(index_elements=['employee_id', 'date'])
+        elif dialect in ('mysql', 'mariadb'):
+            insert = mysql.insert(Attendance)
+            if update:
+                stmt = insert.on_duplicate_key_update({column: insert.inserted[column] for column in update})
+            else:
+                stmt = insert.prefix_with('IGNORE')
+        else:
+            stmt, chunk = _insert_missing(chunk, update)
+
+        if chunk:
+            db.session.execute(stmt, chunk)
+
+    invalidate_periods(
+        period for period in {row['date'].strftime('%Y-%m') for row in rows} if is_closed(period)
+    )
+
+
+def _insert_missing(rows, update):
+    """Portable fallback: update clashing rows, return an INSERT for the rest"""
+    keys = {(row['employee_id'], row['date']) for row in rows}
+    existing = set(db.session.query(Attendance.employee_id, Attendance.date).filter(
+        db.tuple_(Attendance.employee_id, Attendance.date).in_(keys)
+    ))
+
+    for row in rows:
+        if update and (row['employee_id'], row['date']) in existing:
+            db.session.execute(
+                db.update(Attendance)
+                .where(Attendance.employee_id == row['employee_id'], Attendance.date == row['date'])
+                .values({column: row[column] for column in update})
+            )
+
+    return db.insert(Attendance), [row for row in rows if (row['employee_id'], row['date']) not in existing]
+
+
+def mark_days(employee_ids, start_date, end_date, status, notes=None, overwrite=False):
+    """Give every employee the same status for each day in a range.
+
+    Used for public holidays and shop closures. Days that already have a
+    record keep it unless overwrite is set. Returns the number of rows written.
+    """
+    days = [start_date + timedelta(days=n) for n in range((end_date - start_date).days + 1)]
+    rows = [
+        {'employee_id': employee_id, 'date': day, 'status': status, 'notes': notes, 'total_hours': 0.0}
+        for employee_id in employee_ids
+        for day in days
+    ]
+    upsert_attendance(rows, update=('status', 'notes') if overwrite else ())
+    return len(rows)
+
+
+def close_shop(start_date, end_date, notes, status='holiday'):
+    """Mark a holiday or closure for all active employees; the caller commits"""
+    employee_ids = [user_id for (user_id,) in db.session.query(User.id).filter_by(is_active=True)]
+    return mark_days(employee_ids, start_date, end_date, status, notes=notes)
+
+
+def decide_leaves(leave_ids, action, approver_id):
+    """Approve or reject many pending leave requests at once.
+
+    Approved leave becomes 'leave' attendance for every day in range, written
+    with one upsert that keeps days already recorded. Returns the requests
+    that were decided; the caller commits.
+    """
+    leaves = LeaveRequest.query.filter(
+        LeaveRequest.id.in_(leave_ids),
+        LeaveRequest.status == 'pending'
+    ).all()
+
+    now = datetime.utcnow()
+    rows = []
+    for leave in leaves:
+        leave.status = 'approved' if action == 'approve' else 'rejected'
+        leave.approved_by = approver_id
+        leave.approved_date = now
+
+        if action == 'approve':
+            days = (leave.end_date - leave.start_date).days + 1
+            rows.extend({
+                'employee_id': leave.employee_id,
+                'date': leave.start_date + timedelta(days=n),
+                'status': 'leave',
+                'notes': f'{leave.leave_type} leave',
+                'total_hours': 0.0
+            } for n in range(days))
+
+    db.session.flush()
+    upsert_attendance(rows)
+    return leaves
+
+
+def shop_timezone():
+    """The zone clock devices and shop days are in (SHOP_TIMEZONE)"""
+    name = current_app.config.get('SHOP_TIMEZONE') if has_app_context() else None
+    return ZoneInfo(name) if name else timezone.utc
+
+
+def parse_punch(record, zone=timezone.utc):
+    """(employee_id, timestamp, action) from a dict or CSV row; raises ValueError
+
+    The timestamp comes back aware and in `zone`: naive timestamps are taken
+    as local to `zone`, ones with an offset are converted to it.
+    """
+    if isinstance(record, dict):
+        employee_id, timestamp, action = record.get('employee_id'), record.get('timestamp'), record.get('action')
+    else:
+        employee_id, timestamp, action = (list(record) + [None, None])[:3]
+
+    action = (action or '').strip().lower() or None
+    if action is not None and action not in PUNCH_ACTIONS:
+        raise ValueError(f'Unknown action {action}')
+    timestamp = datetime.fromisoformat(str(timestamp).strip())
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=zone)
+    return int(employee_id), timestamp.astimezone(zone), action
+
+
+def pair_punches(punches):
+    """Group punches into days: {(employee_id, date): (check_in, check_out, hours, unpaired)}
+
+    Punches are aware timestamps from parse_punch and are grouped by their
+    local date. Punches without an action alternate in, out, in, out through
+    the day. Hours are the sum of the paired intervals; a trailing punch with
+    no partner counts as unpaired. Check-in/out come back as naive UTC.
+    """
+    by_day = defaultdict(list)
+    for employee_id, timestamp, action in punches:
+        by_day[(employee_id, timestamp.date())].append((timestamp, action))
+
+    days = {}
+    for key, times in by_day.items():
+        times.sort()
+        seconds = 0.0
+        unpaired = 0
+        opened = None
+        for timestamp, action in times:
+            is_in = action == 'check_in' if action else opened is None
+            if is_in:
+                if opened is not None:
+                    unpaired += 1
+                opened = timestamp
+            elif opened is not None:
+                seconds += (timestamp - opened).total_seconds()
+                opened = None
+            else:
+                unpaired += 1
+        if opened is not None:
+            unpaired += 1
+
+        check_in = _naive_utc(times[0][0])
+        check_out = _naive_utc(times[-1][0]) if len(times) > 1 else None
+        days[key] = (check_in, check_out, round(seconds / 3600, 2), unpaired)
+    return days
+
+
+def _naive_utc(timestamp):
+    return timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def ingest_punches(records):
+    """Load clock punches and upsert one Attendance row per employee and day.
+
+    Returns a summary with the conflicts found: malformed records, unknown
+    employees, days already marked as leave/holiday (left untouched) and
+    days with unpaired punches (stored with the hours that could be paired).
+    A day that is imported again is replaced, so exports should cover whole
+    days. The caller commits.
+    """
+    conflicts = []
+    punches = []
+    received = 0
+    zone = shop_timezone()
+    for index, record in enumerate(records):
+        received += 1
+        try:
+            punches.append(parse_punch(record, zone))
+        except (TypeError, ValueError) as e:
+            conflicts.append({'type': 'invalid', 'record': index, 'message': str(e)})
+
+    days = pair_punches(punches)
+    if not days:
+        return {'received': received, 'days': 0, 'written': 0, 'conflicts': conflicts}
+
+    employee_ids = {employee_id for employee_id, _ in days}
+    dates = [day for _, day in days]
+    known = {user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(employee_ids))}
+    protected = dict(
+        ((employee_id, day), status) for employee_id, day, status in db.session.query(
+            Attendance.employee_id, Attendance.date, Attendance.status
+        ).filter(
+            Attendance.employee_id.in_(known),
+            Attendance.date >= min(dates),
+            Attendance.date <= max(dates),
+            Attendance.status.in_(PROTECTED_STATUSES)
+        )
+    ) if known else {}
+
+    rows = []
+    for (employee_id, day), (check_in, check_out, hours, unpaired) in sorted(days.items()):
+        if employee_id not in known:
+            conflicts.append({'type': 'unknown_employee', 'employee_id': employee_id, 'date': day.isoformat()})
+            continue
+        if (employee_id, day) in protected:
+            conflicts.append({'type': protected[(employee_id, day)], 'employee_id': employee_id, 'date': day.isoformat()})
+            continue
+        if unpaired:
+            conflicts.append({'type': 'unpaired', 'employee_id': employee_id, 'date': day.isoformat(), 'punches': unpaired})
+        rows.append({
+            'employee_id': employee_id,
+            'date': day,
+            'check_in': check_in,
+            'check_out': check_out,
+            'total_hours': hours,
+            'status': 'present'
+        })
+
+    upsert_attendance(rows, update=('check_in', 'check_out', 'total_hours', 'status'))
+    return {'received': received, 'days': len(days), 'written': len(rows), 'conflicts': conflicts}
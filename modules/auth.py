@@ -3,6 +3,7 @@ from flask_login import login_user, logout_user, login_required, current_user
 from app import db
 from modules.models import User
 from modules.forms import LoginForm, RegistrationForm, ChangePasswordForm
+from modules.passwords import PasswordBusyError, needs_rehash
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -14,8 +15,20 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user and user.check_password(form.password.data):
+        
+        try:
+            valid = user is not None and user.check_password(form.password.data)
+        except PasswordBusyError as e:
+            flash(str(e), 'warning')
+            return render_template('auth/login.html', form=form, title='Login'), 503
+        
+        if valid:
             if user.is_active:
+                # Upgrade hashes made with older cost settings
+                if needs_rehash(user.password_hash):
+                    user.set_password(form.password.data)
+                    db.session.commit()
+                
                 login_user(user, remember=form.remember.data)
                 next_page = request.args.get('next')
                 return redirect(next_page) if next_page else redirect(url_for('index'))
@@ -61,8 +74,16 @@ def register():
 def change_password():
     form = ChangePasswordForm()
     if form.validate_on_submit():
-        if current_user.check_password(form.old_password.data):
-            current_user.set_password(form.new_password.data)
+        # current_user is a cached snapshot, so update the real row
+        user = User.query.get(current_user.id)
+        try:
+            valid = user.check_password(form.old_password.data)
+        except PasswordBusyError as e:
+            flash(str(e), 'warning')
+            return render_template('auth/change_password.html', form=form, title='Change Password'), 503
+        
+        if valid:
+            user.set_password(form.new_password.data)
             db.session.commit()
             flash('Your password has been updated!', 'success')
             return redirect(url_for('index'))
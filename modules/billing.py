@@ -0,0 +1,126 @@
+"""Invoicing for repair jobs.
+
+Delivering a repair produces a normal Invoice (linked through repair_job_id),
+so repair revenue shows up in daily sales and every other report that reads
+invoices, without joining repair tables.
+"""
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db
+from modules.models import Invoice, InvoiceItem, Payment, Product, RepairItem
+
+
+def labour_product():
+    """Non-stock product that labour lines are booked against"""
+    sku = current_app.config.get('REPAIR_LABOUR_SKU', 'SRV-REPAIR')
+    product = Product.query.filter_by(sku=sku).first()
+
+    if not product:
+        product = Product(
+            sku=sku,
+            name='Repair Labour',
+            has_imei=False,
+            is_active=False  # keep it out of the POS and parts catalogs
+        )
+        # Two first deliveries may race to create it; the loser reuses the winner's
+        try:
+            with db.session.begin_nested():
+                db.session.add(product)
+        except IntegrityError:
+            product = Product.query.filter_by(sku=sku).one()
+
+    return product
+
+
+def parts_lines(job_id):
+    """Consumed parts grouped per product: (product_id, quantity, unit_price, total)"""
+    return db.session.query(
+        RepairItem.product_id,
+        db.func.sum(RepairItem.quantity),
+        db.func.max(RepairItem.unit_price),
+        db.func.sum(RepairItem.total_price)
+    ).filter(
+        RepairItem.repair_job_id == job_id
+    ).group_by(RepairItem.product_id).all()
+
+
+def create_repair_invoice(job, invoice_number, labour_charge=None, payment_method='cash',
+                          amount_paid=None, tax_rate=0.0, user_id=None):
+    """Invoice a delivered repair: one labour line plus one line per part.
+
+    When labour_charge is not given it is whatever the estimate leaves after
+    parts. Items are written with a single bulk INSERT; the caller commits.
+    """
+    parts = parts_lines(job.id)
+    parts_total = sum(total for _, _, _, total in parts)
+
+    if labour_charge is None:
+        labour_charge = max((job.estimated_cost or 0) - parts_total, 0)
+
+    subtotal = parts_total + labour_charge
+    tax = subtotal * tax_rate
+    total = subtotal + tax
+
+    if amount_paid is None:
+        amount_paid = 0 if payment_method == 'due' else total
+
+    if amount_paid >= total:
+        payment_status = 'paid'
+    elif amount_paid > 0:
+        payment_status = 'partial'
+    else:
+        payment_status = 'pending'
+
+    customer = job.customer
+    invoice = Invoice(
+        invoice_number=invoice_number,
+        customer_id=job.customer_id,
+        customer_name=customer.name if customer else None,
+        customer_phone=customer.phone if customer else None,
+        date=job.delivered_date,
+        subtotal=subtotal,
+        tax=tax,
+        total=total,
+        payment_status=payment_status,
+        payment_method=payment_method,
+        notes=f'Repair job {job.job_number}',
+        repair_job_id=job.id,
+        created_by=user_id
+    )
+    db.session.add(invoice)
+    db.session.flush()  # Get invoice ID
+
+    lines = [{
+        'invoice_id': invoice.id,
+        'product_id': labour_product().id,
+        'stock_item_id': None,
+        'quantity': 1,
+        'unit_price': labour_charge,
+        'discount': 0.0,
+        'total': labour_charge,
+        'warranty_period': job.warranty_period or None,
+        'warranty_expires_at': job.warranty_expires_at
+    }]
+    lines.extend({
+        'invoice_id': invoice.id,
+        'product_id': product_id,
+        'stock_item_id': None,
+        'quantity': quantity,
+        'unit_price': unit_price,
+        'discount': 0.0,
+        'total': line_total,
+        'warranty_period': None,
+        'warranty_expires_at': None
+    } for product_id, quantity, unit_price, line_total in parts)
+    db.session.execute(db.insert(InvoiceItem), lines)
+
+    if amount_paid > 0:
+        db.session.add(Payment(
+            invoice_id=invoice.id,
+            amount=amount_paid,
+            payment_method=payment_method,
+            received_by=user_id
+        ))
+
+    job.final_cost = subtotal
+    return invoice
@@ -0,0 +1,190 @@
+"""Tag-invalidated fragment cache for the dashboards.
+
+Dashboard views build their tiles through fragment(), which caches the
+plain data for each tile per user role for FRAGMENT_CACHE_TTL seconds (or
+the tile's own ttl). Every entry also carries tags such as 'sales' or
+'stock'. Committing a change to a tagged table bumps that tag's version, so
+entries built before the change are rebuilt on the next view instead of
+waiting for their TTL (see TAG_TABLES).
+
+Entries live in an in-process LRU. When FRAGMENT_CACHE_URL points at Redis,
+entries and tag versions are shared between workers and invalidation is
+seen by all of them; with the in-process backend other workers pick up a
+change when their copy expires.
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+try:
+    import redis
+except ImportError:  # shared cache is optional
+    redis = None
+
+# Writes to these tables invalidate the tiles carrying the listed tags
+TAG_TABLES = {
+    'invoices': ('sales',),
+    'invoice_items': ('sales',),
+    'payments': ('sales',),
+    'products': ('stock',),
+    'product_categories': ('stock',),
+    'stock_items': ('stock',),
+    'repair_jobs': ('repairs',),
+    'customers': ('repairs',),
+    'users': ('staff', 'repairs'),
+    'attendance': ('staff',),
+    'leave_requests': ('staff',)
+}
+
+
+class MemoryBackend:
+    """Thread-safe TTL LRU plus tag version counters"""
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._versions = {}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def tag_versions(self, tags):
+        with self._lock:
+            return tuple(self._versions.get(tag, 0) for tag in tags)
+
+    def bump(self, tags):
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+
+class RedisBackend:
+    """Same interface, stored in Redis so every worker shares it"""
+
+    def __init__(self, url, prefix='fragment'):
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        data = self._client.get(f'{self.prefix}:{key}')
+        return pickle.loads(data) if data else None
+
+    def set(self, key, value, ttl):
+        self._client.set(f'{self.prefix}:{key}', pickle.dumps(value), ex=max(int(ttl), 1))
+
+    def tag_versions(self, tags):
+        if not tags:
+            return ()
+        return tuple(int(value or 0) for value in self._client.mget([f'{self.prefix}-tag:{tag}' for tag in tags]))
+
+    def bump(self, tags):
+        pipeline = self._client.pipeline()
+        for tag in tags:
+            pipeline.incr(f'{self.prefix}-tag:{tag}')
+        pipeline.execute()
+
+
+class FragmentCache:
+    def __init__(self, backend, ttl=60):
+        self.backend = backend
+        self.ttl = ttl
+
+    def get_or_build(self, key, builder, tags=(), ttl=None):
+        tags = tuple(tags)
+        # Versions are read before building, so a write that lands while we
+        # build leaves this entry already outdated rather than stale for a TTL
+        versions = self.backend.tag_versions(tags)
+        entry = self.backend.get(key)
+        if entry is not None and entry[1] == versions:
+            return entry[0]
+
+        value = builder()
+        self.backend.set(key, (value, versions), ttl or self.ttl)
+        return value
+
+    def invalidate(self, tags):
+        if tags:
+            self.backend.bump(sorted(tags))
+
+
+def get_fragment_cache():
+    """The current app's cache, created on first use"""
+    cache = current_app.extensions.get('fragment_cache')
+    if cache is None:
+        url = current_app.config.get('FRAGMENT_CACHE_URL')
+        if url and redis:
+            backend = RedisBackend(url)
+        else:
+            backend = MemoryBackend(current_app.config.get('FRAGMENT_CACHE_SIZE', 512))
+        cache = current_app.extensions['fragment_cache'] = FragmentCache(
+            backend, ttl=current_app.config.get('FRAGMENT_CACHE_TTL', 60)
+        )
+    return cache
+
+
+def fragment(name, builder, tags=(), ttl=None):
+    """Plain data for one dashboard tile, cached per role"""
+    if not current_app.config.get('FRAGMENT_CACHE_ENABLED', True):
+        return builder()
+
+    role = current_user.role if current_user.is_authenticated else 'anonymous'
+    return get_fragment_cache().get_or_build(f'{role}:{name}', builder, tags, ttl)
+
+
+def invalidate_tags(*tags):
+    get_fragment_cache().invalidate(set(tags))
+
+
+def _remember_tables(session, tables):
+    tags = {tag for table in tables for tag in TAG_TABLES.get(table, ())}
+    if tags:
+        session.info.setdefault('fragment_tags', set()).update(tags)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_flushed_tables(session, flush_context, instances):
+    _remember_tables(session, {getattr(obj, '__tablename__', None)
+                               for obj in session.new | session.dirty | session.deleted})
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_tables(orm_execute_state):
+    # Bulk UPDATE/INSERT/DELETE statements (stock claims, upserts) bypass the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        _remember_tables(orm_execute_state.session, {getattr(table, 'name', None)})
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_tags(session):
+    tags = session.info.pop('fragment_tags', None)
+    if tags and has_app_context():
+        # Created if need be: with a shared backend other workers hold the entries
+        get_fragment_cache().invalidate(tags)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_tags(session):
+    session.info.pop('fragment_tags', None)
@@ -0,0 +1,216 @@
+"""Rules-driven commission calculation.
+
+A period's sales invoices (credited to Invoice.created_by) and delivered repair
+jobs (credited to RepairJob.technician_id) are loaded as plain column lists.
+Per-employee totals pick a tier from COMMISSION_RULES for the employee's role,
+and the rate is then applied to every source row in one pass. Tiers apply to
+the whole month, so a change to one invoice can move all of that employee's
+commissions; incremental runs therefore recompute every employee who has a
+source changed since the last run, and nobody else.
+
+A source is changed when its updated_at is past the last run, and also when
+a pending commission no longer agrees with it: the invoice or job is gone,
+was re-priced or re-credited, or no longer qualifies (a repair invoice, a
+job no longer delivered). The second check catches edits made by bulk SQL,
+which skip updated_at; such stale rows are deleted on every run and their
+employees recomputed. A source moved to another month keeps its commission
+until that month's run; this month's employee is recomputed when the move
+went through the ORM (updated_at), otherwise only by a full run.
+
+Paid commissions are never touched. Pending ones are replaced in bulk.
+"""
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from app import db
+from modules.models import Commission, CommissionRun, Invoice, RepairJob, User
+from modules.attendance import month_bounds
+
+CHUNK_SIZE = 500
+AMOUNT_TOLERANCE = 0.005  # stored sale amounts are compared with a rounding margin
+
+
+def tier_rate(tiers, total):
+    """Rate (%) of the highest tier whose threshold the total has reached"""
+    if not tiers:
+        return 0.0
+    tiers = sorted(tiers)
+    index = bisect_right([threshold for threshold, _ in tiers], total) - 1
+    return tiers[index][1] if index >= 0 else 0.0
+
+
+def apply_rules(source, source_ids, employee_ids, amounts, roles, rules):
+    """Commission rows for parallel source/employee/amount lists"""
+    totals = defaultdict(float)
+    for employee_id, amount in zip(employee_ids, amounts):
+        totals[employee_id] += amount
+
+    rates = {
+        employee_id: tier_rate(rules.get(roles.get(employee_id), {}).get(source), total)
+        for employee_id, total in totals.items()
+    }
+    rate_column = [rates[employee_id] for employee_id in employee_ids]
+    commission_column = [round(amount * rate / 100, 2) for amount, rate in zip(amounts, rate_column)]
+
+    link = 'invoice_id' if source == 'sales' else 'repair_job_id'
+    other = 'repair_job_id' if source == 'sales' else 'invoice_id'
+    return [
+        {'employee_id': employee_id, link: source_id, other: None, 'sale_amount': amount,
+         'commission_rate': rate, 'commission_amount': commission, 'status': 'pending'}
+        for source_id, employee_id, amount, rate, commission
+        in zip(source_ids, employee_ids, amounts, rate_column, commission_column)
+        if commission > 0
+    ]
+
+
+def calculate_commissions(period, employee_id=None, full=False):
+    """Compute commissions for a YYYY-MM period; the caller commits.
+
+    Without full=True only employees with invoices or repair jobs changed since
+    the previous run of the period are recomputed. Returns a summary dict.
+    """
+    started_at = datetime.utcnow()
+    start_date, end_date = month_bounds(period)
+    start = datetime.combine(start_date, datetime.min.time())
+    end = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+    rules = current_app.config.get('COMMISSION_RULES', {})
+
+    run = CommissionRun.query.filter_by(period=period).first()
+    incremental = run is not None and not full and employee_id is None
+
+    sales = db.session.query(Invoice.id, Invoice.created_by, Invoice.total - Invoice.tax).filter(
+        Invoice.date >= start, Invoice.date < end,
+        Invoice.created_by.isnot(None),
+        Invoice.repair_job_id.is_(None)  # repair invoices are credited to the technician
+    )
+    repairs = db.session.query(RepairJob.id, RepairJob.technician_id, RepairJob.final_cost).filter(
+        RepairJob.delivered_date >= start, RepairJob.delivered_date < end,
+        RepairJob.status == 'delivered',
+        RepairJob.technician_id.isnot(None)
+    )
+
+    stale_sales = _stale_sales(start, end)
+    stale_repairs = _stale_repairs(start, end)
+
+    if employee_id:
+        sales = sales.filter(Invoice.created_by == employee_id)
+        repairs = repairs.filter(RepairJob.technician_id == employee_id)
+        stale_sales = [row for row in stale_sales if row[1] == employee_id]
+        stale_repairs = [row for row in stale_repairs if row[1] == employee_id]
+    elif incremental:
+        sellers = {seller for (seller,) in sales.filter(
+            Invoice.updated_at > run.ran_at
+        ).with_entities(Invoice.created_by).distinct()}
+        sellers |= {employee for row in stale_sales for employee in row[1:] if employee}
+        sellers |= _moved_away(Commission.invoice_id, Invoice, run.ran_at, start, end)
+        technicians = {technician for (technician,) in repairs.filter(
+            RepairJob.updated_at > run.ran_at
+        ).with_entities(RepairJob.technician_id).distinct()}
+        technicians |= {employee for row in stale_repairs for employee in row[1:] if employee}
+        technicians |= _moved_away(Commission.repair_job_id, RepairJob, run.ran_at, start, end)
+        sales = sales.filter(Invoice.created_by.in_(sellers))
+        repairs = repairs.filter(RepairJob.technician_id.in_(technicians))
+
+    sales = sales.all()
+    repairs = repairs.all()
+
+    stale_ids = [row[0] for row in stale_sales + stale_repairs]
+    for chunk in _chunks(stale_ids):
+        db.session.execute(db.delete(Commission).where(Commission.id.in_(chunk)))
+
+    employees = {row[1] for row in sales} | {row[1] for row in repairs}
+    roles = dict(db.session.query(User.id, User.role).filter(User.id.in_(employees))) if employees else {}
+
+    rows = []
+    for source, records, column in (('sales', sales, Commission.invoice_id),
+                                    ('repairs', repairs, Commission.repair_job_id)):
+        if not records:
+            continue
+        source_ids, employee_ids, amounts = (list(values) for values in zip(*records))
+        amounts = [amount or 0.0 for amount in amounts]
+
+        paid = set()
+        for chunk in _chunks(source_ids):
+            paid.update(source_id for (source_id,) in db.session.query(column).filter(
+                column.in_(chunk), Commission.status == 'paid'
+            ))
+            db.session.execute(db.delete(Commission).where(column.in_(chunk), Commission.status == 'pending'))
+
+        link = column.key
+        rows.extend(row for row in apply_rules(source, source_ids, employee_ids, amounts, roles, rules)
+                    if row[link] not in paid)
+
+    if rows:
+        db.session.execute(db.insert(Commission), rows)
+
+    if employee_id is None:
+        if run is None:
+            run = CommissionRun(period=period)
+            db.session.add(run)
+        run.ran_at = started_at
+        run.employees = len(employees)
+        run.commissions = len(rows)
+
+    return {'employees': len(employees), 'commissions': len(rows), 'incremental': incremental,
+            'stale': len(stale_ids)}
+
+
+def _stale_sales(start, end):
+    """(commission id, employee id, current seller) of pending sales commissions out of step with their invoice
+
+    Covers deleted invoices and, for invoices dated in the period, a different
+    seller or amount or a repair link.
+    """
+    return db.session.query(Commission.id, Commission.employee_id, Invoice.created_by).outerjoin(
+        Invoice, Commission.invoice_id == Invoice.id
+    ).filter(
+        Commission.status == 'pending',
+        Commission.invoice_id.isnot(None),
+        db.or_(
+            Invoice.id.is_(None),
+            db.and_(Invoice.date >= start, Invoice.date < end, db.or_(
+                Invoice.created_by.is_(None),
+                Invoice.created_by != Commission.employee_id,
+                Invoice.repair_job_id.isnot(None),
+                db.func.abs(db.func.coalesce(Invoice.total - Invoice.tax, 0) - Commission.sale_amount) > AMOUNT_TOLERANCE
+            ))
+        )
+    ).all()
+
+
+def _stale_repairs(start, end):
+    """(commission id, employee id, current technician) of pending repair commissions out of step with their job"""
+    return db.session.query(Commission.id, Commission.employee_id, RepairJob.technician_id).outerjoin(
+        RepairJob, Commission.repair_job_id == RepairJob.id
+    ).filter(
+        Commission.status == 'pending',
+        Commission.repair_job_id.isnot(None),
+        db.or_(
+            RepairJob.id.is_(None),
+            db.and_(RepairJob.delivered_date >= start, RepairJob.delivered_date < end, db.or_(
+                RepairJob.status != 'delivered',
+                RepairJob.technician_id.is_(None),
+                RepairJob.technician_id != Commission.employee_id,
+                db.func.abs(db.func.coalesce(RepairJob.final_cost, 0) - Commission.sale_amount) > AMOUNT_TOLERANCE
+            ))
+        )
+    ).all()
+
+
+def _moved_away(column, source, changed_since, start, end):
+    """Employees with a pending commission whose source changed and is now dated outside the period"""
+    date = Invoice.date if source is Invoice else RepairJob.delivered_date
+    return {employee_id for (employee_id,) in db.session.query(Commission.employee_id).join(
+        source, column == source.id
+    ).filter(
+        Commission.status == 'pending',
+        source.updated_at > changed_since,
+        db.or_(date.is_(None), date < start, date >= end)
+    ).distinct()}
+
+
+def _chunks(values):
+    for start in range(0, len(values), CHUNK_SIZE):
+        yield values[start:start + CHUNK_SIZE]
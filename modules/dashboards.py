@@ -0,0 +1,143 @@
+"""Dashboard tiles as plain, cacheable data.
+
+Each builder returns dicts, lists and scalars only (no ORM instances), with
+the same keys the dashboard templates read, so the result can be kept in
+the fragment cache (see modules/cache.py) and shared between workers.
+"""
+from app import db
+from modules.models import Attendance, Customer, Invoice, LeaveRequest, Product, ProductCategory, RepairJob, \
+    StockItem, User
+
+OPEN_REPAIR_STATUSES = ['received', 'diagnostic', 'repairing', 'waiting_parts']
+
+
+def sales_summary(day):
+    """Totals for invoices dated `day`, in one aggregate query"""
+    total, count, cash = db.session.query(
+        db.func.coalesce(db.func.sum(Invoice.total), 0),
+        db.func.count(Invoice.id),
+        db.func.coalesce(db.func.sum(db.case((Invoice.payment_method == 'cash', Invoice.total), else_=0)), 0)
+    ).filter(db.func.date(Invoice.date) == day).one()
+    return {'today_sales': float(total), 'today_transactions': count, 'today_cash': float(cash)}
+
+
+def recent_invoices(limit=10):
+    rows = db.session.query(
+        Invoice.id, Invoice.invoice_number, Invoice.customer_name, Invoice.date, Invoice.total, Invoice.payment_status
+    ).order_by(Invoice.date.desc()).limit(limit)
+    return [row._asdict() for row in rows]
+
+
+def _available_counts():
+    return db.session.query(
+        StockItem.product_id, db.func.count(StockItem.id).label('available')
+    ).filter(StockItem.status == 'available').group_by(StockItem.product_id).subquery()
+
+
+def stock_summary():
+    """Active product count and the purchase value of available stock"""
+    counts = _available_counts()
+    total_products, total_value = db.session.query(
+        db.func.count(Product.id),
+        db.func.coalesce(db.func.sum(db.func.coalesce(counts.c.available, 0) * Product.purchase_price), 0)
+    ).outerjoin(counts, counts.c.product_id == Product.id).filter(Product.is_active == True).one()
+    return {'total_products': total_products, 'total_value': float(total_value)}
+
+
+def low_stock():
+    """Active products at or below their minimum level, counted from stock items"""
+    counts = _available_counts()
+    stock_count = db.func.coalesce(counts.c.available, 0)
+    rows = db.session.query(
+        Product.id, Product.name, Product.sku, Product.min_stock_level, ProductCategory.name, stock_count
+    ).outerjoin(counts, counts.c.product_id == Product.id).outerjoin(
+        ProductCategory, Product.category_id == ProductCategory.id
+    ).filter(
+        Product.is_active == True,
+        stock_count <= Product.min_stock_level
+    ).order_by(Product.id)
+
+    return [{
+        'product': {
+            'id': product_id,
+            'name': name,
+            'sku': sku,
+            'min_stock_level': min_level,
+            'category': {'name': category} if category else None
+        },
+        'stock_count': count
+    } for product_id, name, sku, min_level, category, count in rows]
+
+
+def recent_stock(limit=10):
+    rows = db.session.query(
+        StockItem.created_at, Product.name, StockItem.stock_type, StockItem.quantity, StockItem.status,
+        StockItem.notes
+    ).join(Product, StockItem.product_id == Product.id).order_by(StockItem.created_at.desc()).limit(limit)
+
+    return [{
+        'created_at': created_at,
+        'product': {'name': name},
+        'stock_type': stock_type,
+        'quantity': quantity,
+        'status': status,
+        'notes': notes
+    } for created_at, name, stock_type, quantity, status, notes in rows]
+
+
+def repair_summary(day):
+    total_jobs, pending_jobs, completed_today = db.session.query(
+        db.func.count(RepairJob.id),
+        db.func.count(db.case((RepairJob.status.in_(OPEN_REPAIR_STATUSES), RepairJob.id))),
+        db.func.count(db.case((db.and_(RepairJob.status == 'completed',
+                                       db.func.date(RepairJob.completed_date) == day), RepairJob.id)))
+    ).one()
+    status_counts = dict(db.session.query(RepairJob.status, db.func.count(RepairJob.id)).group_by(RepairJob.status))
+    return {'total_jobs': total_jobs, 'pending_jobs': pending_jobs, 'completed_today': completed_today,
+            'status_counts': status_counts}
+
+
+def recent_jobs(limit=10):
+    rows = db.session.query(
+        RepairJob.id, RepairJob.job_number, Customer.name, RepairJob.brand, RepairJob.model, RepairJob.status,
+        User.username, RepairJob.created_at
+    ).outerjoin(Customer, RepairJob.customer_id == Customer.id).outerjoin(
+        User, RepairJob.technician_id == User.id
+    ).order_by(RepairJob.created_at.desc()).limit(limit)
+
+    return [{
+        'id': job_id,
+        'job_number': job_number,
+        'customer': {'name': customer} if customer else None,
+        'brand': brand,
+        'model': model,
+        'status': status,
+        'technician': {'username': technician} if technician else None,
+        'created_at': created_at
+    } for job_id, job_number, customer, brand, model, status, technician, created_at in rows]
+
+
+def staff_summary():
+    total_employees, active_employees, technicians = db.session.query(
+        db.func.count(User.id),
+        db.func.count(db.case((User.is_active == True, User.id))),
+        db.func.count(db.case((db.and_(User.role == 'technician', User.is_active == True), User.id)))
+    ).one()
+    pending_leaves = db.session.query(db.func.count(LeaveRequest.id)).filter(LeaveRequest.status == 'pending').scalar()
+    return {'total_employees': total_employees, 'active_employees': active_employees,
+            'technicians': technicians, 'pending_leaves': pending_leaves}
+
+
+def attendance_on(day):
+    rows = db.session.query(
+        User.id, User.username, User.email, User.role, Attendance.check_in, Attendance.check_out,
+        Attendance.total_hours, Attendance.status
+    ).join(User, Attendance.employee_id == User.id).filter(db.func.date(Attendance.date) == day)
+
+    return [{
+        'employee': {'id': user_id, 'username': username, 'email': email, 'role': role},
+        'check_in': check_in,
+        'check_out': check_out,
+        'total_hours': total_hours,
+        'status': status
+    } for user_id, username, email, role, check_in, check_out, total_hours, status in rows]
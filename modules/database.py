@@ -0,0 +1,275 @@
+"""Database engine profiles.
+
+DATABASE_PROFILE picks how the engine is tuned for the current environment:
+
+- production: SQLite runs in WAL mode so readers never block the till that
+  is writing, with synchronous=NORMAL, a larger page cache, memory-mapped
+  reads, in-memory temp tables and a busy timeout so a briefly locked
+  database is waited on instead of failing. Server databases get a sized
+  pool with pre-ping and connection recycling.
+- development: WAL and a busy timeout, default cache, small pool.
+- baseline: driver defaults, i.e. the behaviour before profiles existed.
+
+SQLITE_PRAGMAS and SQLALCHEMY_ENGINE_OPTIONS in the config override
+individual profile values.
+
+With REPLICA_DATABASE_URI set, views decorated with @read_replica send their
+reads to the replica so month-end reporting does not compete with the tills
+for the primary. Writes in those views, and anything flushed, still go to
+the primary, and so does everything when the replica lags by more than
+REPLICA_MAX_STALENESS or cannot be reached. A SQLite file can stand in for
+a replica locally; sync_replica() refreshes it from the primary with the
+SQLite backup API, every REPLICA_SYNC_INTERVAL seconds or via
+`flask sync-replica`.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functools import wraps
+
+import click
+from flask import current_app, g, has_request_context
+from flask.cli import with_appcontext
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.selectable import CompoundSelect, Select
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+
+SQLITE_PRAGMAS = {
+    'baseline': {},
+    'development': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000
+    },
+    'production': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',  # durable at checkpoints; WAL keeps the file consistent
+        'busy_timeout': 5000,  # ms a writer waits for the lock before failing
+        'cache_size': -65536,  # negative means KiB, so 64MB per connection
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY'
+    }
+}
+
+POOL_OPTIONS = {
+    'baseline': {},
+    'development': {
+        'pool_size': 5,
+        'max_overflow': 5,
+        'pool_pre_ping': True
+    },
+    'production': {
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_timeout': 10,  # seconds a request waits for a connection
+        'pool_recycle': 1800,  # seconds, stays under typical server idle timeouts
+        'pool_pre_ping': True
+    }
+}
+
+
+def is_sqlite(uri):
+    return uri.startswith('sqlite')
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured profile"""
+    profile = _profile(config)
+    options = {} if is_sqlite(config['SQLALCHEMY_DATABASE_URI']) else dict(POOL_OPTIONS[profile])
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def sqlite_pragmas(config):
+    pragmas = dict(SQLITE_PRAGMAS[_profile(config)])
+    pragmas.update(config.get('SQLITE_PRAGMAS') or {})
+    return pragmas
+
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica inside @read_replica views"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        # Only plain SELECTs qualify; ORM bulk writes arrive without a clause
+        if (bind is None and not self._flushing and isinstance(clause, (Select, CompoundSelect))
+                and has_request_context() and g.get('read_replica')):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaRouter:
+    """Tracks whether the replica is fresh enough to serve reports"""
+
+    def __init__(self, engine, max_staleness=300, check_interval=5):
+        self.engine = engine
+        self.max_staleness = max_staleness
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._usable = False
+
+    def lag(self):
+        """Seconds the replica is behind the primary, or None when unreachable"""
+        try:
+            if is_sqlite(str(self.engine.url)):
+                return _sqlite_lag(self.engine.url.database)
+            if self.engine.dialect.name == 'postgresql':
+                with self.engine.connect() as connection:
+                    lag = connection.execute(text(
+                        'SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())'
+                    )).scalar()
+                return float(lag or 0)
+            # Other servers can't report lag portably; reachable counts as fresh
+            with self.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            return 0.0
+        except (SQLAlchemyError, OSError) as e:
+            logger.warning('Read replica unavailable: %s', e)
+            return None
+
+    def usable(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is None or now - self._checked_at >= self.check_interval:
+                lag = self.lag()
+                self._usable = lag is not None and lag <= self.max_staleness
+                self._checked_at = now
+            return self._usable
+
+
+def read_replica(view):
+    """Serve this view's reads from the replica when it is fresh enough"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        router = current_app.extensions.get('replica')
+        if router is None or not router.usable():
+            return view(*args, **kwargs)
+
+        g.read_replica = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            g.pop('read_replica', None)
+
+    return wrapper
+
+
+def sync_replica(primary, replica):
+    """Copy the primary SQLite database into the stand-in replica"""
+    source = primary.raw_connection()
+    try:
+        target = sqlite3.connect(replica.url.database, timeout=30)
+        try:
+            source.driver_connection.backup(target)
+        finally:
+            target.close()
+    finally:
+        source.close()
+    # The marker's mtime records when the last complete copy was taken
+    with open(_sync_marker(replica.url.database), 'a'):
+        pass
+    os.utime(_sync_marker(replica.url.database))
+
+
+def init_database(app):
+    """Apply the engine profile and bind db (plus any replica) to the app"""
+    from app import db
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    replica_uri = app.config.get('REPLICA_DATABASE_URI')
+    if replica_uri:
+        app.config['SQLALCHEMY_BINDS'] = dict(app.config.get('SQLALCHEMY_BINDS') or {}, **{REPLICA_BIND: replica_uri})
+    db.init_app(app)
+
+    pragmas = sqlite_pragmas(app.config)
+    with app.app_context():
+        engines = dict(db.engines)
+    for engine in engines.values():
+        if is_sqlite(str(engine.url)) and pragmas:
+            in_memory = engine.url.database in (None, '', ':memory:')
+            event.listen(engine, 'connect', _pragma_setter(pragmas, in_memory))
+
+    app.cli.add_command(sync_replica_command)
+    if not replica_uri:
+        return
+
+    app.extensions['replica'] = ReplicaRouter(
+        engines[REPLICA_BIND],
+        max_staleness=app.config.get('REPLICA_MAX_STALENESS', 300),
+        check_interval=app.config.get('REPLICA_CHECK_INTERVAL', 5)
+    )
+    interval = app.config.get('REPLICA_SYNC_INTERVAL', 0)
+    if interval and is_sqlite(app.config['SQLALCHEMY_DATABASE_URI']) and is_sqlite(replica_uri):
+        threading.Thread(target=_sync_forever, args=(engines[None], engines[REPLICA_BIND], interval),
+                         name='replica-sync', daemon=True).start()
+
+
+@click.command('sync-replica')
+@with_appcontext
+def sync_replica_command():
+    """Refresh the SQLite stand-in replica from the primary"""
+    from app import db
+
+    if REPLICA_BIND not in db.engines:
+        raise click.ClickException('REPLICA_DATABASE_URI is not set')
+    if not (is_sqlite(str(db.engine.url)) and is_sqlite(str(db.engines[REPLICA_BIND].url))):
+        raise click.ClickException('Only a SQLite replica of a SQLite primary can be synced here')
+
+    started = time.perf_counter()
+    sync_replica(db.engine, db.engines[REPLICA_BIND])
+    click.echo(f'Replica synced in {time.perf_counter() - started:.2f}s')
+
+
+def _sync_forever(primary, replica, interval):
+    while True:
+        try:
+            sync_replica(primary, replica)
+        except (sqlite3.Error, SQLAlchemyError, OSError):
+            logger.exception('Replica sync failed')
+        time.sleep(interval)
+
+
+def _sync_marker(path):
+    return path + '.synced'
+
+
+def _sqlite_lag(path):
+    # Never synced (the file alone may just be an empty database) counts as unreachable
+    if not path or not os.path.exists(_sync_marker(path)):
+        return None
+    return max(0.0, time.time() - os.path.getmtime(_sync_marker(path)))
+
+
+def _profile(config):
+    profile = config.get('DATABASE_PROFILE') or 'production'
+    if profile not in SQLITE_PRAGMAS:
+        raise ValueError(f'Unknown DATABASE_PROFILE {profile!r}, expected one of {", ".join(SQLITE_PRAGMAS)}')
+    return profile
+
+
+def _pragma_setter(pragmas, in_memory):
+    # busy_timeout goes first so the journal_mode switch itself can wait for the lock
+    ordered = sorted(pragmas.items(), key=lambda item: item[0] != 'busy_timeout')
+    if in_memory:
+        ordered = [(name, value) for name, value in ordered if name != 'journal_mode']
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in ordered:
+                cursor.execute(f'PRAGMA {name}={value}')
+                if name == 'journal_mode':
+                    mode = cursor.fetchone()[0]
+                    if mode.lower() != str(value).lower():
+                        logger.warning('SQLite journal_mode is %s, wanted %s', mode, value)
+        finally:
+            cursor.close()
+
+    return set_pragmas
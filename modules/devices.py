@@ -0,0 +1,231 @@
+"""Device registry keyed by normalized IMEI / serial number.
+
+The same handset can appear as stock we sold and later as a repair job. Every
+such touch point is recorded as a DeviceEvent against one Device row, so the
+whole history of a handset is a single indexed lookup.
+"""
+import re
+from datetime import datetime
+
+from app import db
+from modules.models import Customer, Device, DeviceEvent, Invoice, InvoiceItem, RepairJob, StockItem
+
+
+def normalize_identifier(value):
+    """Canonical form used for matching: upper-case with separators removed"""
+    if not value:
+        return None
+    return re.sub(r'[^0-9A-Za-z]', '', value).upper() or None
+
+
+def get_or_create_device(imei=None, serial_number=None, **attrs):
+    """Find the device for an IMEI/serial, registering it on first sight"""
+    identifier = normalize_identifier(imei) or normalize_identifier(serial_number)
+    if not identifier:
+        return None
+
+    device = Device.query.filter_by(identifier=identifier).first()
+    if device is None:
+        device = Device(identifier=identifier, imei=imei or None, serial_number=serial_number or None, **attrs)
+        db.session.add(device)
+        db.session.flush()
+    else:
+        # Fill in details we didn't know when the device was first seen
+        for key, value in dict(attrs, imei=imei, serial_number=serial_number).items():
+            if value and not getattr(device, key):
+                setattr(device, key, value)
+
+    return device
+
+
+def record_device_event(event_type, imei=None, serial_number=None, occurred_at=None,
+                        customer_id=None, brand=None, model=None, product_id=None, **links):
+    """Append an event to a device's timeline; links are stock_item_id, invoice_id or repair_job_id"""
+    device = get_or_create_device(imei, serial_number, brand=brand, model=model, product_id=product_id)
+    if device is None:
+        return None
+
+    if customer_id:
+        device.customer_id = customer_id
+
+    db.session.add(DeviceEvent(
+        device_id=device.id,
+        event_type=event_type,
+        customer_id=customer_id,
+        occurred_at=occurred_at or datetime.utcnow(),
+        **links
+    ))
+    return device
+
+
+def record_job_event(job, event_type, occurred_at=None, invoice_id=None):
+    """Device event for a repair job, if the job carries an IMEI or serial"""
+    return record_device_event(
+        event_type,
+        imei=job.imei,
+        serial_number=job.serial_number,
+        occurred_at=occurred_at,
+        customer_id=job.customer_id,
+        brand=job.brand,
+        model=job.model,
+        repair_job_id=job.id,
+        invoice_id=invoice_id
+    )
+
+
+def record_sale(invoice, stock_item_ids):
+    """Device events for the serialized units sold on an invoice"""
+    if not stock_item_ids:
+        return
+
+    items = db.session.query(
+        StockItem.id, StockItem.imei, StockItem.serial_number, StockItem.product_id
+    ).filter(
+        StockItem.id.in_(stock_item_ids),
+        db.or_(StockItem.imei.isnot(None), StockItem.serial_number.isnot(None))
+    ).all()
+
+    for item in items:
+        record_device_event(
+            'sold',
+            imei=item.imei,
+            serial_number=item.serial_number,
+            occurred_at=invoice.date,
+            customer_id=invoice.customer_id,
+            product_id=item.product_id,
+            stock_item_id=item.id,
+            invoice_id=invoice.id
+        )
+
+
+def device_timeline(code):
+    """Device details and its full event history, or None if never seen"""
+    identifier = normalize_identifier(code)
+    if not identifier:
+        return None
+
+    rows = db.session.query(
+        Device, DeviceEvent, Invoice.invoice_number, RepairJob.job_number, RepairJob.status, Customer.name
+    ).outerjoin(
+        DeviceEvent, DeviceEvent.device_id == Device.id
+    ).outerjoin(
+        Invoice, DeviceEvent.invoice_id == Invoice.id
+    ).outerjoin(
+        RepairJob, DeviceEvent.repair_job_id == RepairJob.id
+    ).outerjoin(
+        Customer, DeviceEvent.customer_id == Customer.id
+    ).filter(
+        Device.identifier == identifier
+    ).order_by(DeviceEvent.occurred_at).all()
+
+    if not rows:
+        return None
+
+    device = rows[0][0]
+    return {
+        'device': {
+            'id': device.id,
+            'identifier': device.identifier,
+            'imei': device.imei,
+            'serial_number': device.serial_number,
+            'brand': device.brand,
+            'model': device.model,
+            'product_id': device.product_id,
+            'customer_id': device.customer_id
+        },
+        'events': [{
+            'type': event.event_type,
+            'occurred_at': event.occurred_at.isoformat(),
+            'stock_item_id': event.stock_item_id,
+            'invoice_id': event.invoice_id,
+            'invoice_number': invoice_number,
+            'repair_job_id': event.repair_job_id,
+            'job_number': job_number,
+            'job_status': job_status,
+            'customer_id': event.customer_id,
+            'customer_name': customer_name
+        } for _, event, invoice_number, job_number, job_status, customer_name in rows if event is not None]
+    }
+
+
+def backfill_devices():
+    """Build the registry from existing stock, sales and repair rows.
+
+    Safe to re-run: devices are matched by identifier and events already
+    recorded are skipped. Returns (devices_added, events_added).
+    """
+    devices = {}
+    events = []
+
+    def register(imei, serial_number, **attrs):
+        identifier = normalize_identifier(imei) or normalize_identifier(serial_number)
+        if identifier:
+            known = devices.setdefault(identifier, {'identifier': identifier, 'imei': imei or None,
+                                                    'serial_number': serial_number or None})
+            for key, value in attrs.items():
+                if value is not None:
+                    known[key] = value
+        return identifier
+
+    stock = db.session.query(
+        StockItem.id, StockItem.imei, StockItem.serial_number, StockItem.product_id, StockItem.created_at,
+        Invoice.id, Invoice.date, Invoice.customer_id
+    ).outerjoin(
+        InvoiceItem, InvoiceItem.stock_item_id == StockItem.id
+    ).outerjoin(
+        Invoice, InvoiceItem.invoice_id == Invoice.id
+    ).filter(
+        db.or_(StockItem.imei.isnot(None), StockItem.serial_number.isnot(None))
+    ).order_by(StockItem.created_at)
+
+    for item_id, imei, serial, product_id, created_at, invoice_id, sold_at, customer_id in stock:
+        identifier = register(imei, serial, product_id=product_id)
+        if not identifier:
+            continue
+        events.append((identifier, 'stocked', created_at, {'stock_item_id': item_id}))
+        if invoice_id:
+            register(imei, serial, customer_id=customer_id)
+            events.append((identifier, 'sold', sold_at,
+                           {'stock_item_id': item_id, 'invoice_id': invoice_id, 'customer_id': customer_id}))
+
+    repairs = db.session.query(
+        RepairJob.id, RepairJob.imei, RepairJob.serial_number, RepairJob.brand, RepairJob.model,
+        RepairJob.customer_id, RepairJob.created_at, RepairJob.completed_date, RepairJob.delivered_date
+    ).order_by(RepairJob.created_at)
+
+    for job_id, imei, serial, brand, model, customer_id, created_at, completed, delivered in repairs:
+        identifier = register(imei, serial, brand=brand, model=model, customer_id=customer_id)
+        if not identifier:
+            continue
+        links = {'repair_job_id': job_id, 'customer_id': customer_id}
+        events.append((identifier, 'repair_intake', created_at, links))
+        if completed:
+            events.append((identifier, 'repair_completed', completed, links))
+        if delivered:
+            events.append((identifier, 'repair_delivered', delivered, links))
+
+    existing = {identifier for (identifier,) in db.session.query(Device.identifier)}
+    new_devices = [attrs for identifier, attrs in devices.items() if identifier not in existing]
+    if new_devices:
+        db.session.execute(db.insert(Device), new_devices)
+
+    device_ids = dict(db.session.query(Device.identifier, Device.id))
+    recorded = set(db.session.query(
+        DeviceEvent.device_id, DeviceEvent.event_type, DeviceEvent.stock_item_id,
+        DeviceEvent.invoice_id, DeviceEvent.repair_job_id
+    ))
+
+    rows = []
+    for identifier, event_type, occurred_at, links in events:
+        device_id = device_ids[identifier]
+        key = (device_id, event_type, links.get('stock_item_id'), links.get('invoice_id'), links.get('repair_job_id'))
+        if key in recorded:
+            continue
+        recorded.add(key)
+        rows.append(dict({'stock_item_id': None, 'invoice_id': None, 'repair_job_id': None, 'customer_id': None},
+                         device_id=device_id, event_type=event_type, occurred_at=occurred_at, **links))
+
+    if rows:
+        db.session.execute(db.insert(DeviceEvent), rows)
+
+    return len(new_devices), len(rows)
@@ -2,8 +2,17 @@ from flask import Blueprint, render_template, request, jsonify, flash, redirect,
 from flask_login import login_required, current_user
 from app import db
 from modules.models import User, Attendance, LeaveRequest, Commission
-from datetime import datetime, date, timedelta
+from datetime import datetime, date
+import csv
+import itertools
+import click
 from modules.forms import EmployeeForm, AttendanceForm, LeaveRequestForm
+from modules.attendance import month_bounds, monthly_totals, decide_leaves, close_shop, ingest_punches, \
+    close_month, close_months
+from modules.commission import calculate_commissions
+from modules.database import read_replica
+from modules.cache import fragment
+from modules import dashboards
 
 employee_bp = Blueprint('employee', __name__)
 
@@ -14,26 +23,17 @@ def employee_dashboard():
         flash('Access denied', 'danger')
         return redirect(url_for('index'))
     
-    total_employees = User.query.count()
-    active_employees = User.query.filter_by(is_active=True).count()
-    technicians = User.query.filter_by(role='technician', is_active=True).count()
-    
-    # Today's attendance
-    today_attendance = Attendance.query.filter(
-        db.func.date(Attendance.date) == date.today()
-    ).all()
-    
-    # Pending leave requests
-    pending_leaves = LeaveRequest.query.filter_by(
-        status='pending'
-    ).count()
+    # Tiles are cached per role until staff, attendance or leave change (modules/cache.py)
+    today = date.today()
+    summary = fragment('staff-summary', dashboards.staff_summary, tags=['staff'], ttl=300)
+    today_attendance = fragment(f'attendance:{today}', lambda: dashboards.attendance_on(today), tags=['staff'])
     
     return render_template('employee/dashboard.html',
-                         total_employees=total_employees,
-                         active_employees=active_employees,
-                         technicians=technicians,
+                         total_employees=summary['total_employees'],
+                         active_employees=summary['active_employees'],
+                         technicians=summary['technicians'],
                          today_attendance=today_attendance,
-                         pending_leaves=pending_leaves,
+                         pending_leaves=summary['pending_leaves'],
                          title='Employee Dashboard')
 
 @employee_bp.route('/employees')
@@ -226,8 +226,59 @@ def mark_attendance():
     
     return jsonify({'success': True})
 
+@employee_bp.route('/attendance/punches', methods=['POST'])
+@login_required
+def import_punches():
+    if current_user.role not in ['admin', 'manager']:
+        return jsonify({'success': False, 'message': 'Access denied'})
+    
+    data = request.get_json(silent=True) or {}
+    punches = data.get('punches')
+    
+    if not isinstance(punches, list):
+        return jsonify({'success': False, 'message': 'Expected a list of punches'}), 400
+    
+    # Sorted, paired and upserted per employee/day in bulk
+    result = ingest_punches(punches)
+    db.session.commit()
+    
+    return jsonify(dict(result, success=True))
+
+@employee_bp.cli.command('import-punches')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_punches_command(path):
+    """Load a clock device CSV export: employee_id,timestamp[,action]"""
+    with open(path, newline='') as f:
+        rows = csv.reader(f)
+        first = next(rows, None)
+        if first and not first[0].strip().isdigit():
+            first = None  # header row
+        result = ingest_punches(itertools.chain([first] if first else [], rows))
+    db.session.commit()
+    
+    click.echo(f"{result['received']} punches, {result['days']} days, {result['written']} written")
+    for conflict in result['conflicts']:
+        click.echo(f'  conflict: {conflict}')
+
+@employee_bp.cli.command('close-months')
+@click.option('--period', help='YYYY-MM to rebuild; by default every closed month without a rollup')
+def close_months_command(period):
+    """Persist attendance rollups for closed months (run nightly)"""
+    try:
+        if period:
+            close_month(period)
+            built = [period]
+        else:
+            built = close_months()
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    db.session.commit()
+    
+    click.echo(f"Rolled up {', '.join(built)}" if built else 'All closed months are rolled up')
+
 @employee_bp.route('/attendance-report')
 @login_required
+@read_replica
 def attendance_report():
     if current_user.role not in (['admin', 'manager']):
         flash('Access denied', 'danger')
@@ -236,44 +287,21 @@ def attendance_report():
     month_str = request.args.get('month', date.today().strftime('%Y-%m'))
     
     try:
-        year, month = map(int, month_str.split('-'))
-        start_date = date(year, month, 1)
-        
-        if month == 12:
-            end_date = date(year + 1, 1, 1) - timedelta(days=1)
-        else:
-            end_date = date(year, month + 1, 1) - timedelta(days=1)
+        start_date, end_date = month_bounds(month_str)
     except:
-        start_date = date(date.today().year, date.today().month, 1)
-        end_date = date.today()
+        start_date, end_date = month_bounds(date.today().strftime('%Y-%m'))
     
     # Get all employees
     employees = User.query.filter_by(is_active=True).all()
     
-    # Get attendance data for the month
-    attendance_data = []
+    # One grouped query, or the rollup close-months stored for closed months
+    totals = monthly_totals(start_date.strftime('%Y-%m'))
+    empty = {'present_days': 0, 'absent_days': 0, 'leave_days': 0, 'total_hours': 0.0}
     
-    for employee in employees:
-        records = Attendance.query.filter(
-            Attendance.employee_id == employee.id,
-            Attendance.date >= start_date,
-            Attendance.date <= end_date
-        ).all()
-        
-        # Calculate statistics
-        present_days = len([r for r in records if r.status == 'present'])
-        absent_days = len([r for r in records if r.status == 'absent'])
-        leave_days = len([r for r in records if r.status == 'leave'])
-        total_hours = sum(r.total_hours or 0 for r in records)
-        
-        attendance_data.append({
-            'employee': employee,
-            'present_days': present_days,
-            'absent_days': absent_days,
-            'leave_days': leave_days,
-            'total_hours': total_hours,
-            'records': records
-        })
+    attendance_data = [
+        dict(totals.get(employee.id, empty), employee=employee)
+        for employee in employees
+    ]
     
     return render_template('employee/attendance_report.html',
                          attendance_data=attendance_data,
@@ -331,39 +359,68 @@ def approve_leave(leave_id):
     leave_request = LeaveRequest.query.get_or_404(leave_id)
     action = request.form.get('action')  # 'approve' or 'reject'
     
+    if action not in ['approve', 'reject']:
+        flash('Invalid action', 'danger')
+        return redirect(url_for('employee.leave_requests'))
+    
+    if not decide_leaves([leave_request.id], action, current_user.id):
+        flash('Leave request has already been processed', 'warning')
+        return redirect(url_for('employee.leave_requests'))
+    
+    db.session.commit()
+    
     if action == 'approve':
-        leave_request.status = 'approved'
-        leave_request.approved_by = current_user.id
-        leave_request.approved_date = datetime.utcnow()
-        
-        # Create attendance records for leave days
-        current_date = leave_request.start_date
-        while current_date <= leave_request.end_date:
-            attendance = Attendance.query.filter_by(
-                employee_id=leave_request.employee_id,
-                date=current_date
-            ).first()
-            
-            if not attendance:
-                attendance = Attendance(
-                    employee_id=leave_request.employee_id,
-                    date=current_date,
-                    status='leave'
-                )
-                db.session.add(attendance)
-            
-            current_date += timedelta(days=1)
-        
         flash('Leave request approved', 'success')
-    elif action == 'reject':
-        leave_request.status = 'rejected'
-        leave_request.approved_by = current_user.id
-        leave_request.approved_date = datetime.utcnow()
+    else:
         flash('Leave request rejected', 'warning')
     
+    return redirect(url_for('employee.leave_requests'))
+
+@employee_bp.route('/approve-leaves', methods=['POST'])
+@login_required
+def approve_leaves():
+    if current_user.role not in ['admin', 'manager']:
+        flash('Access denied', 'danger')
+        return redirect(url_for('index'))
+    
+    leave_ids = request.form.getlist('leave_ids', type=int)
+    action = request.form.get('action')  # 'approve' or 'reject'
+    
+    if not leave_ids or action not in ['approve', 'reject']:
+        flash('Select leave requests and an action', 'danger')
+        return redirect(url_for('employee.leave_requests'))
+    
+    decided = decide_leaves(leave_ids, action, current_user.id)
     db.session.commit()
+    
+    flash(f'{len(decided)} leave request(s) {action}d', 'success' if action == 'approve' else 'warning')
     return redirect(url_for('employee.leave_requests'))
 
+@employee_bp.route('/holidays', methods=['POST'])
+@login_required
+def add_holiday():
+    if current_user.role != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('index'))
+    
+    try:
+        start_date = datetime.strptime(request.form.get('start_date', ''), '%Y-%m-%d').date()
+        end_date = datetime.strptime(request.form.get('end_date') or request.form.get('start_date'), '%Y-%m-%d').date()
+    except ValueError:
+        flash('Invalid date', 'danger')
+        return redirect(url_for('employee.attendance'))
+    
+    if end_date < start_date:
+        flash('End date must be after start date', 'danger')
+        return redirect(url_for('employee.attendance'))
+    
+    # Public holiday or shop closure for everyone, in one upsert
+    close_shop(start_date, end_date, request.form.get('notes') or 'Public holiday')
+    db.session.commit()
+    
+    flash(f'Holiday recorded from {start_date} to {end_date}', 'success')
+    return redirect(url_for('employee.attendance', date=start_date.strftime('%Y-%m-%d')))
+
 @employee_bp.route('/commissions')
 @login_required
 def commissions():
@@ -402,22 +459,16 @@ def calculate_commission():
     month_str = request.form.get('month', date.today().strftime('%Y-%m'))
     
     try:
-        year, month = map(int, month_str.split('-'))
-        start_date = date(year, month, 1)
-        
-        if month == 12:
-            end_date = date(year + 1, 1, 1) - timedelta(days=1)
-        else:
-            end_date = date(year, month + 1, 1) - timedelta(days=1)
+        period = month_bounds(month_str)[0].strftime('%Y-%m')
     except:
-        start_date = date(date.today().year, date.today().month, 1)
-        end_date = date.today()
+        flash('Invalid month', 'danger')
+        return redirect(url_for('employee.commissions'))
     
-    # Get employee's sales for the month
-    # This would need to be implemented based on your commission structure
-    # For now, we'll just show a placeholder
+    # Only employees with sales or repairs changed since the last run, unless a full run is asked for
+    result = calculate_commissions(period, employee_id=employee_id, full=bool(request.form.get('full')))
+    db.session.commit()
     
-    flash('Commission calculation would be implemented based on your business rules', 'info')
+    flash(f"Commissions for {period}: {result['commissions']} calculated for {result['employees']} employee(s)", 'success')
     return redirect(url_for('employee.commissions'))
 
 @employee_bp.route('/pay-commission/<int:commission_id>', methods=['POST'])
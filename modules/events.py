@@ -0,0 +1,157 @@
+"""Repair job event feed for the live job board.
+
+Views call publish_job_event() next to the change they make; the event row is
+committed in the same transaction, so subscribers never see an event for a
+change that was rolled back. Streams wake up immediately for events committed
+in this process and fall back to a cheap `id > last_id` poll for events from
+other worker processes.
+"""
+import json
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from modules.models import RepairEvent, RepairJob, User
+
+OPEN_STATUSES = ['received', 'diagnostic', 'repairing', 'waiting_parts']
+
+_new_events = threading.Condition()
+_transition_listeners = []
+
+
+def on_job_transition(listener):
+    """Register listener(job, previous_technician_id, previous_status)
+
+    Listeners run as soon as an event is published, before commit. They are
+    told about a rollback through listener.discard() when they define one.
+    """
+    _transition_listeners.append(listener)
+    return listener
+
+
+def job_row(job):
+    """Compact board representation of a repair job"""
+    # Go through the identity map rather than job.technician, which can still
+    # hold the previous technician right after a reassignment
+    technician = db.session.get(User, job.technician_id) if job.technician_id else None
+    return {
+        'id': job.id,
+        'job_number': job.job_number,
+        'brand': job.brand,
+        'model': job.model,
+        'status': job.status,
+        'technician_id': job.technician_id,
+        'technician': technician.username if technician else None,
+        'final_cost': job.final_cost or 0,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'completed_date': job.completed_date.isoformat() if job.completed_date else None
+    }
+
+
+def publish_job_event(job, event_type, previous_status=None, **extra):
+    """Queue a board event for `job`; it is delivered once the session commits"""
+    db.session.flush()  # make sure the job has an id
+
+    payload = {'job': job_row(job), 'previous_status': previous_status}
+    payload.update(extra)
+
+    db.session.add(RepairEvent(
+        repair_job_id=job.id,
+        event_type=event_type,
+        payload=payload
+    ))
+    db.session.info['repair_events_pending'] = True
+
+    previous_technician_id = extra.get('previous_technician_id', job.technician_id)
+    for listener in _transition_listeners:
+        listener(job, previous_technician_id, previous_status)
+
+
+@event.listens_for(Session, 'after_commit')
+def _notify_subscribers(session):
+    if session.info.pop('repair_events_pending', False):
+        with _new_events:
+            _new_events.notify_all()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    if session.info.pop('repair_events_pending', None):
+        for listener in _transition_listeners:
+            if hasattr(listener, 'discard'):
+                listener.discard()
+
+
+def board_snapshot(technician_id=None):
+    """Counts plus open jobs, and the event id to resume streaming from"""
+    last_event_id = db.session.query(db.func.max(RepairEvent.id)).scalar() or 0
+
+    status_counts = dict(
+        db.session.query(RepairJob.status, db.func.count(RepairJob.id))
+        .group_by(RepairJob.status)
+        .all()
+    )
+
+    completed_today = RepairJob.query.filter(
+        db.func.date(RepairJob.completed_date) == datetime.utcnow().date(),
+        RepairJob.status == 'completed'
+    ).count()
+
+    query = RepairJob.query.filter(RepairJob.status.in_(OPEN_STATUSES))
+    if technician_id:
+        query = query.filter_by(technician_id=technician_id)
+
+    return {
+        'last_event_id': last_event_id,
+        'status_counts': status_counts,
+        'total_jobs': sum(status_counts.values()),
+        'pending_jobs': sum(status_counts.get(status, 0) for status in OPEN_STATUSES),
+        'completed_today': completed_today,
+        'jobs': [job_row(job) for job in query.order_by(RepairJob.created_at).all()]
+    }
+
+
+def stream_events(last_event_id=0, technician_id=None):
+    """Yield server-sent event frames after `last_event_id`.
+
+    Runs until REPAIR_STREAM_TIMEOUT elapses; EventSource clients reconnect on
+    their own and resume from the Last-Event-ID header.
+    """
+    poll_interval = current_app.config.get('REPAIR_STREAM_POLL_INTERVAL', 5)
+    keepalive = current_app.config.get('REPAIR_STREAM_KEEPALIVE', 15)
+    deadline = time.monotonic() + current_app.config.get('REPAIR_STREAM_TIMEOUT', 300)
+    last_sent = time.monotonic()
+
+    yield 'retry: 3000\n\n'
+
+    while time.monotonic() < deadline:
+        events = db.session.query(
+            RepairEvent.id, RepairEvent.event_type, RepairEvent.payload
+        ).filter(
+            RepairEvent.id > last_event_id
+        ).order_by(RepairEvent.id).limit(100).all()
+
+        # End the read transaction so we don't pin a snapshot between polls
+        db.session.rollback()
+
+        for event_id, event_type, payload in events:
+            last_event_id = event_id
+            if technician_id and technician_id not in (
+                    payload['job']['technician_id'], payload.get('previous_technician_id')):
+                continue
+            yield f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(payload)}\n\n'
+            last_sent = time.monotonic()
+
+        if len(events) == 100:
+            continue
+
+        if time.monotonic() - last_sent >= keepalive:
+            yield ': keepalive\n\n'
+            last_sent = time.monotonic()
+
+        with _new_events:
+            _new_events.wait(poll_interval)
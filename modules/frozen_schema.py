@@ -0,0 +1,438 @@
+"""Frozen table definitions for the schema migrations.
+
+Migrations must do the same thing on every install, whatever the models
+look like by then, so the DDL they run is spelled out here per version
+instead of being read from the live models in modules/models.py. Only
+column types, keys, literal defaults (needed to fill existing rows when a
+column is added) and indexes matter; nothing here is used by the ORM.
+
+Never edit a released definition. A model change gets a new migration and,
+if it needs DDL, a new section below.
+"""
+from sqlalchemy import (
+    JSON, Boolean, Column, Date, DateTime, Float, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+    UniqueConstraint
+)
+
+# Version 1: the full schema when versioned migrations were introduced.
+# Older databases have the original tables without the columns and indexes
+# listed under version 2; everything else is created by version 1.
+v1 = MetaData()
+
+Table(
+    'commission_runs', v1,
+    Column('id', Integer, primary_key=True),
+    Column('period', String(7), unique=True, nullable=False),
+    Column('ran_at', DateTime, nullable=False),
+    Column('employees', Integer, default=0),
+    Column('commissions', Integer, default=0)
+)
+
+Table(
+    'customers', v1,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('phone', String(20), unique=True, nullable=False),
+    Column('email', String(120)),
+    Column('address', Text),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'product_categories', v1,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100), unique=True, nullable=False),
+    Column('description', Text),
+    Column('is_repair_part', Boolean, default=False)
+)
+
+Table(
+    'repair_sla_sketches', v1,
+    Column('id', Integer, primary_key=True),
+    Column('period', String(7), nullable=False),
+    Column('dimension', String(20), nullable=False),
+    Column('key', String(50), nullable=False),
+    Column('metric', String(30), nullable=False),
+    Column('count', Integer, default=0),
+    Column('sketch', JSON, nullable=False),
+    Column('updated_at', DateTime),
+    UniqueConstraint('period', 'dimension', 'key', 'metric', name='unique_sla_sketch')
+)
+
+Table(
+    'suppliers', v1,
+    Column('id', Integer, primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('contact_person', String(100)),
+    Column('phone', String(20)),
+    Column('email', String(120)),
+    Column('address', Text),
+    Column('gst_number', String(50)),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'users', v1,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(80), unique=True, nullable=False),
+    Column('email', String(120), unique=True, nullable=False),
+    Column('password_hash', String(256)),
+    Column('role', String(20), nullable=False, default='staff'),
+    Column('is_active', Boolean, default=True),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'attendance', v1,
+    Column('id', Integer, primary_key=True),
+    Column('employee_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('date', Date, nullable=False),
+    Column('check_in', DateTime),
+    Column('check_out', DateTime),
+    Column('total_hours', Float, default=0.0),
+    Column('status', String(20), default='present'),
+    Column('notes', Text),
+    UniqueConstraint('employee_id', 'date', name='unique_employee_date')
+)
+
+Table(
+    'attendance_monthly', v1,
+    Column('id', Integer, primary_key=True),
+    Column('period', String(7), nullable=False),
+    Column('employee_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('present_days', Integer, default=0),
+    Column('absent_days', Integer, default=0),
+    Column('leave_days', Integer, default=0),
+    Column('total_hours', Float, default=0.0),
+    Column('created_at', DateTime),
+    UniqueConstraint('period', 'employee_id', name='unique_attendance_monthly')
+)
+
+Table(
+    'leave_requests', v1,
+    Column('id', Integer, primary_key=True),
+    Column('employee_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('leave_type', String(30), nullable=False),
+    Column('start_date', Date, nullable=False),
+    Column('end_date', Date, nullable=False),
+    Column('reason', Text),
+    Column('status', String(20), default='pending'),
+    Column('approved_by', Integer, ForeignKey('users.id')),
+    Column('approved_date', DateTime),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'products', v1,
+    Column('id', Integer, primary_key=True),
+    Column('sku', String(50), unique=True, nullable=False),
+    Column('name', String(200), nullable=False),
+    Column('category_id', Integer, ForeignKey('product_categories.id')),
+    Column('description', Text),
+    Column('purchase_price', Float, nullable=False, default=0.0),
+    Column('selling_price', Float, nullable=False, default=0.0),
+    Column('wholesale_price', Float, default=0.0),
+    Column('min_stock_level', Integer, default=5),
+    Column('has_imei', Boolean, default=False),
+    Column('warranty_period', Integer, default=0),
+    Column('is_active', Boolean, default=True),
+    Column('available_stock', Integer, nullable=False, default=0),
+    Column('version', Integer, nullable=False, default=1),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'purchase_orders', v1,
+    Column('id', Integer, primary_key=True),
+    Column('po_number', String(50), unique=True, nullable=False),
+    Column('supplier_id', Integer, ForeignKey('suppliers.id'), nullable=False),
+    Column('order_date', DateTime),
+    Column('expected_date', DateTime),
+    Column('status', String(20), default='pending'),
+    Column('total_amount', Float, default=0.0),
+    Column('notes', Text),
+    Column('created_by', Integer, ForeignKey('users.id')),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'repair_jobs', v1,
+    Column('id', Integer, primary_key=True),
+    Column('job_number', String(50), unique=True, nullable=False),
+    Column('customer_id', Integer, ForeignKey('customers.id'), nullable=False),
+    Column('device_type', String(50), nullable=False),
+    Column('brand', String(50), nullable=False),
+    Column('model', String(100), nullable=False),
+    Column('imei', String(20)),
+    Column('serial_number', String(50)),
+    Column('issue_description', Text, nullable=False),
+    Column('accessories_received', Text),
+    Column('estimated_cost', Float, default=0.0),
+    Column('final_cost', Float, default=0.0),
+    Column('status', String(20), default='received'),
+    Column('technician_id', Integer, ForeignKey('users.id')),
+    Column('diagnosis_details', Text),
+    Column('repair_details', Text),
+    Column('warranty_period', Integer, default=0),
+    Column('warranty_expires_at', DateTime, index=True),
+    Column('customer_approval', Boolean, default=False),
+    Column('approval_date', DateTime),
+    Column('completed_date', DateTime),
+    Column('delivered_date', DateTime),
+    Column('status_changed_at', DateTime),
+    Column('created_at', DateTime),
+    Column('created_by', Integer, ForeignKey('users.id')),
+    Column('updated_at', DateTime, index=True),
+    Index('ix_repair_jobs_customer_warranty', 'customer_id', 'warranty_expires_at'),
+    Index('ix_repair_jobs_imei_warranty', 'imei', 'warranty_expires_at')
+)
+
+Table(
+    'stock_takes', v1,
+    Column('id', Integer, primary_key=True),
+    Column('location', String(100), nullable=False),
+    Column('status', String(20), default='open'),
+    Column('notes', Text),
+    Column('created_by', Integer, ForeignKey('users.id')),
+    Column('created_at', DateTime),
+    Column('applied_at', DateTime)
+)
+
+Table(
+    'technician_skills', v1,
+    Column('id', Integer, primary_key=True),
+    Column('technician_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('brand', String(50), nullable=False),
+    UniqueConstraint('technician_id', 'brand', name='unique_technician_brand')
+)
+
+Table(
+    'devices', v1,
+    Column('id', Integer, primary_key=True),
+    Column('identifier', String(50), unique=True, nullable=False),
+    Column('imei', String(20)),
+    Column('serial_number', String(50)),
+    Column('brand', String(50)),
+    Column('model', String(100)),
+    Column('product_id', Integer, ForeignKey('products.id')),
+    Column('customer_id', Integer, ForeignKey('customers.id')),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'invoices', v1,
+    Column('id', Integer, primary_key=True),
+    Column('invoice_number', String(50), unique=True, nullable=False),
+    Column('customer_id', Integer, ForeignKey('customers.id'), index=True),
+    Column('customer_name', String(100)),
+    Column('customer_phone', String(20), index=True),
+    Column('date', DateTime),
+    Column('subtotal', Float, default=0.0),
+    Column('discount', Float, default=0.0),
+    Column('tax', Float, default=0.0),
+    Column('total', Float, default=0.0),
+    Column('payment_status', String(20), default='pending'),
+    Column('payment_method', String(20)),
+    Column('notes', Text),
+    Column('repair_job_id', Integer, ForeignKey('repair_jobs.id'), index=True),
+    Column('created_by', Integer, ForeignKey('users.id')),
+    Column('updated_at', DateTime, index=True)
+)
+
+Table(
+    'purchase_order_items', v1,
+    Column('id', Integer, primary_key=True),
+    Column('purchase_order_id', Integer, ForeignKey('purchase_orders.id'), nullable=False),
+    Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+    Column('quantity', Integer, nullable=False),
+    Column('unit_price', Float, nullable=False),
+    Column('total_price', Float, nullable=False),
+    Column('received_quantity', Integer, default=0)
+)
+
+Table(
+    'repair_attachments', v1,
+    Column('id', Integer, primary_key=True),
+    Column('repair_job_id', Integer, ForeignKey('repair_jobs.id'), index=True, nullable=False),
+    Column('kind', String(20), default='photo'),
+    Column('content_hash', String(64), index=True, nullable=False),
+    Column('filename', String(255)),
+    Column('content_type', String(100)),
+    Column('size', Integer),
+    Column('uploaded_by', Integer, ForeignKey('users.id')),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'repair_events', v1,
+    Column('id', Integer, primary_key=True),
+    Column('repair_job_id', Integer, ForeignKey('repair_jobs.id'), nullable=False),
+    Column('event_type', String(30), nullable=False),
+    Column('payload', JSON, nullable=False),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'stock_items', v1,
+    Column('id', Integer, primary_key=True),
+    Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+    Column('imei', String(20), unique=True),
+    Column('serial_number', String(50)),
+    Column('batch_number', String(50)),
+    Column('stock_type', String(20), nullable=False),
+    Column('quantity', Integer, nullable=False, default=1),
+    Column('supplier_id', Integer, ForeignKey('suppliers.id')),
+    Column('purchase_order_id', Integer, ForeignKey('purchase_orders.id')),
+    Column('purchase_price', Float),
+    Column('selling_price', Float),
+    Column('location', String(100)),
+    Column('status', String(20), default='available'),
+    Column('notes', Text),
+    Column('version', Integer, nullable=False, default=1),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'stock_take_scans', v1,
+    Column('id', Integer, primary_key=True),
+    Column('stock_take_id', Integer, ForeignKey('stock_takes.id'), index=True, nullable=False),
+    Column('code', String(50), nullable=False),
+    Column('device_id', String(50)),
+    Column('scanned_at', DateTime)
+)
+
+Table(
+    'commissions', v1,
+    Column('id', Integer, primary_key=True),
+    Column('employee_id', Integer, ForeignKey('users.id'), nullable=False),
+    Column('invoice_id', Integer, ForeignKey('invoices.id')),
+    Column('repair_job_id', Integer, ForeignKey('repair_jobs.id')),
+    Column('sale_amount', Float, nullable=False),
+    Column('commission_rate', Float, nullable=False),
+    Column('commission_amount', Float, nullable=False),
+    Column('status', String(20), default='pending'),
+    Column('payment_date', DateTime),
+    Column('created_at', DateTime)
+)
+
+Table(
+    'device_events', v1,
+    Column('id', Integer, primary_key=True),
+    Column('device_id', Integer, ForeignKey('devices.id'), nullable=False),
+    Column('event_type', String(30), nullable=False),
+    Column('stock_item_id', Integer, ForeignKey('stock_items.id')),
+    Column('invoice_id', Integer, ForeignKey('invoices.id')),
+    Column('repair_job_id', Integer, ForeignKey('repair_jobs.id')),
+    Column('customer_id', Integer, ForeignKey('customers.id')),
+    Column('occurred_at', DateTime),
+    Index('ix_device_events_device_time', 'device_id', 'occurred_at')
+)
+
+Table(
+    'invoice_items', v1,
+    Column('id', Integer, primary_key=True),
+    Column('invoice_id', Integer, ForeignKey('invoices.id'), index=True, nullable=False),
+    Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+    Column('stock_item_id', Integer, ForeignKey('stock_items.id'), index=True),
+    Column('quantity', Integer, nullable=False, default=1),
+    Column('unit_price', Float, nullable=False),
+    Column('discount', Float, default=0.0),
+    Column('total', Float, nullable=False),
+    Column('warranty_period', Integer),
+    Column('warranty_expires_at', DateTime, index=True)
+)
+
+Table(
+    'payments', v1,
+    Column('id', Integer, primary_key=True),
+    Column('invoice_id', Integer, ForeignKey('invoices.id'), nullable=False),
+    Column('amount', Float, nullable=False),
+    Column('payment_method', String(20), nullable=False),
+    Column('reference_number', String(100)),
+    Column('payment_date', DateTime),
+    Column('notes', Text),
+    Column('received_by', Integer, ForeignKey('users.id'))
+)
+
+Table(
+    'repair_items', v1,
+    Column('id', Integer, primary_key=True),
+    Column('repair_job_id', Integer, ForeignKey('repair_jobs.id'), nullable=False),
+    Column('product_id', Integer, ForeignKey('products.id'), nullable=False),
+    Column('stock_item_id', Integer, ForeignKey('stock_items.id')),
+    Column('quantity', Integer, nullable=False, default=1),
+    Column('unit_price', Float, nullable=False),
+    Column('total_price', Float, nullable=False),
+    Column('notes', Text)
+)
+
+# Version 2: columns and indexes added to the original tables, created on
+# databases that predate version 1
+V2_COLUMNS = [
+    ('invoice_items', 'warranty_expires_at'),
+    ('invoices', 'repair_job_id'),
+    ('invoices', 'updated_at'),
+    ('product_categories', 'is_repair_part'),
+    ('products', 'warranty_period'),
+    ('products', 'available_stock'),
+    ('products', 'version'),
+    ('repair_jobs', 'warranty_expires_at'),
+    ('repair_jobs', 'status_changed_at'),
+    ('repair_jobs', 'updated_at'),
+    ('stock_items', 'version'),
+]
+V2_INDEXES = [
+    ('invoice_items', 'ix_invoice_items_invoice_id'),
+    ('invoice_items', 'ix_invoice_items_stock_item_id'),
+    ('invoice_items', 'ix_invoice_items_warranty_expires_at'),
+    ('invoices', 'ix_invoices_customer_id'),
+    ('invoices', 'ix_invoices_customer_phone'),
+    ('invoices', 'ix_invoices_repair_job_id'),
+    ('invoices', 'ix_invoices_updated_at'),
+    ('repair_jobs', 'ix_repair_jobs_customer_warranty'),
+    ('repair_jobs', 'ix_repair_jobs_imei_warranty'),
+    ('repair_jobs', 'ix_repair_jobs_updated_at'),
+    ('repair_jobs', 'ix_repair_jobs_warranty_expires_at'),
+]
+
+# Version 4: append-only turnaround samples
+v4 = MetaData()
+
+Table(
+    'repair_sla_samples', v4,
+    Column('id', Integer, primary_key=True),
+    Column('period', String(7), nullable=False),
+    Column('metric', String(30), nullable=False),
+    Column('technician_id', Integer),
+    Column('brand', String(50)),
+    Column('seconds', Float, nullable=False),
+    Column('created_at', DateTime),
+    Index('idx_sla_sample_metric_period', 'metric', 'period')
+)
+
+# Version 7: unique constraints of the original tables, for databases whose
+# copies of those tables were created without them
+V7_UNIQUE = [
+    ('customers', ('phone',)),
+    ('invoices', ('invoice_number',)),
+    ('product_categories', ('name',)),
+    ('products', ('sku',)),
+    ('purchase_orders', ('po_number',)),
+    ('repair_jobs', ('job_number',)),
+    ('stock_items', ('imei',)),
+    ('users', ('username',)),
+    ('users', ('email',)),
+]
+
+# Version 9: devices each spare part fits
+v9 = MetaData()
+
+Table(
+    'part_compatibility', v9,
+    Column('id', Integer, primary_key=True),
+    Column('product_id', Integer, ForeignKey(v1.tables['products'].c.id), nullable=False),
+    Column('brand', String(50), nullable=False),
+    Column('model', String(100)),
+    UniqueConstraint('product_id', 'brand', 'model', name='unique_part_device'),
+    Index('idx_part_compatibility_device', 'brand', 'model')
+)
@@ -3,8 +3,14 @@ from flask_login import login_required, current_user
 from app import db
 from modules.models import (
     Product, ProductCategory, Supplier, StockItem, 
-    PurchaseOrder, PurchaseOrderItem, User
+    PurchaseOrder, PurchaseOrderItem, User, StockTake
 )
+from modules.stock import claim_stock, adjust_available_stock, StockError
+from modules.stocktake import add_scans, reconcile, apply_adjustments
+from modules.devices import record_device_event
+from modules.database import read_replica
+from modules.cache import fragment
+from modules import dashboards
 from datetime import datetime
 import random
 import string
@@ -14,40 +20,14 @@ inventory_bp = Blueprint('inventory', __name__)
 @inventory_bp.route('/')
 @login_required
 def inventory_dashboard():
-    # Get inventory summary
-    total_products = Product.query.filter_by(is_active=True).count()
-    
-    # Calculate total stock value
-    total_value = 0
-    for product in Product.query.filter_by(is_active=True).all():
-        stock_count = StockItem.query.filter_by(
-            product_id=product.id,
-            status='available'
-        ).count()
-        total_value += stock_count * product.purchase_price
-    
-    # Low stock products
-    low_stock_products = []
-    for product in Product.query.filter_by(is_active=True).all():
-        stock_count = StockItem.query.filter_by(
-            product_id=product.id,
-            status='available'
-        ).count()
-        
-        if stock_count <= product.min_stock_level:
-            low_stock_products.append({
-                'product': product,
-                'stock_count': stock_count
-            })
-    
-    # Recent stock movements
-    recent_stock = StockItem.query.order_by(
-        StockItem.created_at.desc()
-    ).limit(10).all()
+    # Tiles are cached per role until stock changes (modules/cache.py)
+    summary = fragment('stock-summary', dashboards.stock_summary, tags=['stock'], ttl=300)
+    low_stock_products = fragment('low-stock', dashboards.low_stock, tags=['stock'], ttl=300)
+    recent_stock = fragment('recent-stock', dashboards.recent_stock, tags=['stock'])
     
     return render_template('inventory/dashboard.html',
-                         total_products=total_products,
-                         total_value=total_value,
+                         total_products=summary['total_products'],
+                         total_value=summary['total_value'],
                          low_stock_products=low_stock_products,
                          recent_stock=recent_stock,
                          title='Inventory Dashboard')
@@ -129,6 +109,7 @@ def stock_in():
             flash('Product not found', 'danger')
             return redirect(url_for('inventory.stock_in'))
         
+        serialized_items = []
         for i in range(quantity):
             stock_item = StockItem(
                 product_id=product_id,
@@ -148,9 +129,17 @@ def stock_in():
                 imei_field = f'imei_{i}'
                 if imei_field in request.form:
                     stock_item.imei = request.form[imei_field]
+                    serialized_items.append(stock_item)
             
             db.session.add(stock_item)
         
+        # Register received handsets in the device registry
+        db.session.flush()
+        for stock_item in serialized_items:
+            record_device_event('stocked', imei=stock_item.imei, product_id=product_id,
+                                stock_item_id=stock_item.id)
+        
+        adjust_available_stock(product_id, quantity)
         db.session.commit()
         flash(f'{quantity} items added to stock', 'success')
         return redirect(url_for('inventory.product_detail', product_id=product_id))
@@ -176,21 +165,20 @@ def stock_out():
         flash('Product not found', 'danger')
         return redirect(request.referrer)
     
-    # Get available stock items
-    available_items = StockItem.query.filter_by(
-        product_id=product_id,
-        status='available'
-    ).limit(quantity).all()
-    
-    if len(available_items) < quantity:
-        flash(f'Only {len(available_items)} items available', 'danger')
+    # Claim available stock items
+    try:
+        claim_stock(
+            product_id,
+            quantity,
+            status='sold' if reason == 'sale' else reason,
+            notes=notes,
+            stock_type='out'
+        )
+    except StockError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
         return redirect(request.referrer)
     
-    for item in available_items:
-        item.status = 'sold' if reason == 'sale' else reason
-        item.notes = notes
-        item.stock_type = 'out'
-    
     db.session.commit()
     flash(f'{quantity} items marked as {reason}', 'success')
     return redirect(request.referrer)
@@ -324,6 +312,8 @@ def receive_grn(po_id):
                         status='available'
                     )
                     db.session.add(stock_item)
+                
+                adjust_available_stock(item.product_id, received_qty)
         
         # Update PO status
         all_received = all(item.received_quantity >= item.quantity for item in purchase_order.po_items)
@@ -350,8 +340,74 @@ def generate_po_number():
     
     return po_number
 
+@inventory_bp.route('/stock-takes', methods=['POST'])
+@login_required
+def create_stock_take():
+    data = request.get_json()
+    location = (data.get('location') or '').strip()
+    
+    if not location:
+        return jsonify({'success': False, 'message': 'Location required'})
+    
+    stock_take = StockTake(
+        location=location,
+        notes=data.get('notes', ''),
+        created_by=current_user.id
+    )
+    
+    db.session.add(stock_take)
+    db.session.commit()
+    
+    return jsonify({'success': True, 'stock_take_id': stock_take.id})
+
+@inventory_bp.route('/stock-take/<int:stock_take_id>/scans', methods=['POST'])
+@login_required
+def upload_scans(stock_take_id):
+    stock_take = StockTake.query.get_or_404(stock_take_id)
+    
+    if stock_take.status != 'open':
+        return jsonify({'success': False, 'message': f'Stock take is {stock_take.status}'})
+    
+    data = request.get_json()
+    codes = data.get('codes', [])
+    
+    if not isinstance(codes, list):
+        return jsonify({'success': False, 'message': 'codes must be a list'})
+    
+    stored, rejected = add_scans(stock_take, codes, device_id=data.get('device_id'))
+    db.session.commit()
+    
+    response = {'success': True, 'stored': stored, 'total_scans': stock_take.scans.count()}
+    if rejected:
+        response['rejected'] = rejected
+        response['message'] = 'Scan each IMEI for these products, not the SKU'
+    return jsonify(response)
+
+@inventory_bp.route('/stock-take/<int:stock_take_id>/reconcile')
+@login_required
+def reconcile_stock_take(stock_take_id):
+    stock_take = StockTake.query.get_or_404(stock_take_id)
+    return jsonify({'success': True, 'result': reconcile(stock_take)})
+
+@inventory_bp.route('/stock-take/<int:stock_take_id>/apply', methods=['POST'])
+@login_required
+def apply_stock_take(stock_take_id):
+    if current_user.role not in ['admin', 'manager']:
+        return jsonify({'success': False, 'message': 'Access denied'})
+    
+    stock_take = StockTake.query.get_or_404(stock_take_id)
+    
+    if stock_take.status != 'open':
+        return jsonify({'success': False, 'message': f'Stock take is {stock_take.status}'})
+    
+    summary = apply_adjustments(stock_take)
+    db.session.commit()
+    
+    return jsonify({'success': True, 'summary': summary})
+
 @inventory_bp.route('/stock-report')
 @login_required
+@read_replica
 def stock_report():
     # Get all products with stock information
     products = Product.query.filter_by(is_active=True).all()
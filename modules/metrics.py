@@ -0,0 +1,281 @@
+"""Per-request latency, SQL and template metrics.
+
+With METRICS_ENABLED set, every request records its latency, the number of
+SQL statements it ran and their total time, labelled by endpoint. Template
+renders are timed per template, as are compiles (a template missing from the
+bytecode cache, see modules/templating.py), and statements slower than
+SLOW_QUERY_THRESHOLD are logged with the view that issued them. Nothing is
+hooked up when metrics are disabled, so the cost is zero.
+
+Metrics are kept per process and exposed in Prometheus text format at
+/metrics (admins, or a scraper sending METRICS_TOKEN as a bearer token) and
+as a table at /admin/metrics.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from flask import (Blueprint, Response, current_app, flash, g, has_request_context, redirect,
+                   render_template, request, url_for, before_render_template, template_rendered)
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+metrics_bp = Blueprint('metrics', __name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    __slots__ = ('buckets', 'counts', 'count', 'total')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-th observation"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.sql_counts = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+        self.sql_time = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.templates = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.template_compiles = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.statuses = defaultdict(int)
+        self.slow_queries = defaultdict(int)
+
+    def record_request(self, endpoint, method, status, seconds, queries, query_seconds):
+        with self._lock:
+            self.requests[(endpoint, method)].observe(seconds)
+            self.sql_counts[endpoint].observe(queries)
+            self.sql_time[endpoint].observe(query_seconds)
+            self.statuses[(endpoint, method, status)] += 1
+
+    def record_template(self, name, seconds):
+        with self._lock:
+            self.templates[name].observe(seconds)
+
+    def record_template_compile(self, name, seconds):
+        with self._lock:
+            self.template_compiles[name].observe(seconds)
+
+    def record_slow_query(self, endpoint):
+        with self._lock:
+            self.slow_queries[endpoint] += 1
+
+    def summary(self):
+        """Rows for the admin page, slowest endpoints first"""
+        with self._lock:
+            rows = []
+            for (endpoint, method), histogram in self.requests.items():
+                queries = self.sql_counts[endpoint]
+                rows.append({
+                    'endpoint': endpoint,
+                    'method': method,
+                    'count': histogram.count,
+                    'avg_ms': histogram.total / histogram.count * 1000,
+                    'p95_ms': histogram.quantile(0.95) * 1000,
+                    'avg_queries': queries.total / queries.count if queries.count else 0,
+                    'avg_sql_ms': self.sql_time[endpoint].total / queries.count * 1000 if queries.count else 0,
+                    'slow_queries': self.slow_queries.get(endpoint, 0)
+                })
+            templates = []
+            for name in set(self.templates) | set(self.template_compiles):
+                histogram = self.templates.get(name)
+                compiles = self.template_compiles.get(name)
+                templates.append({
+                    'name': name,
+                    'count': histogram.count if histogram else 0,
+                    'avg_ms': histogram.total / histogram.count * 1000 if histogram else 0,
+                    'p95_ms': histogram.quantile(0.95) * 1000 if histogram else 0,
+                    'compile_ms': compiles.total * 1000 if compiles else None
+                })
+
+        rows.sort(key=lambda row: row['avg_ms'] * row['count'], reverse=True)
+        templates.sort(key=lambda row: row['avg_ms'], reverse=True)
+        return rows, templates
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            _histogram_lines(lines, 'http_request_duration_seconds', 'Request latency',
+                             {('endpoint', e, 'method', m): h for (e, m), h in self.requests.items()})
+            _histogram_lines(lines, 'sql_queries_per_request', 'SQL statements per request',
+                             {('endpoint', e): h for e, h in self.sql_counts.items()})
+            _histogram_lines(lines, 'sql_duration_seconds_per_request', 'SQL time per request',
+                             {('endpoint', e): h for e, h in self.sql_time.items()})
+            _histogram_lines(lines, 'template_render_seconds', 'Template render time',
+                             {('template', t): h for t, h in self.templates.items()})
+            _histogram_lines(lines, 'template_compile_seconds', 'Template compile time (bytecode cache misses)',
+                             {('template', t): h for t, h in self.template_compiles.items()})
+
+            lines.append('# HELP http_responses_total Responses by status code')
+            lines.append('# TYPE http_responses_total counter')
+            for (endpoint, method, status), n in sorted(self.statuses.items()):
+                lines.append(f'http_responses_total{_labels(("endpoint", endpoint, "method", method, "status", status))} {n}')
+
+            lines.append('# HELP sql_slow_queries_total Statements slower than SLOW_QUERY_THRESHOLD')
+            lines.append('# TYPE sql_slow_queries_total counter')
+            for endpoint, n in sorted(self.slow_queries.items()):
+                lines.append(f'sql_slow_queries_total{_labels(("endpoint", endpoint))} {n}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(pairs):
+    items = [f'{pairs[i]}="{_escape(pairs[i + 1])}"' for i in range(0, len(pairs), 2)]
+    return '{' + ','.join(items) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _histogram_lines(lines, name, help_text, histograms):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for labels, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, n in zip(histogram.buckets + ('+Inf',), histogram.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{_labels(labels + ("le", bound))} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {histogram.total}')
+        lines.append(f'{name}_count{_labels(labels)} {histogram.count}')
+
+
+def get_registry():
+    return current_app.extensions.get('metrics')
+
+
+def init_metrics(app):
+    """Install the hooks when METRICS_ENABLED is set; always registers the routes"""
+    app.register_blueprint(metrics_bp)
+
+    if not app.config.get('METRICS_ENABLED'):
+        return
+
+    registry = app.extensions['metrics'] = MetricsRegistry()
+
+    @app.before_request
+    def _start_request():
+        g.metrics_started = time.perf_counter()
+        g.sql_queries = 0
+        g.sql_seconds = 0.0
+
+    @app.teardown_request
+    def _finish_request(error=None):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        status = 500 if error is not None else getattr(g, 'response_status', 200)
+        registry.record_request(
+            request.endpoint or 'unmatched',
+            request.method,
+            status,
+            time.perf_counter() - started,
+            g.get('sql_queries', 0),
+            g.get('sql_seconds', 0.0)
+        )
+
+    @app.after_request
+    def _remember_status(response):
+        g.response_status = response.status_code
+        return response
+
+    before_render_template.connect(_start_template, app)
+    template_rendered.connect(_finish_template, app)
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_query):
+        event.listen(Engine, 'before_cursor_execute', _before_query)
+        event.listen(Engine, 'after_cursor_execute', _after_query)
+
+
+def _start_template(sender, template, context, **extra):
+    g.setdefault('template_started', []).append(time.perf_counter())
+
+
+def _finish_template(sender, template, context, **extra):
+    started = g.get('template_started')
+    if started:
+        sender.extensions['metrics'].record_template(template.name or 'string', time.perf_counter() - started.pop())
+
+
+def _before_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+def _after_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('metrics_started')
+    if not started:
+        return
+    seconds = time.perf_counter() - started.pop()
+
+    if not has_request_context() or 'metrics' not in current_app.extensions:
+        return
+    g.sql_queries = g.get('sql_queries', 0) + 1
+    g.sql_seconds = g.get('sql_seconds', 0.0) + seconds
+
+    if seconds >= current_app.config.get('SLOW_QUERY_THRESHOLD', 0.5):
+        endpoint = request.endpoint or 'unmatched'
+        current_app.extensions['metrics'].record_slow_query(endpoint)
+        logger.warning('Slow query (%.0fms) in %s [blueprint %s]: %s',
+                       seconds * 1000, endpoint, request.blueprint, ' '.join(statement.split())[:500])
+
+
+def _allowed():
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') == f'Bearer {token}':
+        return True
+    return current_user.is_authenticated and current_user.role == 'admin'
+
+
+@metrics_bp.route('/metrics')
+def prometheus():
+    if not _allowed():
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+
+    registry = get_registry()
+    body = registry.render() if registry else '# metrics disabled (set METRICS_ENABLED)\n'
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+@metrics_bp.route('/admin/metrics')
+def admin_metrics():
+    if not _allowed():
+        flash('Access denied', 'danger')
+        return redirect(url_for('index'))
+
+    registry = get_registry()
+    endpoints, templates = registry.summary() if registry else ([], [])
+    return render_template('admin/metrics.html',
+                           enabled=registry is not None,
+                           endpoints=endpoints,
+                           templates=templates,
+                           title='Performance Metrics')
@@ -0,0 +1,303 @@
+"""Versioned schema migrations and deploy-time bootstrap.
+
+The schema is no longer created on every boot. Run pending migrations once
+per deploy, before starting the workers, and create the first admin account
+by hand:
+
+    flask db upgrade
+    flask bootstrap-admin --username admin --email admin@example.com
+
+Applied versions are recorded in schema_migrations. Each migration runs in
+its own transaction and is recorded in it, so a failed step is retried on
+the next upgrade. New migrations are appended to MIGRATIONS with the next
+version number and must never be renumbered or changed once released; the
+DDL they run comes from modules/frozen_schema.py, not from the live models.
+Data steps call application code, so they are placed after every schema
+step that code reads from.
+
+Workers check the schema on their first request (init_schema_check): while
+schema_migrations is missing or a migration is pending they answer 503 and
+log the command to run, instead of failing at some later query.
+"""
+import os
+import shutil
+import time
+
+import click
+from flask import Response, current_app
+from flask.cli import with_appcontext
+from sqlalchemy import inspect
+from sqlalchemy.schema import DDL
+
+from app import db
+from modules.frozen_schema import V2_COLUMNS, V2_INDEXES, V7_UNIQUE, v1, v4, v9
+from modules.models import SchemaMigration, User
+
+
+class MigrationError(Exception):
+    """A migration step failed; the database is left at the previous version"""
+
+
+def _create_v1_tables():
+    """Create the version 1 tables that do not exist yet (all of them on a fresh database)"""
+    v1.create_all(bind=db.session.connection(), checkfirst=True)
+
+
+def _add_missing_columns():
+    """Add the version 2 columns and indexes to databases that predate them.
+
+    Databases created before stock counters, optimistic locking, warranty
+    expiry and the updated_at watermarks existed only have the original
+    columns, since create_all never alters a table that is already there.
+    """
+    connection = db.session.connection()
+    inspector = inspect(connection)
+
+    for table_name, column_name in V2_COLUMNS:
+        table = v1.tables[table_name]
+        if column_name not in {column['name'] for column in inspector.get_columns(table_name)}:
+            connection.execute(DDL(_add_column_sql(table, table.c[column_name], connection.dialect)))
+
+    for table_name, index_name in V2_INDEXES:
+        index = next(index for index in v1.tables[table_name].indexes if index.name == index_name)
+        index.create(bind=connection, checkfirst=True)
+
+
+def _create_sla_samples():
+    """Create repair_sla_samples for append-only SLA recording"""
+    v4.create_all(bind=db.session.connection(), checkfirst=True)
+
+
+def _add_column_sql(table, column, dialect):
+    preparer = dialect.identifier_preparer
+    sql = (f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} '
+           f'{column.type.compile(dialect=dialect)}')
+
+    # A NOT NULL column needs a literal default to fill existing rows
+    default = column.default.arg if column.default is not None and column.default.is_scalar else None
+    if default is not None:
+        literal = int(default) if isinstance(default, bool) else default
+        sql += f' DEFAULT {literal!r}' if isinstance(literal, str) else f' DEFAULT {literal}'
+        if not column.nullable:
+            sql += ' NOT NULL'
+    return sql
+
+
+def _backfill_derived_data():
+    """Populate the denormalized columns and tables added alongside the new schema"""
+    from modules.stock import sync_stock_counters
+    from modules.warranty import backfill_warranty_expiry
+    from modules.devices import backfill_devices
+
+    sync_stock_counters()
+    backfill_warranty_expiry()
+    backfill_devices()
+
+
+def _rebuild_sla_sketches():
+    """Recompute the SLA sketches; needs repair_sla_samples, which rebuild_sketches clears"""
+    from modules.analytics import rebuild_sketches
+
+    rebuild_sketches()
+
+
+def _create_part_compatibility():
+    """Create part_compatibility for the repair parts picker"""
+    v9.create_all(bind=db.session.connection(), checkfirst=True)
+
+
+def _unique_repair_invoices():
+    """One invoice per repair job, so a double-submitted delivery cannot bill twice"""
+    connection = db.session.connection()
+    invoices = v1.tables['invoices']
+    duplicates = [job_id for (job_id,) in connection.execute(
+        db.select(invoices.c.repair_job_id).where(
+            invoices.c.repair_job_id.isnot(None)
+        ).group_by(invoices.c.repair_job_id).having(db.func.count() > 1)
+    )]
+    if duplicates:
+        raise ValueError(f'repair jobs invoiced more than once, void the extra invoices first: {duplicates}')
+
+    # The unique index replaces the plain one from version 2
+    if 'uq_invoice_repair_job' not in {index['name'] for index in inspect(connection).get_indexes('invoices')}:
+        connection.execute(DDL(_create_unique_index_sql(invoices, 'uq_invoice_repair_job', ('repair_job_id',),
+                                                        connection.dialect)))
+    for index in invoices.indexes:
+        if index.name == 'ix_invoices_repair_job_id':
+            index.drop(bind=connection, checkfirst=True)
+
+
+def _add_missing_unique_constraints():
+    """Create the version 7 unique constraints on tables that lack them.
+
+    create_all skips tables that already exist, so a copy of an original
+    table made without its uniqueness rules never gets them. Each one is
+    created as a unique index, which every backend supports on an existing
+    table; duplicate rows make the step fail until they are cleaned up.
+    """
+    connection = db.session.connection()
+    inspector = inspect(connection)
+
+    for table_name, columns in V7_UNIQUE:
+        present = {tuple(constraint['column_names']) for constraint in inspector.get_unique_constraints(table_name)}
+        present |= {tuple(index['column_names']) for index in inspector.get_indexes(table_name) if index['unique']}
+        if columns not in present:
+            connection.execute(DDL(_create_unique_index_sql(v1.tables[table_name], None, columns, connection.dialect)))
+
+
+def _create_unique_index_sql(table, name, columns, dialect):
+    preparer = dialect.identifier_preparer
+    name = name or f"uq_{table.name}_{'_'.join(columns)}"
+    column_list = ', '.join(preparer.format_column(table.c[column]) for column in columns)
+    return f'CREATE UNIQUE INDEX {preparer.quote(name)} ON {preparer.format_table(table)} ({column_list})'
+
+
+def _move_legacy_uploads():
+    """Move attachments out of static/uploads, where /static served them without a login"""
+    legacy = os.path.abspath(os.path.join('static', 'uploads'))  # the old relative default
+    target = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    if legacy == target or not os.path.isdir(legacy):
+        return
+
+    for root, _, files in os.walk(legacy):
+        for name in files:
+            source = os.path.join(root, name)
+            destination = os.path.join(target, os.path.relpath(source, legacy))
+            if not os.path.exists(destination):  # content-addressed, so an existing file is the same
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.move(source, destination)
+    shutil.rmtree(legacy)
+
+
+MIGRATIONS = [
+    (1, 'create tables', _create_v1_tables),
+    (2, 'add columns and indexes missing from older databases', _add_missing_columns),
+    (3, 'backfill stock counters, warranty expiry and device registry', _backfill_derived_data),
+    (4, 'create repair_sla_samples for append-only SLA recording', _create_sla_samples),
+    (5, 'unique invoice per repair job', _unique_repair_invoices),
+    (6, 'move attachments out of static/uploads', _move_legacy_uploads),
+    (7, 'add unique constraints missing from older databases', _add_missing_unique_constraints),
+    (8, 'rebuild SLA sketches', _rebuild_sla_sketches),
+    (9, 'create part_compatibility for the parts picker', _create_part_compatibility),
+]
+
+
+def applied_versions():
+    if not inspect(db.session.connection()).has_table(SchemaMigration.__tablename__):
+        return set()
+    return {version for (version,) in db.session.query(SchemaMigration.version)}
+
+
+def pending_migrations():
+    applied = applied_versions()
+    return [(version, name, step) for version, name, step in MIGRATIONS if version not in applied]
+
+
+def upgrade(report=None):
+    """Apply pending migrations in order; returns the versions applied"""
+    SchemaMigration.__table__.create(bind=db.session.connection(), checkfirst=True)
+    db.session.commit()
+
+    applied = []
+    for version, name, step in pending_migrations():
+        started = time.perf_counter()
+        try:
+            step()
+            db.session.add(SchemaMigration(version=version, name=name))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            raise MigrationError(f'Migration {version} ({name}) failed: {e}') from e
+        applied.append(version)
+        if report:
+            report(version, name, time.perf_counter() - started)
+    return applied
+
+
+def schema_problem():
+    """Why the database cannot serve requests yet, or None"""
+    if not applied_versions():
+        return 'the database schema is not initialised; run `flask db upgrade && flask bootstrap-admin`'
+    pending = pending_migrations()
+    if pending:
+        return f'{len(pending)} migration(s) pending; run `flask db upgrade`'
+    return None
+
+
+def init_schema_check(app):
+    """Refuse requests with a clear error until the schema is migrated"""
+    state = {'ready': False}
+
+    @app.before_request
+    def _check_schema():
+        if state['ready']:
+            return None
+        problem = schema_problem()
+        if problem:
+            app.logger.error('Not serving requests: %s', problem)
+            return Response(f'Service not set up: {problem}\n', status=503, mimetype='text/plain')
+        if not User.query.filter_by(role='admin', is_active=True).first():
+            app.logger.warning('No active admin account; create one with `flask bootstrap-admin`')
+        state['ready'] = True
+        return None
+
+
+def bootstrap_admin(username, email, password, reset=False):
+    """Create the first admin account, or reset its password with reset=True"""
+    user = User.query.filter_by(username=username).first()
+    if user and not reset:
+        raise ValueError(f'User {username} already exists')
+
+    if not user:
+        user = User(username=username, email=email, role='admin', is_active=True)
+        db.session.add(user)
+    user.role = 'admin'
+    user.is_active = True
+    user.set_password(password)
+    db.session.commit()
+    return user
+
+
+@click.group('db')
+def db_cli():
+    """Database schema migrations"""
+
+
+@db_cli.command('upgrade')
+@with_appcontext
+def upgrade_command():
+    """Apply pending migrations"""
+    def report(version, name, seconds):
+        click.echo(f'  {version:04d} {name} ({seconds:.2f}s)')
+
+    try:
+        applied = upgrade(report)
+    except MigrationError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'Applied {len(applied)} migration(s)' if applied else 'Database is up to date')
+
+
+@db_cli.command('status')
+@with_appcontext
+def status_command():
+    """Show applied and pending migrations"""
+    applied = applied_versions()
+    for version, name, _ in MIGRATIONS:
+        click.echo(f"  {version:04d} {'applied' if version in applied else 'pending'}  {name}")
+
+
+@click.command('bootstrap-admin')
+@click.option('--username', default='admin', show_default=True)
+@click.option('--email', default='admin@mobileshop.com', show_default=True)
+@click.option('--password', prompt=True, hide_input=True, confirmation_prompt=True)
+@click.option('--reset', is_flag=True, help='Reset the password of an existing account')
+@with_appcontext
+def bootstrap_admin_command(username, email, password, reset):
+    """Create the first admin account"""
+    if not applied_versions():
+        raise click.ClickException('Run `flask db upgrade` first')
+    try:
+        bootstrap_admin(username, email, password, reset=reset)
+    except ValueError as e:
+        raise click.ClickException(f'{e}; pass --reset to change its password')
+    click.echo(f'Admin {username} ready')
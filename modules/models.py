@@ -1,6 +1,6 @@
 from app import db
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from modules.passwords import hash_password, verify_password
 from datetime import datetime
 
 class User(UserMixin, db.Model):
@@ -23,10 +23,10 @@ class User(UserMixin, db.Model):
                                          foreign_keys='RepairJob.created_by')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
     
     def __repr__(self):
         return f'<User {self.username}>'
@@ -66,6 +66,7 @@ class ProductCategory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False, unique=True)
     description = db.Column(db.Text)
+    is_repair_part = db.Column(db.Boolean, default=False)  # offered in the repair job parts picker
     
     # Relationships
     products = db.relationship('Product', backref='category', lazy=True)
@@ -83,12 +84,17 @@ class Product(db.Model):
     wholesale_price = db.Column(db.Float, default=0.0)
     min_stock_level = db.Column(db.Integer, default=5)
     has_imei = db.Column(db.Boolean, default=False)
+    warranty_period = db.Column(db.Integer, default=0)  # in months, copied to invoice items on sale
     is_active = db.Column(db.Boolean, default=True)
+    available_stock = db.Column(db.Integer, nullable=False, default=0)  # denormalized count of available stock items
+    version = db.Column(db.Integer, nullable=False, default=1)  # optimistic lock for product edits; stock counters don't bump it
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     stock_items = db.relationship('StockItem', backref='product', lazy=True)
     invoice_items = db.relationship('InvoiceItem', backref='product', lazy=True)
+    
+    __mapper_args__ = {'version_id_col': version}
 
 class StockItem(db.Model):
     __tablename__ = 'stock_items'
@@ -105,13 +111,40 @@ class StockItem(db.Model):
     purchase_price = db.Column(db.Float)
     selling_price = db.Column(db.Float)
     location = db.Column(db.String(100))
-    status = db.Column(db.String(20), default='available')  # available, sold, reserved, defective
+    status = db.Column(db.String(20), default='available')  # available, sold, reserved, defective, used, missing
     notes = db.Column(db.Text)
+    version = db.Column(db.Integer, nullable=False, default=1)  # optimistic lock, see modules/stock.py
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     supplier = db.relationship('Supplier', backref='stock_items')
     purchase_order = db.relationship('PurchaseOrder', backref='stock_items')
+    
+    __mapper_args__ = {'version_id_col': version}
+
+class StockTake(db.Model):
+    __tablename__ = 'stock_takes'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    location = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(20), default='open')  # open, applied, cancelled
+    notes = db.Column(db.Text)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    applied_at = db.Column(db.DateTime)
+    
+    # Relationships
+    scans = db.relationship('StockTakeScan', backref='stock_take', lazy='dynamic', cascade='all, delete-orphan')
+    creator = db.relationship('User', backref='stock_takes')
+
+class StockTakeScan(db.Model):
+    __tablename__ = 'stock_take_scans'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    stock_take_id = db.Column(db.Integer, db.ForeignKey('stock_takes.id'), nullable=False, index=True)
+    code = db.Column(db.String(50), nullable=False)  # IMEI, serial number or SKU as scanned
+    device_id = db.Column(db.String(50))  # handheld scanner that uploaded the batch
+    scanned_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 class PurchaseOrder(db.Model):
     __tablename__ = 'purchase_orders'
@@ -147,9 +180,9 @@ class Invoice(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     invoice_number = db.Column(db.String(50), unique=True, nullable=False)
-    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'))
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'), index=True)
     customer_name = db.Column(db.String(100))
-    customer_phone = db.Column(db.String(20))
+    customer_phone = db.Column(db.String(20), index=True)
     date = db.Column(db.DateTime, default=datetime.utcnow)
     subtotal = db.Column(db.Float, default=0.0)
     discount = db.Column(db.Float, default=0.0)
@@ -158,25 +191,32 @@ class Invoice(db.Model):
     payment_status = db.Column(db.String(20), default='pending')  # pending, partial, paid
     payment_method = db.Column(db.String(20))  # cash, card, online, due
     notes = db.Column(db.Text)
+    repair_job_id = db.Column(db.Integer, db.ForeignKey('repair_jobs.id'))  # set for repair delivery invoices
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # commission recompute watermark
     
     # Relationships
     items = db.relationship('InvoiceItem', backref='invoice', lazy=True, cascade='all, delete-orphan')
     payments = db.relationship('Payment', backref='invoice', lazy=True, cascade='all, delete-orphan')
     creator = db.relationship('User', backref='invoices')
+    repair_job = db.relationship('RepairJob', backref='invoices')
+    
+    # At most one invoice per repair job; counter sales (NULL) never clash
+    __table_args__ = (db.Index('uq_invoice_repair_job', 'repair_job_id', unique=True),)
 
 class InvoiceItem(db.Model):
     __tablename__ = 'invoice_items'
     
     id = db.Column(db.Integer, primary_key=True)
-    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
-    stock_item_id = db.Column(db.Integer, db.ForeignKey('stock_items.id'))
+    stock_item_id = db.Column(db.Integer, db.ForeignKey('stock_items.id'), index=True)
     quantity = db.Column(db.Integer, nullable=False, default=1)
     unit_price = db.Column(db.Float, nullable=False)
     discount = db.Column(db.Float, default=0.0)
     total = db.Column(db.Float, nullable=False)
     warranty_period = db.Column(db.Integer)  # in months
+    warranty_expires_at = db.Column(db.DateTime, index=True)  # set at sale, see modules/warranty.py
 
 class Payment(db.Model):
     __tablename__ = 'payments'
@@ -213,15 +253,77 @@ class RepairJob(db.Model):
     diagnosis_details = db.Column(db.Text)
     repair_details = db.Column(db.Text)
     warranty_period = db.Column(db.Integer, default=0)  # in months
+    warranty_expires_at = db.Column(db.DateTime, index=True)  # set on completion, see modules/warranty.py
     customer_approval = db.Column(db.Boolean, default=False)
     approval_date = db.Column(db.DateTime)
     completed_date = db.Column(db.DateTime)
     delivered_date = db.Column(db.DateTime)
+    status_changed_at = db.Column(db.DateTime, default=datetime.utcnow)  # start of the current status, see modules/analytics.py
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     created_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # commission recompute watermark
     
     # Relationships
     repair_items = db.relationship('RepairItem', backref='repair_job', lazy=True, cascade='all, delete-orphan')
+    
+    __table_args__ = (
+        db.Index('ix_repair_jobs_imei_warranty', 'imei', 'warranty_expires_at'),
+        db.Index('ix_repair_jobs_customer_warranty', 'customer_id', 'warranty_expires_at'),
+    )
+
+class RepairEvent(db.Model):
+    __tablename__ = 'repair_events'
+    
+    id = db.Column(db.Integer, primary_key=True)  # doubles as the SSE event id
+    repair_job_id = db.Column(db.Integer, db.ForeignKey('repair_jobs.id'), nullable=False)
+    event_type = db.Column(db.String(30), nullable=False)  # created, status, assigned, part_added
+    payload = db.Column(db.JSON, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class RepairAttachment(db.Model):
+    __tablename__ = 'repair_attachments'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    repair_job_id = db.Column(db.Integer, db.ForeignKey('repair_jobs.id'), nullable=False, index=True)
+    kind = db.Column(db.String(20), default='photo')  # photo, job_card, document
+    content_hash = db.Column(db.String(64), nullable=False, index=True)  # sha256, names the stored file
+    filename = db.Column(db.String(255))  # original name as uploaded
+    content_type = db.Column(db.String(100))
+    size = db.Column(db.Integer)
+    uploaded_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    repair_job = db.relationship('RepairJob', backref='attachments')
+
+class RepairSlaSketch(db.Model):
+    __tablename__ = 'repair_sla_sketches'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    dimension = db.Column(db.String(20), nullable=False)  # all, technician, brand
+    key = db.Column(db.String(50), nullable=False)  # technician id or brand, '*' for all
+    metric = db.Column(db.String(30), nullable=False)  # turnaround, pickup, status:<name>
+    count = db.Column(db.Integer, default=0)
+    sketch = db.Column(db.JSON, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('period', 'dimension', 'key', 'metric', name='unique_sla_sketch'),)
+
+class RepairSlaSample(db.Model):
+    __tablename__ = 'repair_sla_samples'
+    
+    # One row per recorded duration, appended by job transitions and folded
+    # into repair_sla_sketches later, so transitions never update shared rows
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(7), nullable=False)  # YYYY-MM
+    metric = db.Column(db.String(30), nullable=False)
+    technician_id = db.Column(db.Integer)
+    brand = db.Column(db.String(50))
+    seconds = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('idx_sla_sample_metric_period', 'metric', 'period'),)
 
 class RepairItem(db.Model):
     __tablename__ = 'repair_items'
@@ -235,6 +337,65 @@ class RepairItem(db.Model):
     total_price = db.Column(db.Float, nullable=False)
     notes = db.Column(db.Text)
 
+class PartCompatibility(db.Model):
+    __tablename__ = 'part_compatibility'
+    
+    # Devices a spare part fits; a part with no rows is generic and fits any device
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    brand = db.Column(db.String(50), nullable=False)  # stored lower-case
+    model = db.Column(db.String(100))  # stored lower-case; NULL fits every model of the brand
+    
+    # Relationships
+    product = db.relationship('Product', backref='compatibility')
+    
+    __table_args__ = (
+        db.UniqueConstraint('product_id', 'brand', 'model', name='unique_part_device'),
+        db.Index('idx_part_compatibility_device', 'brand', 'model'),
+    )
+
+class TechnicianSkill(db.Model):
+    __tablename__ = 'technician_skills'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    technician_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    brand = db.Column(db.String(50), nullable=False)  # stored lower-case
+    
+    # Relationships
+    technician = db.relationship('User', backref='skills')
+    
+    __table_args__ = (db.UniqueConstraint('technician_id', 'brand', name='unique_technician_brand'),)
+
+class Device(db.Model):
+    __tablename__ = 'devices'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    identifier = db.Column(db.String(50), unique=True, nullable=False)  # normalized IMEI or serial number
+    imei = db.Column(db.String(20))
+    serial_number = db.Column(db.String(50))
+    brand = db.Column(db.String(50))
+    model = db.Column(db.String(100))
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'))
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'))  # last known owner
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    events = db.relationship('DeviceEvent', backref='device', lazy='dynamic', order_by='DeviceEvent.occurred_at')
+
+class DeviceEvent(db.Model):
+    __tablename__ = 'device_events'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey('devices.id'), nullable=False)
+    event_type = db.Column(db.String(30), nullable=False)  # stocked, sold, repair_intake, repair_completed, repair_delivered
+    stock_item_id = db.Column(db.Integer, db.ForeignKey('stock_items.id'))
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id'))
+    repair_job_id = db.Column(db.Integer, db.ForeignKey('repair_jobs.id'))
+    customer_id = db.Column(db.Integer, db.ForeignKey('customers.id'))
+    occurred_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.Index('ix_device_events_device_time', 'device_id', 'occurred_at'),)
+
 class Attendance(db.Model):
     __tablename__ = 'attendance'
     
@@ -244,11 +405,25 @@ class Attendance(db.Model):
     check_in = db.Column(db.DateTime)
     check_out = db.Column(db.DateTime)
     total_hours = db.Column(db.Float, default=0.0)
-    status = db.Column(db.String(20), default='present')  # present, absent, half_day, leave
+    status = db.Column(db.String(20), default='present')  # present, absent, half_day, leave, holiday
     notes = db.Column(db.Text)
     
     __table_args__ = (db.UniqueConstraint('employee_id', 'date', name='unique_employee_date'),)
 
+class AttendanceMonthly(db.Model):
+    __tablename__ = 'attendance_monthly'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(7), nullable=False)  # YYYY-MM, closed months only
+    employee_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    present_days = db.Column(db.Integer, default=0)
+    absent_days = db.Column(db.Integer, default=0)
+    leave_days = db.Column(db.Integer, default=0)
+    total_hours = db.Column(db.Float, default=0.0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('period', 'employee_id', name='unique_attendance_monthly'),)
+
 class LeaveRequest(db.Model):
     __tablename__ = 'leave_requests'
     
@@ -284,4 +459,20 @@ class Commission(db.Model):
     # Relationships - specify foreign_keys explicitly
     employee = db.relationship('User', foreign_keys=[employee_id], backref='commissions')
     invoice = db.relationship('Invoice', backref='commissions')
-    repair_job = db.relationship('RepairJob', backref='commissions')
\ No newline at end of file
+    repair_job = db.relationship('RepairJob', backref='commissions')
+
+class CommissionRun(db.Model):
+    __tablename__ = 'commission_runs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(7), unique=True, nullable=False)  # YYYY-MM
+    ran_at = db.Column(db.DateTime, nullable=False)  # sources changed after this are recomputed next run
+    employees = db.Column(db.Integer, default=0)
+    commissions = db.Column(db.Integer, default=0)
+
+class SchemaMigration(db.Model):
+    __tablename__ = 'schema_migrations'
+    
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)  # see modules/migrations.py
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
@@ -0,0 +1,97 @@
+"""Password hashing with deployment-tunable cost.
+
+PASSWORD_HASH_METHOD is any werkzeug method string (e.g. 'scrypt:32768:8:1'
+or 'pbkdf2:sha256:600000'). Hashes made with other parameters still verify
+and are upgraded on the next successful login (see needs_rehash).
+
+Verification is CPU-bound, so it runs in a small thread pool of
+PASSWORD_VERIFY_WORKERS threads (hashlib releases the GIL while hashing).
+At most PASSWORD_VERIFY_QUEUE more logins may wait for a free slot; beyond
+that, or after PASSWORD_VERIFY_TIMEOUT seconds, PasswordBusyError is raised
+so a shift-change login burst cannot tie up every request worker.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from flask import current_app, has_app_context
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash, check_password_hash
+
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+
+
+class PasswordBusyError(Exception):
+    """Too many password checks in flight; the caller should ask to retry"""
+
+
+def _setting(key, default):
+    return current_app.config.get(key, default) if has_app_context() else default
+
+
+def hash_password(password):
+    return generate_password_hash(
+        password,
+        method=_setting('PASSWORD_HASH_METHOD', DEFAULT_METHOD),
+        salt_length=_setting('PASSWORD_SALT_LENGTH', 16)
+    )
+
+
+def normalize_method(method):
+    """The method prefix werkzeug writes into hashes made with `method`
+
+    Short forms such as 'scrypt' or 'pbkdf2:sha256' are stored with their
+    defaults spelled out ('scrypt:32768:8:1', 'pbkdf2:sha256:<iterations>').
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt' and not args:
+        return 'scrypt:32768:8:1'
+    if name == 'pbkdf2' and len(args) < 2:
+        hash_name = args[0] if args else 'sha256'
+        return f'pbkdf2:{hash_name}:{DEFAULT_PBKDF2_ITERATIONS}'
+    return method
+
+
+def needs_rehash(pwhash):
+    """True when a stored hash was made with different parameters"""
+    method = normalize_method(_setting('PASSWORD_HASH_METHOD', DEFAULT_METHOD))
+    return not pwhash or pwhash.split('$', 1)[0] != method
+
+
+def verify_password(pwhash, password):
+    """Check a password in the bounded verification pool"""
+    if not pwhash:
+        return False
+    if not has_app_context():
+        return check_password_hash(pwhash, password)
+
+    pool, slots = _get_pool()
+    timeout = current_app.config.get('PASSWORD_VERIFY_TIMEOUT', 10)
+    if not slots.acquire(blocking=False):
+        raise PasswordBusyError('Too many sign-ins at once, please try again')
+    try:
+        future = pool.submit(check_password_hash, pwhash, password)
+    except BaseException:
+        slots.release()
+        raise
+    # The slot is held until the check has actually finished or been
+    # cancelled, so abandoned checks still count against the bound
+    future.add_done_callback(lambda _: slots.release())
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        future.cancel()  # drops it if still queued; a running check finishes
+        raise PasswordBusyError('Too many sign-ins at once, please try again')
+
+
+def _get_pool():
+    global _pool, _slots
+
+    with _pool_lock:
+        if _pool is None:
+            workers = current_app.config.get('PASSWORD_VERIFY_WORKERS', 2)
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-verify')
+            _slots = threading.BoundedSemaphore(workers + current_app.config.get('PASSWORD_VERIFY_QUEUE', 16))
+    return _pool, _slots
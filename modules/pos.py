@@ -5,6 +5,12 @@ from modules.models import (
     Customer, Product, StockItem, Invoice, InvoiceItem, Payment, 
     User, ProductCategory
 )
+from modules.stock import claim_stock, StockError
+from modules.warranty import warranty_end
+from modules.devices import record_sale
+from modules.database import read_replica
+from modules.cache import fragment
+from modules import dashboards
 from datetime import datetime
 import random
 import string
@@ -30,41 +36,17 @@ def pos_home():
 @pos_bp.route('/dashboard')
 @login_required
 def dashboard():
-    # Get today's sales summary
+    # Tiles are cached per role until a sale or stock change (modules/cache.py)
     today = datetime.utcnow().date()
-    
-    today_invoices = Invoice.query.filter(
-        db.func.date(Invoice.date) == today
-    ).all()
-    
-    today_sales = sum(inv.total for inv in today_invoices)
-    today_transactions = len(today_invoices)
-    today_cash = sum(inv.total for inv in today_invoices if inv.payment_method == 'cash')
-    
-    # Get low stock products
-    low_stock_products = []
-    for product in Product.query.filter_by(is_active=True).all():
-        stock_count = StockItem.query.filter_by(
-            product_id=product.id,
-            status='available'
-        ).count()
-        
-        if stock_count <= product.min_stock_level:
-            low_stock_products.append({
-                'product': product,
-                'stock_count': stock_count
-            })
-    
-    # Get recent transactions
-    recent_invoices = Invoice.query.order_by(
-        Invoice.date.desc()
-    ).limit(10).all()
+    sales = fragment(f'pos-sales:{today}', lambda: dashboards.sales_summary(today), tags=['sales'])
+    low_stock_products = fragment('low-stock', dashboards.low_stock, tags=['stock'], ttl=300)
+    recent_invoices = fragment('recent-invoices', dashboards.recent_invoices, tags=['sales'])
     
     return render_template('pos/dashboard.html',
                          now=datetime.utcnow(),  # Add this line
-                         today_sales=today_sales,
-                         today_transactions=today_transactions,
-                         today_cash=today_cash,
+                         today_sales=sales['today_sales'],
+                         today_transactions=sales['today_transactions'],
+                         today_cash=sales['today_cash'],
                          low_stock_products=low_stock_products,
                          recent_invoices=recent_invoices,
                          title='Dashboard')
@@ -300,34 +282,30 @@ def checkout():
     for product_id, item in cart.items():
         product = Product.query.get(item['id'])
         
-        for _ in range(item['quantity']):
-            # Find available stock item
-            stock_item = None
-            if product.has_imei:
-                # For products with IMEI, need to assign specific stock item
-                # This would typically come from the POS interface
-                stock_item = StockItem.query.filter_by(
-                    product_id=product.id,
-                    status='available'
-                ).first()
-                
-                if stock_item:
-                    stock_item.status = 'sold'
-            else:
-                # For non-IMEI products, just reduce stock
-                pass
-            
+        # Claim all units for this line in one go; a concurrent till selling
+        # the same units makes this raise instead of overselling
+        try:
+            stock_item_ids = claim_stock(product.id, item['quantity'], status='sold')
+        except StockError as e:
+            db.session.rollback()
+            return jsonify({'success': False, 'message': f'{product.name}: {e}'})
+        
+        for stock_item_id in stock_item_ids:
             # Create invoice item
             invoice_item = InvoiceItem(
                 invoice_id=invoice.id,
                 product_id=product.id,
-                stock_item_id=stock_item.id if stock_item else None,
+                stock_item_id=stock_item_id,
                 quantity=1,
                 unit_price=item['price'],
-                total=item['price']
+                total=item['price'],
+                warranty_period=product.warranty_period,
+                warranty_expires_at=warranty_end(invoice.date, product.warranty_period)
             )
             
             db.session.add(invoice_item)
+        
+        record_sale(invoice, stock_item_ids)
     
     # Create payment record
     if payment_method != 'due':
@@ -366,6 +344,7 @@ def generate_invoice_number():
 
 @pos_bp.route('/daily-sales')
 @login_required
+@read_replica
 def daily_sales():
     date_str = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
     
@@ -383,6 +362,7 @@ def daily_sales():
     total_sales = sum(inv.total for inv in invoices)
     total_discount = sum(inv.discount for inv in invoices)
     total_tax = sum(inv.tax for inv in invoices)
+    repair_sales = sum(inv.total for inv in invoices if inv.repair_job_id)
     
     # Payment method breakdown
     payment_methods = {}
@@ -396,6 +376,7 @@ def daily_sales():
                          total_sales=total_sales,
                          total_discount=total_discount,
                          total_tax=total_tax,
+                         repair_sales=repair_sales,
                          payment_methods=payment_methods,
                          title='Daily Sales')
 
@@ -0,0 +1,161 @@
+"""Cached user principals for Flask-Login.
+
+load_user() runs before every authenticated request. Instead of loading the
+User row each time it returns a UserPrincipal: a small read-only snapshot of
+the fields views and templates use (id, username, email, role, is_active),
+kept in an in-process TTL LRU. When USER_CACHE_URL points at Redis the
+snapshots are also shared between workers.
+
+Any committed change to a User row drops that user's snapshot, so edits,
+password changes and deactivation take effect on the next request in this
+process (and in Redis). Other processes keep their local copy for at most
+USER_CACHE_LOCAL_TTL seconds, so a deactivated or demoted user loses access
+everywhere within that window whether or not Redis is configured.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, has_app_context
+from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from app import db
+from modules.models import User
+
+try:
+    import redis
+except ImportError:  # shared cache is optional
+    redis = None
+
+FIELDS = ('id', 'username', 'email', 'role', 'active')
+
+
+class UserPrincipal(UserMixin):
+    """Immutable snapshot of a user; load the User row to change anything"""
+
+    __slots__ = FIELDS
+
+    def __init__(self, id, username, email, role, active):
+        for name, value in zip(FIELDS, (id, username, email, role, active)):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('UserPrincipal is read-only')
+
+    @property
+    def is_active(self):
+        return bool(self.active)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in FIELDS}
+
+    def __repr__(self):
+        return f'<UserPrincipal {self.username}>'
+
+
+class PrincipalCache:
+    """Thread-safe TTL LRU with an optional Redis second level"""
+
+    def __init__(self, maxsize=1024, ttl=300, url=None, local_ttl=5):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._shared = redis.Redis.from_url(url) if url and redis else None
+        # Only this process hears about its own commits, so local copies
+        # are always short-lived; Redis holds the longer-lived shared one
+        self.local_ttl = min(ttl, local_ttl)
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(user_id)
+                    return entry[1]
+                del self._entries[user_id]
+
+        if self._shared is not None:
+            data = self._shared.get(self._key(user_id))
+            if data:
+                principal = UserPrincipal(**json.loads(data))
+                self._store(user_id, principal)
+                return principal
+        return None
+
+    def set(self, principal):
+        self._store(principal.id, principal)
+        if self._shared is not None:
+            self._shared.set(self._key(principal.id), json.dumps(principal.to_dict()), ex=self.ttl)
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+        if self._shared is not None and user_ids:
+            self._shared.delete(*(self._key(user_id) for user_id in user_ids))
+
+    def _store(self, user_id, principal):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.local_ttl, principal)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    @staticmethod
+    def _key(user_id):
+        return f'user-principal:{user_id}'
+
+
+def get_principal_cache():
+    """The current app's cache, created on first use"""
+    cache = current_app.extensions.get('user_principal_cache')
+    if cache is None:
+        cache = current_app.extensions['user_principal_cache'] = PrincipalCache(
+            maxsize=current_app.config.get('USER_CACHE_SIZE', 1024),
+            ttl=current_app.config.get('USER_CACHE_TTL', 300),
+            url=current_app.config.get('USER_CACHE_URL'),
+            local_ttl=current_app.config.get('USER_CACHE_LOCAL_TTL', 5)
+        )
+    return cache
+
+
+def load_principal(user_id):
+    """Snapshot for a user id, from cache or one column query"""
+    cache = get_principal_cache()
+    principal = cache.get(user_id)
+    if principal is None:
+        row = db.session.query(User.id, User.username, User.email, User.role, User.is_active).filter(
+            User.id == user_id
+        ).first()
+        if row is None:
+            return None
+        principal = UserPrincipal(*row)
+        cache.set(principal)
+    return principal
+
+
+def invalidate_user(user_id):
+    get_principal_cache().invalidate([user_id])
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_changed_users(session, flush_context, instances):
+    changed = {obj.id for obj in session.dirty | session.deleted if isinstance(obj, User) and obj.id}
+    if changed:
+        session.info.setdefault('changed_user_ids', set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_changed_users(session):
+    user_ids = session.info.pop('changed_user_ids', None)
+    if user_ids and has_app_context() and 'user_principal_cache' in current_app.extensions:
+        current_app.extensions['user_principal_cache'].invalidate(user_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_user_ids', None)
@@ -1,10 +1,25 @@
-from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
+from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for, Response, stream_with_context, current_app, send_file, abort
 from flask_login import login_required, current_user
 from app import db
 from modules.models import (
-    Customer, RepairJob, RepairItem, Product, StockItem, User
+    Customer, RepairJob, RepairItem, RepairAttachment, Invoice, Product, ProductCategory, StockItem,
+    User, TechnicianSkill, PartCompatibility
 )
+from modules.stock import claim_stock, StockError
+from modules.events import publish_job_event, board_snapshot, stream_events
+from modules.scheduler import auto_assign, rebalance, get_scheduler
+from modules.warranty import warranty_end, lookup, expiring_repairs, expiring_sales, repair_row
+from modules.devices import record_job_event, device_timeline
+from modules.analytics import turnaround_report
+from modules.billing import create_repair_invoice
+from modules.pos import generate_invoice_number
+from modules.database import read_replica
+from modules.cache import fragment
+from modules import dashboards
+from modules.uploads import receive_upload, schedule_thumbnail, stored_path, thumbnail_path, UploadError
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
+import os
 import random
 import string
 
@@ -13,33 +28,24 @@ repair_bp = Blueprint('repair', __name__)
 @repair_bp.route('/')
 @login_required
 def repair_dashboard():
-    # Get repair job statistics
-    total_jobs = RepairJob.query.count()
-    pending_jobs = RepairJob.query.filter(
-        RepairJob.status.in_(['received', 'diagnostic', 'repairing', 'waiting_parts'])
-    ).count()
-    completed_today = RepairJob.query.filter(
-        db.func.date(RepairJob.completed_date) == datetime.utcnow().date(),
-        RepairJob.status == 'completed'
-    ).count()
-    
-    # Recent jobs
-    recent_jobs = RepairJob.query.order_by(
-        RepairJob.created_at.desc()
-    ).limit(10).all()
+    # Shared tiles are cached per role until a job changes (modules/cache.py)
+    today = datetime.utcnow().date()
+    summary = fragment(f'repair-summary:{today}', lambda: dashboards.repair_summary(today), tags=['repairs'])
+    recent_jobs = fragment('recent-jobs', dashboards.recent_jobs, tags=['repairs'])
     
     # Jobs assigned to current technician
     my_jobs = []
     if current_user.role == 'technician':
-        my_jobs = RepairJob.query.filter_by(
-            technician_id=current_user.id,
-            status__in=['diagnostic', 'repairing', 'waiting_parts']
+        my_jobs = RepairJob.query.filter(
+            RepairJob.technician_id == current_user.id,
+            RepairJob.status.in_(['diagnostic', 'repairing', 'waiting_parts'])
         ).order_by(RepairJob.created_at).all()
     
     return render_template('repair/dashboard.html',
-                         total_jobs=total_jobs,
-                         pending_jobs=pending_jobs,
-                         completed_today=completed_today,
+                         total_jobs=summary['total_jobs'],
+                         pending_jobs=summary['pending_jobs'],
+                         completed_today=summary['completed_today'],
+                         status_counts=summary['status_counts'],
                          recent_jobs=recent_jobs,
                          my_jobs=my_jobs,
                          title='Repair Dashboard')
@@ -80,6 +86,57 @@ def technician_dashboard():
                          completed_this_month=completed_this_month,
                          title='Technician Dashboard')
 
+@repair_bp.route('/board')
+@login_required
+def board():
+    technician_id = request.args.get('technician_id', type=int)
+    if current_user.role == 'technician':
+        technician_id = current_user.id
+    
+    return jsonify(board_snapshot(technician_id))
+
+@repair_bp.route('/board/stream')
+@login_required
+def board_stream():
+    technician_id = request.args.get('technician_id', type=int)
+    if current_user.role == 'technician':
+        technician_id = current_user.id
+    
+    # EventSource sends Last-Event-ID on reconnect; first connect passes ?since=
+    last_event_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('since', 0, type=int)
+    
+    return Response(
+        stream_with_context(stream_events(last_event_id, technician_id)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@repair_bp.route('/analytics')
+@login_required
+def repair_analytics():
+    if current_user.role not in ['admin', 'manager']:
+        return jsonify({'success': False, 'message': 'Access denied'})
+    
+    metric = request.args.get('metric', 'turnaround')
+    dimension = request.args.get('dimension', 'all')
+    months = request.args.get('months', 1, type=int)
+    
+    # Last N calendar months, newest first
+    today = datetime.utcnow()
+    periods = []
+    year, month = today.year, today.month
+    for _ in range(max(months, 1)):
+        periods.append(f'{year:04d}-{month:02d}')
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    
+    return jsonify({
+        'success': True,
+        'metric': metric,
+        'dimension': dimension,
+        'periods': periods,
+        'rows': turnaround_report(metric, dimension, periods)
+    })
+
 @repair_bp.route('/intake', methods=['GET', 'POST'])
 @login_required
 def device_intake():
@@ -118,13 +175,37 @@ def device_intake():
         )
         
         db.session.add(repair_job)
+        publish_job_event(repair_job, 'created')
+        record_job_event(repair_job, 'repair_intake')
+        
+        # Hand the job to the least-loaded technician instead of leaving it queued
+        technician_id = None
+        if current_app.config.get('AUTO_ASSIGN_REPAIRS'):
+            technician_id = auto_assign(repair_job)
+        
         db.session.commit()
         
         flash(f'Device intake successful. Job Number: {job_number}', 'success')
+        if technician_id:
+            flash(f'Job assigned to {repair_job.technician.username}', 'info')
         return redirect(url_for('repair.job_detail', job_id=repair_job.id))
     
     return render_template('repair/device_intake.html', title='Device Intake')
 
+@repair_bp.route('/device-history')
+@login_required
+def device_history():
+    code = request.args.get('code', '').strip()
+    
+    if not code:
+        return jsonify({'success': False, 'message': 'IMEI or serial number required'})
+    
+    timeline = device_timeline(code)
+    if not timeline:
+        return jsonify({'success': False, 'message': 'Device not found'})
+    
+    return jsonify(dict(timeline, success=True))
+
 @repair_bp.route('/jobs')
 @login_required
 def job_list():
@@ -152,37 +233,191 @@ def job_list():
 @login_required
 def job_detail(job_id):
     job = RepairJob.query.get_or_404(job_id)
-    technicians = User.query.filter_by(role='technician', is_active=True).all()
-    spare_parts = Product.query.filter_by(is_active=True).all()
     
+    # Spare parts and technicians are fetched on demand from
+    # repair.parts_search and repair.technicians_search
     return render_template('repair/job_detail.html',
                          job=job,
-                         technicians=technicians,
-                         spare_parts=spare_parts,
                          title=f'Job {job.job_number}')
 
+@repair_bp.route('/technicians-search')
+@login_required
+def technicians_search():
+    search = request.args.get('q', '').strip()
+    limit = min(request.args.get('limit', 20, type=int), 50)
+    
+    query = db.session.query(User.id, User.username).filter(
+        User.role == 'technician',
+        User.is_active == True
+    )
+    if search:
+        query = query.filter(User.username.ilike(f'%{search}%'))
+    
+    technicians = query.order_by(User.username).limit(limit).all()
+    
+    return jsonify({
+        'success': True,
+        'technicians': [{'id': tech.id, 'username': tech.username} for tech in technicians]
+    })
+
+@repair_bp.route('/parts-search')
+@login_required
+def parts_search():
+    search = request.args.get('q', '').strip()
+    brand = request.args.get('brand', '').strip()
+    model = request.args.get('model', '').strip()
+    limit = min(request.args.get('limit', 20, type=int), 50)
+    
+    query = Product.query.filter(
+        Product.is_active == True,
+        Product.available_stock > 0
+    )
+    
+    # Only repair-relevant categories, once any have been flagged
+    part_categories = db.session.query(ProductCategory.id).filter_by(is_repair_part=True)
+    if part_categories.first():
+        query = query.filter(Product.category_id.in_(part_categories))
+    
+    if search:
+        query = query.filter(
+            db.or_(
+                Product.name.ilike(f'%{search}%'),
+                Product.sku.ilike(f'%{search}%'),
+                Product.description.ilike(f'%{search}%')
+            )
+        )
+    
+    # Device fit comes from part_compatibility: parts listed for the device,
+    # plus generic parts that have no compatibility rows at all
+    if brand or model:
+        query = query.filter(db.or_(_fits_device(brand, model), ~_fits_device(None, None)))
+    
+    # Parts made for the job's device come first, then brand-wide, then generic
+    ordering = [Product.name]
+    job_id = request.args.get('job_id', type=int)
+    if job_id:
+        job = RepairJob.query.get_or_404(job_id)
+        ordering.insert(0, db.case(
+            (_fits_device(job.brand, job.model, exact=True), 0),
+            (_fits_device(job.brand, None), 1),
+            else_=2
+        ))
+    
+    parts = query.with_entities(
+        Product.id, Product.sku, Product.name, Product.selling_price, Product.available_stock
+    ).order_by(*ordering).limit(limit).all()
+    
+    return jsonify({
+        'success': True,
+        'parts': [{
+            'id': part.id,
+            'sku': part.sku,
+            'name': part.name,
+            'selling_price': float(part.selling_price),
+            'available': part.available_stock
+        } for part in parts]
+    })
+
+def _fits_device(brand, model, exact=False):
+    """EXISTS clause: the product has a compatibility row for brand/model
+
+    A brand-wide row (model NULL) fits every model unless `exact` is set;
+    with neither brand nor model it matches any compatibility row.
+    """
+    condition = PartCompatibility.product_id == Product.id
+    if brand:
+        condition &= PartCompatibility.brand == brand.strip().lower()
+    if model:
+        model_match = PartCompatibility.model == model.strip().lower()
+        condition &= model_match if exact else db.or_(model_match, PartCompatibility.model.is_(None))
+    return db.exists().where(condition)
+
+@repair_bp.route('/part-compatibility/<int:product_id>', methods=['POST'])
+@login_required
+def part_compatibility(product_id):
+    if current_user.role != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('index'))
+    
+    product = Product.query.get_or_404(product_id)
+    
+    # Comma-separated devices, each "Brand/Model" or just "Brand" for every model
+    devices = set()
+    for entry in request.form.get('devices', '').split(','):
+        brand, _, model = entry.partition('/')
+        if brand.strip():
+            devices.add((brand.strip().lower(), model.strip().lower() or None))
+    
+    PartCompatibility.query.filter_by(product_id=product_id).delete()
+    for brand, model in devices:
+        db.session.add(PartCompatibility(product_id=product_id, brand=brand, model=model))
+    
+    db.session.commit()
+    
+    flash(f'Compatible devices updated for {product.name}', 'success')
+    return redirect(request.referrer or url_for('inventory.product_detail', product_id=product_id))
+
 @repair_bp.route('/assign-technician/<int:job_id>', methods=['POST'])
 @login_required
 def assign_technician(job_id):
     job = RepairJob.query.get_or_404(job_id)
     technician_id = request.form.get('technician_id', type=int)
+    previous_status = job.status
+    previous_technician_id = job.technician_id
     
     if technician_id:
         technician = User.query.get(technician_id)
         if technician and technician.role == 'technician':
             job.technician_id = technician_id
             job.status = 'diagnostic'
+            publish_job_event(job, 'assigned', previous_status,
+                              previous_technician_id=previous_technician_id)
             db.session.commit()
             flash(f'Job assigned to {technician.username}', 'success')
         else:
             flash('Invalid technician', 'danger')
     else:
         job.technician_id = None
+        publish_job_event(job, 'assigned', previous_status,
+                          previous_technician_id=previous_technician_id)
         db.session.commit()
         flash('Technician removed from job', 'info')
     
     return redirect(url_for('repair.job_detail', job_id=job_id))
 
+@repair_bp.route('/rebalance', methods=['POST'])
+@login_required
+def rebalance_jobs():
+    if current_user.role not in ['admin', 'manager']:
+        flash('Access denied', 'danger')
+        return redirect(url_for('index'))
+    
+    moved = rebalance()
+    db.session.commit()
+    
+    flash(f'{moved} jobs assigned or moved', 'success' if moved else 'info')
+    return redirect(url_for('repair.repair_dashboard'))
+
+@repair_bp.route('/technician-skills/<int:technician_id>', methods=['POST'])
+@login_required
+def technician_skills(technician_id):
+    if current_user.role != 'admin':
+        flash('Access denied', 'danger')
+        return redirect(url_for('index'))
+    
+    technician = User.query.get_or_404(technician_id)
+    brands = {b.strip().lower() for b in request.form.get('brands', '').split(',') if b.strip()}
+    
+    TechnicianSkill.query.filter_by(technician_id=technician_id).delete()
+    for brand in brands:
+        db.session.add(TechnicianSkill(technician_id=technician_id, brand=brand))
+    
+    db.session.commit()
+    get_scheduler().invalidate()
+    
+    flash(f'Skills updated for {technician.username}', 'success')
+    return redirect(request.referrer or url_for('repair.repair_dashboard'))
+
 @repair_bp.route('/update-status/<int:job_id>', methods=['POST'])
 @login_required
 def update_status(job_id):
@@ -192,14 +427,17 @@ def update_status(job_id):
     valid_statuses = ['received', 'diagnostic', 'repairing', 'waiting_parts', 'completed', 'delivered']
     
     if new_status in valid_statuses:
+        previous_status = job.status
         job.status = new_status
         
         # Set dates based on status
         if new_status == 'completed' and not job.completed_date:
             job.completed_date = datetime.utcnow()
+            job.warranty_expires_at = warranty_end(job.completed_date, job.warranty_period)
         elif new_status == 'delivered' and not job.delivered_date:
             job.delivered_date = datetime.utcnow()
         
+        publish_job_event(job, 'status', previous_status)
         db.session.commit()
         flash(f'Status updated to {new_status}', 'success')
     else:
@@ -219,10 +457,12 @@ def add_diagnosis(job_id):
     diagnosis = request.form.get('diagnosis_details', '')
     estimated_cost = request.form.get('estimated_cost', type=float, default=0)
     
+    previous_status = job.status
     job.diagnosis_details = diagnosis
     job.estimated_cost = estimated_cost
     job.status = 'waiting_parts' if request.form.get('needs_parts') else 'repairing'
     
+    publish_job_event(job, 'status', previous_status)
     db.session.commit()
     flash('Diagnosis added successfully', 'success')
     
@@ -241,44 +481,31 @@ def add_spare_part(job_id):
         flash('Product not found', 'danger')
         return redirect(url_for('repair.job_detail', job_id=job_id))
     
-    # Check stock availability
-    available_stock = StockItem.query.filter_by(
-        product_id=product_id,
-        status='available'
-    ).count()
-    
-    if available_stock < quantity:
-        flash(f'Only {available_stock} items available in stock', 'danger')
+    # Mark stock items as used
+    try:
+        stock_item_ids = claim_stock(product_id, quantity, status='used')
+    except StockError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
         return redirect(url_for('repair.job_detail', job_id=job_id))
     
-    # Get stock items to use
-    stock_items = StockItem.query.filter_by(
-        product_id=product_id,
-        status='available'
-    ).limit(quantity).all()
-    
-    total_price = 0
-    
-    for stock_item in stock_items:
-        repair_item = RepairItem(
-            repair_job_id=job_id,
-            product_id=product_id,
-            stock_item_id=stock_item.id,
-            quantity=1,
-            unit_price=product.selling_price,
-            total_price=product.selling_price
-        )
-        
-        db.session.add(repair_item)
-        
-        # Mark stock item as used
-        stock_item.status = 'used'
-        
-        total_price += product.selling_price
+    # One bulk INSERT for all consumed units
+    db.session.execute(db.insert(RepairItem), [{
+        'repair_job_id': job_id,
+        'product_id': product_id,
+        'stock_item_id': stock_item_id,
+        'quantity': 1,
+        'unit_price': product.selling_price,
+        'total_price': product.selling_price
+    } for stock_item_id in stock_item_ids])
+    
+    total_price = product.selling_price * len(stock_item_ids)
     
     # Update job cost
     job.final_cost += total_price
     
+    publish_job_event(job, 'part_added', job.status,
+                      product_id=product_id, product_name=product.name, quantity=quantity)
     db.session.commit()
     flash(f'{quantity} {product.name} added to job', 'success')
     
@@ -290,12 +517,14 @@ def customer_approval(job_id):
     job = RepairJob.query.get_or_404(job_id)
     
     approval = request.form.get('approval') == 'yes'
+    previous_status = job.status
     job.customer_approval = approval
     job.approval_date = datetime.utcnow() if approval else None
     
     if approval:
         job.status = 'repairing'
     
+    publish_job_event(job, 'status', previous_status, customer_approval=approval)
     db.session.commit()
     
     if approval:
@@ -312,11 +541,15 @@ def complete_job(job_id):
     repair_details = request.form.get('repair_details', '')
     warranty_period = request.form.get('warranty_period', type=int, default=0)
     
+    previous_status = job.status
     job.repair_details = repair_details
     job.warranty_period = warranty_period
     job.status = 'completed'
     job.completed_date = datetime.utcnow()
+    job.warranty_expires_at = warranty_end(job.completed_date, warranty_period)
     
+    publish_job_event(job, 'status', previous_status)
+    record_job_event(job, 'repair_completed', job.completed_date)
     db.session.commit()
     flash('Job marked as completed', 'success')
     
@@ -327,19 +560,111 @@ def complete_job(job_id):
 def deliver_job(job_id):
     job = RepairJob.query.get_or_404(job_id)
     
+    if Invoice.query.filter_by(repair_job_id=job.id).first():
+        flash('This job has already been invoiced', 'warning')
+        return redirect(url_for('repair.job_detail', job_id=job_id))
+    
     payment_method = request.form.get('payment_method', 'cash')
-    amount_paid = request.form.get('amount_paid', type=float, default=job.final_cost)
+    amount_paid = request.form.get('amount_paid', type=float)
+    labour_charge = request.form.get('labour_charge', type=float)
+    tax_rate = request.form.get('tax_rate', type=float, default=0.0)
     
     # Mark as delivered
+    previous_status = job.status
     job.status = 'delivered'
     job.delivered_date = datetime.utcnow()
     
-    # TODO: Create invoice for repair job
+    # Invoice labour and consumed parts so repair revenue reaches sales reports
+    try:
+        invoice = create_repair_invoice(
+            job,
+            generate_invoice_number(),
+            labour_charge=labour_charge,
+            payment_method=payment_method,
+            amount_paid=amount_paid,
+            tax_rate=tax_rate,
+            user_id=current_user.id
+        )
+        
+        publish_job_event(job, 'status', previous_status)
+        record_job_event(job, 'repair_delivered', job.delivered_date, invoice_id=invoice.id)
+        db.session.commit()
+    except IntegrityError:
+        # Only a concurrent submit that invoiced the job first
+        # (uq_invoice_repair_job) is expected here; anything else is a bug
+        db.session.rollback()
+        if not db.session.query(Invoice.id).filter(Invoice.repair_job_id == job_id).first():
+            raise
+        flash('This job has already been invoiced', 'warning')
+        return redirect(url_for('repair.job_detail', job_id=job_id))
+    
+    flash(f'Device delivered to customer. Invoice {invoice.invoice_number}', 'success')
     
+    return redirect(url_for('repair.job_detail', job_id=job_id))
+
+@repair_bp.route('/job/<int:job_id>/attachments', methods=['POST'])
+@login_required
+def upload_attachment(job_id):
+    job = RepairJob.query.get_or_404(job_id)
+    content_type = request.mimetype
+    
+    # The body is the raw file; large files may come in Content-Range parts
+    try:
+        upload_id, stored = receive_upload(
+            request.stream,
+            content_type,
+            content_range=request.headers.get('Content-Range'),
+            upload_id=request.headers.get('Upload-Id')
+        )
+    except UploadError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    if stored is None:
+        return jsonify({'success': True, 'complete': False, 'upload_id': upload_id})
+    
+    content_hash, size = stored
+    attachment = RepairAttachment(
+        repair_job_id=job.id,
+        kind=request.args.get('kind', 'photo'),
+        content_hash=content_hash,
+        filename=request.args.get('filename', '')[:255],
+        content_type=content_type,
+        size=size,
+        uploaded_by=current_user.id
+    )
+    db.session.add(attachment)
     db.session.commit()
-    flash('Device delivered to customer', 'success')
     
-    return redirect(url_for('repair.job_detail', job_id=job_id))
+    schedule_thumbnail(content_hash, content_type)
+    
+    return jsonify({
+        'success': True,
+        'complete': True,
+        'attachment_id': attachment.id,
+        'url': url_for('repair.attachment', attachment_id=attachment.id)
+    })
+
+@repair_bp.route('/attachment/<int:attachment_id>')
+@login_required
+def attachment(attachment_id):
+    attachment = RepairAttachment.query.get_or_404(attachment_id)
+    
+    path = stored_path(attachment.content_hash)
+    mimetype = attachment.content_type
+    if request.args.get('thumb'):
+        path = thumbnail_path(attachment.content_hash)
+        mimetype = 'image/jpeg'
+    
+    if not os.path.exists(path):
+        abort(404)
+    
+    # Stored files never change, so let browsers keep them; Range requests
+    # and conditional GETs are handled by send_file
+    response = send_file(path, mimetype=mimetype, conditional=True,
+                         etag=attachment.content_hash + ('-thumb' if request.args.get('thumb') else ''),
+                         max_age=31536000, download_name=attachment.filename or None)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
 
 @repair_bp.route('/job-card/<int:job_id>')
 @login_required
@@ -364,27 +689,72 @@ def generate_job_number():
 
 @repair_bp.route('/warranty-jobs')
 @login_required
+@read_replica
 def warranty_jobs():
-    # Get jobs with warranty
+    page = request.args.get('page', 1, type=int)
+    per_page = 20
+    now = datetime.utcnow()
+    
+    # Get jobs with warranty, newest expiry first (served from the expiry index)
     jobs = RepairJob.query.filter(
-        RepairJob.warranty_period > 0,
-        RepairJob.completed_date.isnot(None)
-    ).order_by(RepairJob.completed_date.desc()).all()
+        RepairJob.warranty_expires_at.isnot(None)
+    ).order_by(RepairJob.warranty_expires_at.desc()).paginate(page=page, per_page=per_page)
     
-    # Check warranty status for each job
     warranty_data = []
-    for job in jobs:
-        if job.completed_date:
-            warranty_end = job.completed_date + datetime.timedelta(days=30 * job.warranty_period)
-            is_active = datetime.utcnow() <= warranty_end
-            
-            warranty_data.append({
-                'job': job,
-                'warranty_end': warranty_end,
-                'is_active': is_active,
-                'days_remaining': (warranty_end - datetime.utcnow()).days if is_active else 0
-            })
+    for job in jobs.items:
+        is_active = now <= job.warranty_expires_at
+        
+        warranty_data.append({
+            'job': job,
+            'warranty_end': job.warranty_expires_at,
+            'is_active': is_active,
+            'days_remaining': (job.warranty_expires_at - now).days if is_active else 0
+        })
     
     return render_template('repair/warranty_jobs.html',
                          warranty_data=warranty_data,
-                         title='Warranty Jobs')
\ No newline at end of file
+                         jobs=jobs,
+                         title='Warranty Jobs')
+
+@repair_bp.route('/warranty-lookup')
+@login_required
+def warranty_lookup():
+    imei = request.args.get('imei', '').strip()
+    phone = request.args.get('phone', '').strip()
+    invoice_number = request.args.get('invoice', '').strip()
+    
+    if not (imei or phone or invoice_number):
+        return jsonify({'success': False, 'message': 'IMEI, phone or invoice number required'})
+    
+    result = lookup(imei=imei or None, phone=phone or None, invoice_number=invoice_number or None)
+    return jsonify(dict(result, success=True))
+
+@repair_bp.route('/warranty-expiring')
+@login_required
+@read_replica
+def warranty_expiring():
+    days = request.args.get('days', 30, type=int)
+    kind = request.args.get('kind', 'repair')
+    page = request.args.get('page', 1, type=int)
+    
+    if kind == 'sale':
+        pagination = expiring_sales(days, page=page)
+        items = [{
+            'invoice_id': item.invoice_id,
+            'product_id': item.product_id,
+            'stock_item_id': item.stock_item_id,
+            'warranty_expires_at': item.warranty_expires_at.isoformat()
+        } for item in pagination.items]
+    else:
+        pagination = expiring_repairs(days, page=page)
+        items = [repair_row(job) for job in pagination.items]
+    
+    return jsonify({
+        'success': True,
+        'kind': kind,
+        'days': days,
+        'page': pagination.page,
+        'pages': pagination.pages,
+        'total': pagination.total,
+        'items': items
+    })
@@ -0,0 +1,210 @@
+"""Load-balancing technician assignment for repair jobs.
+
+TechnicianScheduler keeps every active technician's open-job count in a heap,
+plus one heap per brand for technicians with that brand as a skill. Picking a
+technician is a heap peek (O(log n) amortized with lazy deletion), and counts
+are updated incrementally from repair job events instead of re-scanning jobs.
+The in-memory state is rebuilt from the database after a rollback and every
+REPAIR_SCHEDULER_TTL seconds, which also picks up changes made by other
+worker processes.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+from flask import current_app, has_app_context
+from app import db
+from modules.models import RepairJob, TechnicianSkill, User
+from modules.events import OPEN_STATUSES, on_job_transition, publish_job_event
+
+# Jobs a technician has been given but not started can still be moved
+MOVABLE_STATUSES = ['received', 'diagnostic']
+
+
+class TechnicianScheduler:
+    """Priority queue of technicians ordered by open-job count"""
+
+    def __init__(self, max_open_jobs=8, affinity_slack=2, ttl=60):
+        self.max_open_jobs = max_open_jobs
+        self.affinity_slack = affinity_slack
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._seq = itertools.count()
+        self._built_at = None
+        self.loads = {}
+        self.skills = {}
+
+    def invalidate(self):
+        with self._lock:
+            self._built_at = None
+
+    def rebuild(self):
+        """Reload technicians, skills and open-job counts (three queries)"""
+        technician_ids = [user_id for (user_id,) in db.session.query(User.id).filter_by(
+            role='technician', is_active=True
+        )]
+
+        loads = dict(
+            db.session.query(RepairJob.technician_id, db.func.count(RepairJob.id))
+            .filter(RepairJob.technician_id.in_(technician_ids),
+                    RepairJob.status.in_(OPEN_STATUSES))
+            .group_by(RepairJob.technician_id)
+            .all()
+        ) if technician_ids else {}
+
+        skills = {}
+        for technician_id, brand in db.session.query(TechnicianSkill.technician_id, TechnicianSkill.brand).filter(
+            TechnicianSkill.technician_id.in_(technician_ids)
+        ):
+            skills.setdefault(technician_id, set()).add(brand.lower())
+
+        with self._lock:
+            self.loads = {technician_id: loads.get(technician_id, 0) for technician_id in technician_ids}
+            self.skills = skills
+            self._heaps = {}
+            self._current = {}
+            for technician_id in technician_ids:
+                self._push(technician_id)
+            self._built_at = time.monotonic()
+
+    def pick(self, brand=None):
+        """Return the best technician id for a job on `brand`, or None if all are full"""
+        with self._lock:
+            self._ensure_fresh()
+
+            best = self._top(None)
+            if brand:
+                skilled = self._top(brand.lower())
+                # Prefer a specialist unless they are clearly busier than a generalist
+                if skilled and (best is None or skilled[0] <= best[0] + self.affinity_slack):
+                    best = skilled
+
+            if best is None or best[0] >= self.max_open_jobs:
+                return None
+            return best[2]
+
+    def record_transition(self, previous_technician_id, previous_status, technician_id, status):
+        """Apply one job's move between technicians and/or statuses"""
+        was_open = previous_technician_id if previous_status in OPEN_STATUSES else None
+        is_open = technician_id if status in OPEN_STATUSES else None
+        if was_open == is_open:
+            return
+
+        with self._lock:
+            if self._built_at is None:
+                return
+            for tech, delta in ((was_open, -1), (is_open, 1)):
+                if tech in self.loads:
+                    self.loads[tech] = max(self.loads[tech] + delta, 0)
+                    self._push(tech)
+
+    def _ensure_fresh(self):
+        if self._built_at is None or time.monotonic() - self._built_at > self.ttl:
+            self.rebuild()
+
+    def _push(self, technician_id):
+        seq = next(self._seq)
+        entry = (self.loads[technician_id], seq, technician_id)
+        self._current[technician_id] = seq
+
+        for key in itertools.chain([None], self.skills.get(technician_id, ())):
+            heap = self._heaps.setdefault(key, [])
+            heapq.heappush(heap, entry)
+            # Drop stale entries once they outnumber live ones
+            if len(heap) > 2 * len(self.loads) + 16:
+                self._heaps[key] = heap = [e for e in heap if self._current.get(e[2]) == e[1]]
+                heapq.heapify(heap)
+
+    def _top(self, key):
+        heap = self._heaps.get(key)
+        while heap and self._current.get(heap[0][2]) != heap[0][1]:
+            heapq.heappop(heap)
+        return heap[0] if heap else None
+
+
+def get_scheduler():
+    """The current app's scheduler, created on first use"""
+    scheduler = current_app.extensions.get('repair_scheduler')
+    if scheduler is None:
+        scheduler = current_app.extensions['repair_scheduler'] = TechnicianScheduler(
+            max_open_jobs=current_app.config.get('TECHNICIAN_MAX_OPEN_JOBS', 8),
+            affinity_slack=current_app.config.get('TECHNICIAN_AFFINITY_SLACK', 2),
+            ttl=current_app.config.get('REPAIR_SCHEDULER_TTL', 60)
+        )
+    return scheduler
+
+
+@on_job_transition
+def _record_transition(job, previous_technician_id, previous_status):
+    if has_app_context() and 'repair_scheduler' in current_app.extensions:
+        current_app.extensions['repair_scheduler'].record_transition(
+            previous_technician_id, previous_status, job.technician_id, job.status
+        )
+
+
+def _discard():
+    if has_app_context() and 'repair_scheduler' in current_app.extensions:
+        current_app.extensions['repair_scheduler'].invalidate()
+
+
+_record_transition.discard = _discard
+
+
+def auto_assign(job):
+    """Give a new job to the least-loaded suitable technician.
+
+    Returns the technician id, or None when everyone is at capacity.
+    """
+    technician_id = get_scheduler().pick(job.brand)
+    if technician_id:
+        previous_status = job.status
+        job.technician_id = technician_id
+        job.status = 'diagnostic'
+        publish_job_event(job, 'assigned', previous_status, previous_technician_id=None)
+    return technician_id
+
+
+def rebalance():
+    """Assign waiting jobs and even out technician workloads.
+
+    Unassigned open jobs are handed out oldest first. Then not-yet-started jobs
+    move from the busiest technicians while that narrows the gap by more than
+    one job. Returns the number of jobs assigned or moved.
+    """
+    scheduler = get_scheduler()
+    scheduler.rebuild()
+    moved = 0
+
+    waiting = RepairJob.query.filter(
+        RepairJob.technician_id.is_(None),
+        RepairJob.status.in_(OPEN_STATUSES)
+    ).order_by(RepairJob.created_at).all()
+
+    for job in waiting:
+        if not auto_assign(job):
+            break
+        moved += 1
+
+    movable = RepairJob.query.filter(
+        RepairJob.technician_id.in_(list(scheduler.loads)),
+        RepairJob.status.in_(MOVABLE_STATUSES),
+        RepairJob.diagnosis_details.is_(None)
+    ).order_by(RepairJob.created_at.desc()).all()
+
+    by_technician = {}
+    for job in movable:
+        by_technician.setdefault(job.technician_id, []).append(job)
+
+    for source in sorted(by_technician, key=lambda t: scheduler.loads[t], reverse=True):
+        for job in by_technician[source]:
+            target = scheduler.pick(job.brand)
+            if not target or target == source or scheduler.loads[target] + 1 >= scheduler.loads[source]:
+                break
+            previous_status = job.status
+            job.technician_id = target
+            job.status = 'diagnostic'
+            publish_job_event(job, 'assigned', previous_status, previous_technician_id=source)
+            moved += 1
+
+    return moved
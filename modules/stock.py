@@ -0,0 +1,149 @@
+"""Stock claiming with optimistic concurrency.
+
+Every transition of a StockItem out of 'available' goes through claim_stock().
+Each unit is taken with a compare-and-swap UPDATE on StockItem.version, so two
+terminals racing for the same row can never both win it. Losers simply retry
+with fresh candidates instead of waiting on a lock.
+"""
+import random
+
+from flask import current_app
+from app import db
+from modules.models import Product, StockItem
+
+# Dialects that understand SELECT ... FOR UPDATE SKIP LOCKED
+SKIP_LOCKED_DIALECTS = ('postgresql', 'mysql', 'mariadb', 'oracle')
+
+
+class StockError(Exception):
+    """Base class for stock claim failures"""
+
+
+class InsufficientStockError(StockError):
+    """Not enough available units to satisfy the claim"""
+
+    def __init__(self, product_id, requested, available):
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+        super().__init__(f'Only {available} items available')
+
+
+class StockConflictError(StockError):
+    """Concurrent claims kept taking or holding our candidates until retries ran out"""
+
+    def __init__(self, product_id, requested, claimed):
+        self.product_id = product_id
+        self.requested = requested
+        self.claimed = claimed
+        super().__init__('Stock is busy, please try again')
+
+
+def claim_stock(product_id, quantity=1, status='sold', max_retries=None, **values):
+    """Move `quantity` available units of a product to `status`.
+
+    Extra keyword arguments are written to the claimed rows (e.g. notes,
+    stock_type). Returns the list of claimed StockItem ids. The caller owns the
+    transaction and must roll back when a StockError is raised, which also
+    releases any units claimed before the failure.
+    """
+    if quantity <= 0:
+        return []
+
+    if max_retries is None:
+        max_retries = current_app.config.get('STOCK_CLAIM_RETRIES', 3)
+
+    values['status'] = status
+    claimed = []
+
+    for _ in range(max_retries + 1):
+        needed = quantity - len(claimed)
+        candidates = _select_candidates(product_id, needed)
+
+        # SKIP LOCKED leaves out rows other terminals hold right now, so a
+        # short list only means insufficient stock if the rows aren't there
+        # at all; otherwise they're contended and we try again
+        if len(candidates) < needed:
+            available = _count_available(product_id)
+            if available < needed:
+                raise InsufficientStockError(product_id, quantity, len(claimed) + available)
+
+        for item_id, version in candidates:
+            if _compare_and_swap(item_id, version, values):
+                claimed.append(item_id)
+                if len(claimed) == quantity:
+                    adjust_available_stock(product_id, -quantity)
+                    return claimed
+
+    raise StockConflictError(product_id, quantity, len(claimed))
+
+
+def adjust_available_stock(product_id, delta):
+    """Atomically shift a product's available_stock counter by `delta`
+
+    The counter is owned by these SQL-side updates, so Product.version is
+    left alone: a sale must not invalidate a product edit in progress.
+    """
+    if not delta:
+        return
+
+    db.session.execute(
+        db.update(Product)
+        .where(Product.id == product_id)
+        .values(available_stock=Product.available_stock + delta)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def sync_stock_counters():
+    """Rebuild every product's available_stock from the stock_items table"""
+    available = db.select(db.func.count(StockItem.id)).where(
+        StockItem.product_id == Product.id,
+        StockItem.status == 'available'
+    ).scalar_subquery()
+
+    db.session.execute(
+        db.update(Product)
+        .values(available_stock=available)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def _select_candidates(product_id, needed):
+    """Pick (id, version) pairs of available units to try claiming"""
+    query = db.session.query(StockItem.id, StockItem.version).filter(
+        StockItem.product_id == product_id,
+        StockItem.status == 'available'
+    ).order_by(StockItem.id)
+
+    if db.engine.dialect.name in SKIP_LOCKED_DIALECTS:
+        # Rows locked by another terminal are skipped rather than waited on
+        return query.with_for_update(skip_locked=True).limit(needed).all()
+
+    # Without row locks, spread concurrent claimers over a wider window so they
+    # don't all fight over the oldest rows
+    spread = current_app.config.get('STOCK_CLAIM_SPREAD', 4)
+    candidates = query.limit(needed * spread).all()
+    random.shuffle(candidates)
+    return candidates
+
+
+def _count_available(product_id):
+    """Available units of a product, including rows other claimers have locked"""
+    return db.session.query(db.func.count(StockItem.id)).filter(
+        StockItem.product_id == product_id,
+        StockItem.status == 'available'
+    ).scalar()
+
+
+def _compare_and_swap(item_id, version, values):
+    """Claim one row if nobody changed it since we read it"""
+    result = db.session.execute(
+        db.update(StockItem)
+        .where(StockItem.id == item_id,
+               StockItem.version == version,
+               StockItem.status == 'available')
+        .values(version=version + 1, **values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
@@ -0,0 +1,306 @@
+"""Stock-take (cycle count) reconciliation.
+
+Handheld scanners upload batches of codes into a StockTake session. Serialized
+units (IMEI or serial number) are matched individually; everything else is
+counted per SKU. Reconciliation loads the scans and the expected shelf stock
+with a handful of set-based queries and diffs them in memory, so the cost does
+not grow with per-item lookups.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from app import db
+from modules.models import Product, StockItem, StockTakeScan
+from modules.stock import adjust_available_stock
+
+# Keep IN (...) lists under SQLite's bound parameter limit
+CHUNK_SIZE = 500
+
+
+def add_scans(stock_take, codes, device_id=None):
+    """Bulk insert a batch of scanned codes, returns (stored, rejected codes)
+
+    SKUs of IMEI-tracked products are rejected: each of those units has to
+    be counted by its own IMEI, never as a quantity.
+    """
+    now = datetime.utcnow()
+    codes = [code for code in (str(c).strip() for c in codes) if code]
+    rejected = serialized_skus(codes)
+    rows = [
+        {'stock_take_id': stock_take.id, 'code': code, 'device_id': device_id, 'scanned_at': now}
+        for code in codes
+        if code not in rejected
+    ]
+
+    if rows:
+        db.session.execute(db.insert(StockTakeScan), rows)
+
+    return len(rows), sorted(rejected)
+
+
+def serialized_skus(codes):
+    """The codes that are SKUs of products tracked by IMEI"""
+    found = set()
+    for chunk in _chunks(set(codes)):
+        found.update(sku for (sku,) in db.session.query(Product.sku).filter(
+            Product.sku.in_(chunk),
+            Product.has_imei == True
+        ))
+    return found
+
+
+def reconcile(stock_take):
+    """Diff the session's scans against expected available stock.
+
+    Returns a dict with matched/missing/misplaced/unexpected serialized units
+    and per-product quantity variances for non-serialized stock. Serialized
+    codes scanned more than once are listed in duplicate_scans, and codes
+    that match more than one stock row are listed in ambiguous and left out
+    of the other lists, so apply_adjustments never guesses between units.
+    SKU scans of IMEI-tracked products are listed in serialized_sku_scans and
+    not counted, so no unit without an IMEI is ever added for them.
+    """
+    location = stock_take.location
+    counts = Counter(
+        code for (code,) in db.session.query(StockTakeScan.code).filter(
+            StockTakeScan.stock_take_id == stock_take.id
+        )
+    )
+    scanned = set(counts)
+
+    # Everything that should be on this shelf
+    expected_rows = db.session.query(
+        StockItem.id, StockItem.product_id, StockItem.imei, StockItem.serial_number
+    ).filter(
+        StockItem.location == location,
+        StockItem.status == 'available'
+    ).all()
+
+    expected_serialized = defaultdict(list)
+    expected_quantities = Counter()
+    for row in expected_rows:
+        code = row.imei or row.serial_number
+        if code:
+            expected_serialized[code].append(row)
+        else:
+            expected_quantities[row.product_id] += 1
+
+    ambiguous = {code: rows for code, rows in expected_serialized.items() if len(rows) > 1}
+    expected_serialized = {code: rows[0] for code, rows in expected_serialized.items() if code not in ambiguous}
+
+    matched = scanned & expected_serialized.keys()
+    missing = expected_serialized.keys() - scanned
+    leftover = scanned - matched - ambiguous.keys()
+
+    # Leftover codes are either SKUs or units recorded somewhere else
+    skus = {}
+    serialized_sku_scans = []
+    for chunk in _chunks(leftover):
+        for product_id, sku, has_imei in db.session.query(Product.id, Product.sku, Product.has_imei).filter(
+            Product.sku.in_(chunk)
+        ):
+            if has_imei:
+                serialized_sku_scans.append({'code': sku, 'product_id': product_id, 'count': counts[sku]})
+            else:
+                skus[sku] = product_id
+    leftover -= skus.keys()
+    leftover -= {entry['code'] for entry in serialized_sku_scans}
+
+    found_elsewhere = defaultdict(list)
+    for chunk in _chunks(leftover):
+        rows = db.session.query(
+            StockItem.id, StockItem.product_id, StockItem.imei, StockItem.serial_number,
+            StockItem.location, StockItem.status
+        ).filter(
+            db.or_(StockItem.imei.in_(chunk), StockItem.serial_number.in_(chunk))
+        )
+        for row in rows:
+            for code in {row.imei, row.serial_number} & leftover:
+                found_elsewhere[code].append(row)
+
+    misplaced = []
+    unexpected = []
+    for code in sorted(leftover):
+        rows = found_elsewhere.get(code, [])
+        if len(rows) > 1:
+            ambiguous[code] = rows
+            continue
+        row = rows[0] if rows else None
+        if row and row.status == 'available':
+            misplaced.append({
+                'code': code,
+                'stock_item_id': row.id,
+                'product_id': row.product_id,
+                'recorded_location': row.location
+            })
+        else:
+            unexpected.append({
+                'code': code,
+                'stock_item_id': row.id if row else None,
+                'product_id': row.product_id if row else None,
+                'status': row.status if row else None
+            })
+
+    counted_quantities = Counter({product_id: counts[sku] for sku, product_id in skus.items()})
+    quantity_variances = []
+    for product_id in sorted(expected_quantities.keys() | counted_quantities.keys()):
+        variance = counted_quantities[product_id] - expected_quantities[product_id]
+        if variance:
+            quantity_variances.append({
+                'product_id': product_id,
+                'expected': expected_quantities[product_id],
+                'counted': counted_quantities[product_id],
+                'variance': variance
+            })
+
+    return {
+        'stock_take_id': stock_take.id,
+        'location': location,
+        'scanned': sum(counts.values()),
+        'matched': len(matched),
+        'missing': [
+            {
+                'code': code,
+                'stock_item_id': expected_serialized[code].id,
+                'product_id': expected_serialized[code].product_id
+            }
+            for code in sorted(missing)
+        ],
+        'misplaced': misplaced,
+        'unexpected': unexpected,
+        'ambiguous': [
+            {
+                'code': code,
+                'stock_item_ids': [row.id for row in ambiguous[code]],
+                'scanned': counts[code]
+            }
+            for code in sorted(ambiguous)
+        ],
+        'duplicate_scans': [
+            {'code': code, 'count': counts[code]}
+            for code in sorted(matched | leftover | ambiguous.keys())
+            if counts[code] > 1
+        ],
+        'serialized_sku_scans': sorted(serialized_sku_scans, key=lambda entry: entry['code']),
+        'quantity_variances': quantity_variances
+    }
+
+
+def apply_adjustments(stock_take, result=None, notes=None):
+    """Write a reconciliation back to stock in bulk.
+
+    Missing units are marked 'missing', misplaced units move to this location,
+    previously missing units that turned up are restored, and SKU variances
+    write off or add stock. Returns a summary of the changes.
+    """
+    if result is None:
+        result = reconcile(stock_take)
+
+    location = stock_take.location
+    notes = notes or f'Stock take #{stock_take.id}'
+    summary = Counter()
+
+    # Missing serialized units
+    missing_by_product = defaultdict(list)
+    for entry in result['missing']:
+        missing_by_product[entry['product_id']].append(entry['stock_item_id'])
+    for product_id, ids in missing_by_product.items():
+        changed = _bulk_update(ids, {'status': 'missing', 'notes': notes}, StockItem.status == 'available')
+        adjust_available_stock(product_id, -changed)
+        summary['marked_missing'] += changed
+
+    # Units that are on this shelf but recorded elsewhere
+    misplaced_ids = [entry['stock_item_id'] for entry in result['misplaced']]
+    summary['relocated'] += _bulk_update(misplaced_ids, {'location': location}, StockItem.status == 'available')
+
+    # Units written off earlier that have turned up again
+    found_by_product = defaultdict(list)
+    for entry in result['unexpected']:
+        if entry['status'] == 'missing':
+            found_by_product[entry['product_id']].append(entry['stock_item_id'])
+    for product_id, ids in found_by_product.items():
+        changed = _bulk_update(
+            ids,
+            {'status': 'available', 'location': location, 'notes': notes},
+            StockItem.status == 'missing'
+        )
+        adjust_available_stock(product_id, changed)
+        summary['restored'] += changed
+
+    # Non-serialized quantity differences
+    surplus = {v['product_id']: v['variance'] for v in result['quantity_variances'] if v['variance'] > 0}
+    for variance in result['quantity_variances']:
+        if variance['variance'] < 0:
+            summary['written_off'] += _write_off(variance['product_id'], -variance['variance'], location, notes)
+    if surplus:
+        summary['added'] += _add_surplus(surplus, location, notes)
+
+    stock_take.status = 'applied'
+    stock_take.applied_at = datetime.utcnow()
+
+    return dict(summary)
+
+
+def _write_off(product_id, quantity, location, notes):
+    """Mark `quantity` non-serialized units on this shelf as missing"""
+    ids = [item_id for (item_id,) in db.session.query(StockItem.id).filter(
+        StockItem.product_id == product_id,
+        StockItem.location == location,
+        StockItem.status == 'available',
+        StockItem.imei.is_(None),
+        StockItem.serial_number.is_(None)
+    ).limit(quantity)]
+
+    changed = _bulk_update(ids, {'status': 'missing', 'notes': notes}, StockItem.status == 'available')
+    adjust_available_stock(product_id, -changed)
+    return changed
+
+
+def _add_surplus(surplus, location, notes):
+    """Create stock rows for counted units that were not on record"""
+    # IMEI-tracked units are only ever created with their IMEI
+    products = db.session.query(
+        Product.id, Product.purchase_price, Product.selling_price
+    ).filter(Product.id.in_(list(surplus)), Product.has_imei.isnot(True)).all()
+
+    rows = []
+    now = datetime.utcnow()
+    for product in products:
+        rows.extend([{
+            'product_id': product.id,
+            'stock_type': 'in',
+            'quantity': 1,
+            'purchase_price': product.purchase_price,
+            'selling_price': product.selling_price,
+            'location': location,
+            'status': 'available',
+            'notes': notes,
+            'version': 1,
+            'created_at': now
+        }] * surplus[product.id])
+        adjust_available_stock(product.id, surplus[product.id])
+
+    if rows:
+        db.session.execute(db.insert(StockItem), rows)
+
+    return len(rows)
+
+
+def _bulk_update(ids, values, guard):
+    """Update stock rows by id in chunks, returns how many rows changed"""
+    changed = 0
+    for chunk in _chunks(ids):
+        result = db.session.execute(
+            db.update(StockItem)
+            .where(StockItem.id.in_(chunk), guard)
+            .values(version=StockItem.version + 1, **values)
+            .execution_options(synchronize_session=False)
+        )
+        changed += result.rowcount
+    return changed
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
@@ -0,0 +1,108 @@
+"""Template compilation and the cached navigation.
+
+Compiled templates are kept in a Jinja bytecode cache on disk
+(TEMPLATE_CACHE_DIR), so a worker loads a template that any other worker or
+the deploy step already compiled instead of parsing it again. Entries are
+checked against the template source, so an edited template is recompiled
+rather than served stale. Warm the cache once per deploy, after copying the
+new templates and before starting the workers:
+
+    flask compile-templates
+
+It exits non-zero when any template fails to compile, so a broken template
+stops the deploy instead of failing the first request that renders it.
+
+The sidebar and mobile navigation in base.html only change with the user's
+role and the section being viewed, so they are rendered once per
+combination from partials/nav.html and reused (cached_nav). The parts that
+name the logged-in user are still rendered per request.
+
+Compile time per template is recorded with the render times when
+METRICS_ENABLED is set (see modules/metrics.py).
+"""
+import os
+import time
+
+import click
+from flask import current_app, has_app_context, request
+from flask.cli import with_appcontext
+from flask.templating import Environment
+from flask_login import current_user
+from jinja2 import FileSystemBytecodeCache, TemplateSyntaxError
+from markupsafe import Markup
+
+NAV_TEMPLATE = 'partials/nav.html'
+NAV_SECTIONS = ('pos', 'inventory', 'repair', 'employee')
+
+
+class TimedEnvironment(Environment):
+    """Jinja environment that reports how long each template takes to compile"""
+
+    def compile(self, source, name=None, filename=None, raw=False, defer_init=False):
+        started = time.perf_counter()
+        code = super().compile(source, name, filename, raw, defer_init)
+        registry = current_app.extensions.get('metrics') if has_app_context() else None
+        if registry is not None and name:
+            registry.record_template_compile(name, time.perf_counter() - started)
+        return code
+
+
+def init_templating(app):
+    """Install the bytecode cache, cached_nav() and the compile-templates command"""
+    app.jinja_environment = TimedEnvironment
+    if app.config.get('TEMPLATE_BYTECODE_CACHE', True):
+        directory = app.config.get('TEMPLATE_CACHE_DIR')
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Without a directory Jinja uses a private per-user temp directory
+        app.jinja_options = dict(app.jinja_options, bytecode_cache=FileSystemBytecodeCache(directory))
+
+    app.extensions['nav_cache'] = {}
+    app.add_template_global(cached_nav)
+    app.cli.add_command(compile_templates_command)
+
+
+def cached_nav(part):
+    """Markup for one macro of partials/nav.html, rendered once per role and section"""
+    role = current_user.role if current_user.is_authenticated else None
+    active = next((section for section in NAV_SECTIONS if request.endpoint and section in request.endpoint), None)
+
+    cache = current_app.extensions['nav_cache']
+    key = (part, role, active, request.script_root)
+    html = cache.get(key)
+    if html is None:
+        macro = getattr(current_app.jinja_env.get_template(NAV_TEMPLATE).module, part)
+        html = Markup(macro(role=role, active=active))
+        # Templates edited in development are picked up on the next render
+        if not current_app.jinja_env.auto_reload:
+            cache[key] = html
+    return html
+
+
+def compile_all(env):
+    """Compile every template into the bytecode cache; returns (compiled, errors)"""
+    compiled, errors = [], []
+    for name in env.list_templates(extensions=['html']):
+        try:
+            env.get_template(name)
+            compiled.append(name)
+        except TemplateSyntaxError as e:
+            errors.append((name, f'line {e.lineno}: {e.message}'))
+    return compiled, errors
+
+
+@click.command('compile-templates')
+@with_appcontext
+def compile_templates_command():
+    """Precompile all templates into the shared bytecode cache"""
+    env = current_app.jinja_env
+    if env.bytecode_cache is None:
+        raise click.ClickException('TEMPLATE_BYTECODE_CACHE is disabled')
+
+    started = time.perf_counter()
+    compiled, errors = compile_all(env)
+    click.echo(f'Compiled {len(compiled)} template(s) in {time.perf_counter() - started:.2f}s')
+    for name, message in errors:
+        click.echo(f'  {name}: {message}', err=True)
+    if errors:
+        raise click.ClickException(f'{len(errors)} template(s) failed to compile')
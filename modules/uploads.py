@@ -0,0 +1,192 @@
+"""Streamed, content-addressed file uploads for repair jobs.
+
+Request bodies are copied to disk UPLOAD_CHUNK_SIZE bytes at a time while
+being hashed, so a large photo never sits in memory. Files are stored under
+their sha256 (UPLOAD_FOLDER/ab/cd/<hash>), which dedupes identical uploads
+and makes every stored file immutable, so it can be cached forever.
+
+Large files can be sent in several requests with Content-Range headers; the
+parts are assembled in UPLOAD_FOLDER/tmp until the last byte arrives. A part
+whose body is shorter or longer than its range is discarded so the client
+can resend it, and the file is only stored once it is exactly the announced
+size. Parts left behind by abandoned uploads are removed after
+UPLOAD_PART_MAX_AGE seconds.
+
+UPLOAD_FOLDER lives outside static/: files are only served through the
+login-protected attachment view.
+Thumbnails for images are rendered in a process pool after the upload is
+stored, off the request path.
+"""
+import hashlib
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+
+try:
+    from PIL import Image
+except ImportError:  # thumbnails are skipped without Pillow
+    Image = None
+
+CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+UPLOAD_ID = re.compile(r'[0-9a-f]{32}')
+
+_thumbnail_pool = None
+_parts_swept_at = 0.0
+
+
+class UploadError(Exception):
+    """Upload rejected; the message is safe to show to the user"""
+
+
+def upload_root():
+    return os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+
+
+def stored_path(content_hash):
+    return os.path.join(upload_root(), content_hash[:2], content_hash[2:4], content_hash)
+
+
+def thumbnail_path(content_hash):
+    return stored_path(content_hash) + '.thumb.jpg'
+
+
+def receive_upload(stream, content_type, content_range=None, upload_id=None):
+    """Copy a request body (or one part of it) to disk.
+
+    Returns (upload_id, None) while a multi-part upload is still incomplete and
+    (upload_id, (content_hash, size)) once the whole file is stored.
+    """
+    if content_type not in current_app.config.get('ALLOWED_UPLOAD_TYPES', []):
+        raise UploadError(f'File type {content_type} is not allowed')
+
+    tmp_dir = os.path.join(upload_root(), 'tmp')
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    if upload_id is None:
+        upload_id = uuid.uuid4().hex
+        _sweep_stale_parts(tmp_dir)
+    elif not UPLOAD_ID.fullmatch(upload_id):
+        raise UploadError('Invalid upload id')
+    elif not content_range:
+        # Only parts carry an id; a whole body here would overwrite the part file
+        raise UploadError('Content-Range is required with Upload-Id')
+    part_path = os.path.join(tmp_dir, upload_id + '.part')
+
+    if content_range:
+        match = CONTENT_RANGE.fullmatch(content_range.strip())
+        if not match:
+            raise UploadError('Invalid Content-Range')
+        start, end, total = map(int, match.groups())
+        if total > current_app.config['MAX_CONTENT_LENGTH'] or end >= total or start > end:
+            raise UploadError('Invalid Content-Range')
+        received = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if start != received:
+            raise UploadError(f'Expected range starting at {received}')
+        written = _copy_stream(stream, part_path, 'ab')
+        if written != end - start + 1:
+            # Drop the bad part so the client can resend this range
+            with open(part_path, 'ab') as f:
+                f.truncate(start)
+            raise UploadError(f'Expected {end - start + 1} bytes for this range, received {written}')
+        if end + 1 < total:
+            return upload_id, None
+        if os.path.getsize(part_path) != total:
+            os.remove(part_path)
+            raise UploadError('Upload is incomplete, start again')
+        return upload_id, _store(part_path)
+
+    # Single request: hash while copying instead of re-reading the file
+    digest = hashlib.sha256()
+    _copy_stream(stream, part_path, 'wb', digest)
+    return upload_id, _store(part_path, digest)
+
+
+def schedule_thumbnail(content_hash, content_type):
+    """Render a thumbnail in the background for image uploads"""
+    global _thumbnail_pool
+
+    if Image is None or not content_type.startswith('image/') or os.path.exists(thumbnail_path(content_hash)):
+        return
+
+    if _thumbnail_pool is None:
+        _thumbnail_pool = ProcessPoolExecutor(max_workers=current_app.config.get('THUMBNAIL_WORKERS', 2))
+
+    _thumbnail_pool.submit(
+        make_thumbnail,
+        stored_path(content_hash),
+        thumbnail_path(content_hash),
+        tuple(current_app.config.get('THUMBNAIL_SIZE', (320, 320)))
+    )
+
+
+def make_thumbnail(source, destination, size):
+    """Runs in a worker process; writes atomically so readers never see half a file"""
+    with Image.open(source) as image:
+        image.thumbnail(size)
+        tmp = destination + '.tmp'
+        image.convert('RGB').save(tmp, 'JPEG', quality=80)
+        os.replace(tmp, destination)
+
+
+def _copy_stream(stream, path, mode, digest=None):
+    """Append or write the stream to path; returns the number of bytes copied"""
+    chunk_size = current_app.config.get('UPLOAD_CHUNK_SIZE', 64 * 1024)
+    written = 0
+    with open(path, mode) as f:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            f.write(chunk)
+            written += len(chunk)
+            if digest is not None:
+                digest.update(chunk)
+    return written
+
+
+def _sweep_stale_parts(tmp_dir):
+    """Remove parts of abandoned uploads, at most once a minute per process"""
+    global _parts_swept_at
+
+    now = time.time()
+    if now - _parts_swept_at < 60:
+        return
+    _parts_swept_at = now
+
+    cutoff = now - current_app.config.get('UPLOAD_PART_MAX_AGE', 86400)
+    for entry in os.scandir(tmp_dir):
+        try:
+            if entry.name.endswith('.part') and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass  # finished or removed by another worker meanwhile
+
+
+def _store(part_path, digest=None):
+    """Move a finished upload to its content address, returns (hash, size)"""
+    if digest is None:
+        digest = hashlib.sha256()
+        chunk_size = current_app.config.get('UPLOAD_CHUNK_SIZE', 64 * 1024)
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+
+    content_hash = digest.hexdigest()
+    size = os.path.getsize(part_path)
+    destination = stored_path(content_hash)
+
+    if size == 0:
+        os.remove(part_path)
+        raise UploadError('Empty upload')
+
+    if os.path.exists(destination):
+        os.remove(part_path)  # already stored, dedupe
+    else:
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        os.replace(part_path, destination)
+
+    return content_hash, size
@@ -0,0 +1,128 @@
+"""Warranty expiry tracking for repairs and sales.
+
+RepairJob.warranty_expires_at is stamped when a job is completed and
+InvoiceItem.warranty_expires_at when an item is sold, so "is this device
+under warranty" becomes an index range check instead of a Python loop.
+"""
+from datetime import datetime, timedelta
+
+from app import db
+from modules.models import Customer, Invoice, InvoiceItem, RepairJob, StockItem
+
+
+def warranty_end(start, months):
+    """Expiry of a `months` warranty starting at `start` (30-day months)"""
+    if not start or not months:
+        return None
+    return start + timedelta(days=30 * months)
+
+
+def lookup(imei=None, phone=None, invoice_number=None, at=None):
+    """Active repair and sale warranties for a device, customer or invoice"""
+    at = at or datetime.utcnow()
+    repairs = RepairJob.query.filter(RepairJob.warranty_expires_at >= at)
+    sales = db.session.query(InvoiceItem, Invoice, StockItem).join(
+        Invoice, InvoiceItem.invoice_id == Invoice.id
+    ).outerjoin(
+        StockItem, InvoiceItem.stock_item_id == StockItem.id
+    ).filter(InvoiceItem.warranty_expires_at >= at)
+
+    if imei:
+        repairs = repairs.filter(RepairJob.imei == imei)
+        sales = sales.filter(StockItem.imei == imei)
+    elif phone:
+        customer = Customer.query.filter_by(phone=phone).first()
+        repairs = repairs.filter(RepairJob.customer_id == customer.id) if customer else None
+        sales = sales.filter(db.or_(
+            Invoice.customer_phone == phone,
+            Invoice.customer_id == customer.id
+        ) if customer else Invoice.customer_phone == phone)
+    elif invoice_number:
+        repairs = None
+        sales = sales.filter(Invoice.invoice_number == invoice_number)
+    else:
+        return {'under_warranty': False, 'repairs': [], 'sales': []}
+
+    repair_rows = [repair_row(job, at) for job in repairs.order_by(RepairJob.warranty_expires_at.desc())] \
+        if repairs is not None else []
+    sale_rows = [sale_row(item, invoice, stock_item, at) for item, invoice, stock_item in
+                 sales.order_by(InvoiceItem.warranty_expires_at.desc())]
+
+    return {
+        'under_warranty': bool(repair_rows or sale_rows),
+        'repairs': repair_rows,
+        'sales': sale_rows
+    }
+
+
+def expiring_repairs(days, page=1, per_page=20):
+    """Repair warranties ending within the next `days` days, soonest first"""
+    now = datetime.utcnow()
+    return RepairJob.query.filter(
+        RepairJob.warranty_expires_at >= now,
+        RepairJob.warranty_expires_at < now + timedelta(days=days)
+    ).order_by(RepairJob.warranty_expires_at).paginate(page=page, per_page=per_page)
+
+
+def expiring_sales(days, page=1, per_page=20):
+    """Sale warranties ending within the next `days` days, soonest first"""
+    now = datetime.utcnow()
+    return InvoiceItem.query.filter(
+        InvoiceItem.warranty_expires_at >= now,
+        InvoiceItem.warranty_expires_at < now + timedelta(days=days)
+    ).order_by(InvoiceItem.warranty_expires_at).paginate(page=page, per_page=per_page)
+
+
+def repair_row(job, at=None):
+    at = at or datetime.utcnow()
+    return {
+        'job_id': job.id,
+        'job_number': job.job_number,
+        'brand': job.brand,
+        'model': job.model,
+        'imei': job.imei,
+        'warranty_expires_at': job.warranty_expires_at.isoformat(),
+        'days_remaining': max((job.warranty_expires_at - at).days, 0)
+    }
+
+
+def sale_row(item, invoice, stock_item=None, at=None):
+    at = at or datetime.utcnow()
+    return {
+        'invoice_id': invoice.id,
+        'invoice_number': invoice.invoice_number,
+        'product_id': item.product_id,
+        'imei': stock_item.imei if stock_item else None,
+        'warranty_expires_at': item.warranty_expires_at.isoformat(),
+        'days_remaining': max((item.warranty_expires_at - at).days, 0)
+    }
+
+
+def backfill_warranty_expiry(batch_size=1000):
+    """Stamp warranty_expires_at on rows recorded before it existed"""
+    updated = 0
+
+    jobs = db.session.query(RepairJob.id, RepairJob.completed_date, RepairJob.warranty_period).filter(
+        RepairJob.warranty_expires_at.is_(None),
+        RepairJob.warranty_period > 0,
+        RepairJob.completed_date.isnot(None)
+    ).all()
+    for i in range(0, len(jobs), batch_size):
+        rows = [{'id': job_id, 'warranty_expires_at': warranty_end(completed, months)}
+                for job_id, completed, months in jobs[i:i + batch_size]]
+        db.session.execute(db.update(RepairJob), rows)
+        updated += len(rows)
+
+    items = db.session.query(InvoiceItem.id, Invoice.date, InvoiceItem.warranty_period).join(
+        Invoice, InvoiceItem.invoice_id == Invoice.id
+    ).filter(
+        InvoiceItem.warranty_expires_at.is_(None),
+        InvoiceItem.warranty_period > 0
+    ).all()
+    for i in range(0, len(items), batch_size):
+        rows = [{'id': item_id, 'warranty_expires_at': warranty_end(sold, months)}
+                for item_id, sold, months in items[i:i + batch_size]]
+        db.session.execute(db.update(InvoiceItem), rows)
+        updated += len(rows)
+
+    return updated